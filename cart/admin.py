@@ -10,12 +10,13 @@ class CartItemInline(admin.TabularInline):
 
 @admin.register(Cart)
 class CartAdmin(admin.ModelAdmin):
-    list_display = ['id', 'user', 'session_key', 'created_at', 'updated_at', 'get_total_price']
+    list_display = ['id', 'user', 'session_key', 'created_at', 'updated_at', 'item_count', 'subtotal']
     list_filter = ['created_at', 'updated_at']
     search_fields = ['user__username', 'session_key']
+    readonly_fields = ['item_count', 'subtotal']
     inlines = [CartItemInline]
 
-    def get_total_price(self, obj):
-        return obj.get_total_price()
-    get_total_price.short_description = 'Total Price'
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        form.instance.update_summary() # Inline edits change the lines
 
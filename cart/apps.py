@@ -7,4 +7,5 @@ class CartConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'cart'
 
-
+    def ready(self):
+        from . import signals # noqa: F401 Connects the login cart merge
@@ -0,0 +1,13 @@
+# FreshCart/cart/context_processors.py
+# Makes the cart summary available to every template for the navbar badge.
+
+from django.utils.functional import SimpleLazyObject
+from .store import EMPTY_SUMMARY, get_cart
+
+def cart_summary(request):
+    # Lazy, so pages that don't render the badge never touch the cart; the
+    # summary itself is cached by every cart write, so the badge costs no queries
+    def summary():
+        cart = get_cart(request)
+        return cart.summary() if cart is not None else EMPTY_SUMMARY
+    return {'cart_summary': SimpleLazyObject(summary)}
@@ -0,0 +1 @@
+# FreshCart/cart/management/__init__.py
@@ -0,0 +1 @@
+# FreshCart/cart/management/commands/__init__.py
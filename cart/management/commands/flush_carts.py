@@ -0,0 +1,17 @@
+# FreshCart/cart/management/commands/flush_carts.py
+# Write-behind flush of Redis carts to Postgres; run periodically (e.g. every few minutes from cron).
+# Usage: python manage.py flush_carts [--batch-size 500]
+
+from django.core.management.base import BaseCommand
+from cart.store import flush_dirty_carts
+
+class Command(BaseCommand):
+    help = 'Persists every cart changed in Redis since the last flush to the Cart/CartItem tables.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Number of dirty carts taken from Redis at a time.')
+
+    def handle(self, *args, **options):
+        flushed = flush_dirty_carts(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Flushed {flushed} cart(s).'))
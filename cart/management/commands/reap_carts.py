@@ -0,0 +1,24 @@
+# FreshCart/cart/management/commands/reap_carts.py
+# Deletes abandoned anonymous carts; run periodically (e.g. nightly from cron).
+# Usage: python manage.py reap_carts [--retention-days 30] [--batch-size 500] [--pause 0.1]
+
+import datetime
+from django.core.management.base import BaseCommand
+from cart.store import CART_RETENTION, reap_abandoned_carts
+
+class Command(BaseCommand):
+    help = 'Deletes anonymous carts whose session has expired or that have not changed within the retention window.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--retention-days', type=int, default=CART_RETENTION.days,
+                            help='Anonymous carts untouched for this many days are deleted even if their session is alive.')
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Carts checked and deleted per transaction.')
+        parser.add_argument('--pause', type=float, default=0,
+                            help='Seconds to sleep between batches, to go easy on the database at peak times.')
+
+    def handle(self, *args, **options):
+        reaped = reap_abandoned_carts(
+            datetime.timedelta(days=options['retention_days']), options['batch_size'], options['pause'],
+        )
+        self.stdout.write(self.style.SUCCESS(f'Deleted {reaped} abandoned cart(s).'))
@@ -0,0 +1,38 @@
+# Generated by Django 4.2 on 2026-10-18 07:01
+
+from django.db import migrations, models
+from django.db.models import DecimalField, ExpressionWrapper, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def populate_summaries(apps, schema_editor):
+    # Set-based backfill; mirrors Cart.update_summary()
+    Cart = apps.get_model('cart', 'Cart')
+    CartItem = apps.get_model('cart', 'CartItem')
+    items = CartItem.objects.filter(cart=OuterRef('pk')).order_by().values('cart')
+    cost = ExpressionWrapper(F('quantity') * F('product__price'), output_field=DecimalField())
+    Cart.objects.update(
+        item_count=Coalesce(Subquery(items.annotate(n=Sum('quantity')).values('n')), Value(0)),
+        subtotal=Coalesce(Subquery(items.annotate(total=Sum(cost)).values('total')), Value(0), output_field=DecimalField()),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cart', '0002_cart_session_key_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cart',
+            name='item_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='cart',
+            name='subtotal',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.RunPython(populate_summaries, migrations.RunPython.noop),
+    ]
@@ -2,22 +2,41 @@
 # Defines the Cart and CartItem models.
 
 from django.db import models
+from django.db.models import DecimalField, ExpressionWrapper, F, Sum
 from products.models import Product
 from django.conf import settings
 
 class Cart(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, null=True, blank=True)
-    session_key = models.CharField(max_length=40, null=True, blank=True) # For anonymous users
+    session_key = models.CharField(max_length=40, null=True, blank=True, db_index=True) # For anonymous users
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Denormalized summary, kept up to date by the write paths in cart/store.py
+    item_count = models.PositiveIntegerField(default=0)
+    subtotal = models.DecimalField(max_digits=12, decimal_places=2, default=0)
 
     def __str__(self):
         if self.user:
             return f"Cart for {self.user.username}"
         return f"Cart for session {self.session_key[:5]}..."
 
+    def lines(self):
+        # All items with their products in one query, memoized for the template
+        if not hasattr(self, '_lines'):
+            self._lines = list(self.items.select_related('product').order_by('product__name', 'product_id'))
+        return self._lines
+
     def get_total_price(self):
-        return sum(item.get_cost() for item in self.items.all())
+        return sum(item.get_cost() for item in self.lines())
+
+    def update_summary(self):
+        # Recomputes item_count/subtotal from the rows (after set-based writes)
+        totals = self.items.aggregate(
+            count=Sum('quantity'),
+            subtotal=Sum(ExpressionWrapper(F('quantity') * F('product__price'), output_field=DecimalField())),
+        )
+        self.item_count, self.subtotal = totals['count'] or 0, totals['subtotal'] or 0
+        Cart.objects.filter(pk=self.pk).update(item_count=self.item_count, subtotal=self.subtotal)
 
 class CartItem(models.Model):
     cart = models.ForeignKey(Cart, related_name='items', on_delete=models.CASCADE)
@@ -0,0 +1,11 @@
+# FreshCart/cart/signals.py
+# Merges an anonymous visitor's cart into their account cart when they log in.
+
+from django.contrib.auth.signals import user_logged_in
+from django.dispatch import receiver
+from .store import merge_session_cart
+
+@receiver(user_logged_in)
+def merge_cart_on_login(sender, request, user, **kwargs):
+    if request is not None: # Only sent without a request by code calling the signal directly
+        merge_session_cart(request, user)
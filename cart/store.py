@@ -0,0 +1,484 @@
+# FreshCart/cart/store.py
+# Redis-backed cart storage with write-behind persistence.
+# Cart lines live in one Redis hash per cart ({product_id: quantity}), so
+# browsing-phase cart traffic never writes to Postgres. The Cart/CartItem
+# tables are only written at checkout, at the login merge and by the periodic
+# `manage.py flush_carts`.
+
+import datetime
+import logging
+import time
+from collections import namedtuple
+from decimal import Decimal
+from importlib import import_module
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache, caches
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+from products.models import Product
+from .models import Cart, CartItem
+
+logger = logging.getLogger(__name__)
+
+CART_TTL = 60 * 60 * 24 * 30 # Idle carts expire from Redis; flushed lines stay in Postgres
+CART_SESSION_KEY = 'cart_key' # Survives the session key change at login
+KEY_PREFIX = 'cart'
+DIRTY_KEY = f'{KEY_PREFIX}:dirty' # Carts changed since they were last flushed
+LOADED_FIELD = '_' # Marks a hash as loaded, so an empty cart isn't re-read from Postgres
+CART_RETENTION = datetime.timedelta(days=30) # Anonymous carts untouched this long are reaped
+
+CartSummary = namedtuple('CartSummary', ['item_count', 'subtotal']) # What the navbar badge shows
+EMPTY_SUMMARY = CartSummary(0, Decimal('0.00'))
+CART_OPS = ('add', 'set', 'remove') # Batch change operations, see StoredCart.apply
+
+def apply_changes(lines, changes):
+    # Returns a copy of {product_id: quantity} with (op, product_id, quantity) changes applied
+    lines = dict(lines)
+    for op, product_id, quantity in changes:
+        if op == 'add':
+            lines[product_id] = lines.get(product_id, 0) + quantity
+        elif op == 'set' and quantity > 0:
+            lines[product_id] = quantity
+        else:
+            lines.pop(product_id, None)
+    return lines
+
+class RedisHashBackend:
+    # Native hash commands through django-redis: every change is a single atomic command
+    def __init__(self, client):
+        self.client = client
+
+    def lines(self, key):
+        raw = self.client.hgetall(key)
+        if not raw:
+            return None
+        return {int(field): int(value) for field, value in raw.items() if field.decode() != LOADED_FIELD}
+
+    def replace(self, key, lines):
+        pipe = self.client.pipeline()
+        pipe.delete(key)
+        pipe.hset(key, mapping={LOADED_FIELD: 1, **lines})
+        pipe.expire(key, CART_TTL)
+        pipe.execute()
+
+    def incr(self, key, product_id, quantity):
+        pipe = self.client.pipeline()
+        pipe.hincrby(key, product_id, quantity)
+        pipe.expire(key, CART_TTL)
+        return pipe.execute()[0]
+
+    def set(self, key, product_id, quantity):
+        pipe = self.client.pipeline()
+        pipe.hset(key, product_id, quantity)
+        pipe.expire(key, CART_TTL)
+        pipe.execute()
+
+    def remove(self, key, product_id):
+        return bool(self.client.hdel(key, product_id))
+
+    def apply(self, key, changes):
+        pipe = self.client.pipeline() # MULTI/EXEC: the whole batch lands in one round trip
+        for op, product_id, quantity in changes:
+            if op == 'add':
+                pipe.hincrby(key, product_id, quantity)
+            elif op == 'set' and quantity > 0:
+                pipe.hset(key, product_id, quantity)
+            else:
+                pipe.hdel(key, product_id)
+        pipe.expire(key, CART_TTL)
+        pipe.execute()
+
+    def delete(self, key):
+        self.client.delete(key)
+
+    def mark_dirty(self, owner):
+        self.client.sadd(DIRTY_KEY, owner)
+
+    def pop_dirty(self, count):
+        return [owner.decode() for owner in self.client.spop(DIRTY_KEY, count) or []]
+
+    def clear_dirty(self, owners):
+        if owners:
+            self.client.srem(DIRTY_KEY, *owners)
+
+class CacheBackend:
+    # Same operations on top of any Django cache (local development and tests).
+    # Read-modify-write, so unlike Redis hashes it is not safe under concurrency.
+    def __init__(self, cache):
+        self.cache = cache
+
+    def lines(self, key):
+        return self.cache.get(key)
+
+    def replace(self, key, lines):
+        self.cache.set(key, dict(lines), CART_TTL)
+
+    def incr(self, key, product_id, quantity):
+        lines = self.cache.get(key) or {}
+        lines[product_id] = lines.get(product_id, 0) + quantity
+        self.replace(key, lines)
+        return lines[product_id]
+
+    def set(self, key, product_id, quantity):
+        lines = self.cache.get(key) or {}
+        lines[product_id] = quantity
+        self.replace(key, lines)
+
+    def remove(self, key, product_id):
+        lines = self.cache.get(key) or {}
+        removed = lines.pop(product_id, None) is not None
+        self.replace(key, lines)
+        return removed
+
+    def apply(self, key, changes):
+        self.replace(key, apply_changes(self.cache.get(key) or {}, changes))
+
+    def delete(self, key):
+        self.cache.delete(key)
+
+    def mark_dirty(self, owner):
+        self.cache.set(DIRTY_KEY, self.cache.get(DIRTY_KEY, set()) | {owner}, None)
+
+    def pop_dirty(self, count):
+        dirty = self.cache.get(DIRTY_KEY, set())
+        popped = set(list(dirty)[:count])
+        self.cache.set(DIRTY_KEY, dirty - popped, None)
+        return list(popped)
+
+    def clear_dirty(self, owners):
+        self.cache.set(DIRTY_KEY, self.cache.get(DIRTY_KEY, set()) - set(owners), None)
+
+def get_backend():
+    try:
+        from django_redis import get_redis_connection
+        return RedisHashBackend(get_redis_connection('default'))
+    except NotImplementedError: # The default cache is not django-redis
+        return CacheBackend(cache)
+
+class CartLine:
+    # Read-only stand-in for CartItem
+    def __init__(self, product, quantity):
+        self.product = product
+        self.product_id = product.id
+        self.quantity = quantity
+
+    def __str__(self):
+        return f"{self.quantity} x {self.product.name}"
+
+    def get_cost(self):
+        return self.product.price * self.quantity
+
+class CartLines:
+    # Mimics the Cart.items manager API used by views and templates
+    def __init__(self, cart):
+        self.cart = cart
+
+    def all(self):
+        return self.cart.lines()
+
+    def count(self):
+        return len(self.cart.quantities())
+
+    def exists(self):
+        return bool(self.cart.quantities())
+
+    def __iter__(self):
+        return iter(self.all())
+
+class StoredCart:
+    """
+    A cart whose lines live in Redis. `owner` is 'u:<user id>' for signed-in
+    users and 's:<token>' for anonymous sessions, where the token is the
+    session key the cart was started under (Cart.session_key once persisted).
+    """
+    def __init__(self, owner, backend=None):
+        self.owner = owner
+        self.backend = backend or get_backend()
+        self.key = f'{KEY_PREFIX}:{owner}'
+        self.summary_key = f'{self.key}:summary' # Plain cache entry next to the hash
+        self.items = CartLines(self)
+        self._quantities = None
+        self._lines = None
+
+    @classmethod
+    def for_user(cls, user, backend=None):
+        return cls(f'u:{user.pk}', backend)
+
+    @classmethod
+    def for_session(cls, token, backend=None):
+        return cls(f's:{token}', backend)
+
+    @property
+    def user_id(self):
+        kind, _, value = self.owner.partition(':')
+        return int(value) if kind == 'u' else None
+
+    @property
+    def session_key(self):
+        kind, _, value = self.owner.partition(':')
+        return value if kind == 's' else None
+
+    def _db_filter(self):
+        if self.user_id is not None:
+            return {'user_id': self.user_id}
+        return {'session_key': self.session_key, 'user__isnull': True}
+
+    def db_carts(self):
+        # The persisted Cart, as a queryset (empty until the first flush)
+        return Cart.objects.filter(**self._db_filter())
+
+    def quantities(self):
+        # {product_id: quantity}; read from Postgres only when Redis has no copy
+        if self._quantities is None:
+            lines = self.backend.lines(self.key)
+            if lines is None:
+                lines = dict(
+                    CartItem.objects.filter(**{f'cart__{k}': v for k, v in self._db_filter().items()})
+                    .values_list('product_id', 'quantity')
+                )
+                self.backend.replace(self.key, lines)
+            self._quantities = lines
+        return self._quantities
+
+    def lines(self):
+        if self._lines is None:
+            quantities = self.quantities()
+            products = Product.objects.in_bulk(quantities)
+            self._lines = [
+                CartLine(product, quantities[product.id])
+                for product in sorted(products.values(), key=lambda p: (p.name, p.id))
+            ]
+        return self._lines
+
+    def get_total_price(self):
+        return sum(line.get_cost() for line in self.lines())
+
+    def _store_summary(self, prices=None):
+        quantities = self.quantities()
+        if prices is None:
+            prices = dict(Product.objects.filter(id__in=quantities).values_list('id', 'price'))
+        summary = CartSummary(
+            sum(qty for pid, qty in quantities.items() if pid in prices),
+            sum((prices[pid] * qty for pid, qty in quantities.items() if pid in prices), Decimal('0.00')),
+        )
+        cache.set(self.summary_key, summary, CART_TTL)
+        return summary
+
+    def summary(self):
+        # Written on every cart change, so reading it costs no queries
+        summary = cache.get(self.summary_key)
+        return summary if summary is not None else self._store_summary()
+
+    def _changed(self, prices=None):
+        self._quantities = self._lines = None
+        self.backend.mark_dirty(self.owner)
+        self._store_summary(prices)
+
+    def add(self, product_id, quantity):
+        if quantity < 1:
+            raise ValueError(f'Cannot add a quantity of {quantity}.')
+        self.quantities() # Make sure lines flushed earlier are loaded before changing them
+        quantity = self.backend.incr(self.key, product_id, quantity)
+        self._changed()
+        return quantity
+
+    def set(self, product_id, quantity):
+        self.quantities()
+        if quantity > 0:
+            self.backend.set(self.key, product_id, quantity)
+        else:
+            self.backend.remove(self.key, product_id)
+        self._changed()
+
+    def remove(self, product_id):
+        if product_id not in self.quantities():
+            return False
+        self.backend.remove(self.key, product_id)
+        self._changed()
+        return True
+
+    def apply(self, changes, prices=None):
+        """
+        Applies a batch of (op, product_id, quantity) changes at once, where op
+        is one of CART_OPS ('set' with quantity 0 removes the line). `prices`
+        ({product_id: price} for every product in the cart afterwards) saves
+        the summary its own query.
+        """
+        self.quantities()
+        self.backend.apply(self.key, changes)
+        self._changed(prices)
+
+    def clear(self):
+        self.backend.replace(self.key, {})
+        self._changed()
+
+    def discard(self):
+        # Drops the Redis copy entirely (the Postgres rows are left alone)
+        self.backend.delete(self.key)
+        cache.delete(self.summary_key)
+        self._quantities = self._lines = None
+
+    @transaction.atomic
+    def persist(self):
+        """
+        Writes the Redis lines and their summary to Cart/CartItem and returns
+        the Cart. Lines for products deleted in the meantime are skipped.
+        """
+        quantities = self.quantities()
+        cart, _ = Cart.objects.get_or_create(**self._db_filter())
+        prices = dict(Product.objects.filter(id__in=quantities).values_list('id', 'price'))
+        cart.items.exclude(product_id__in=prices).delete()
+        CartItem.objects.bulk_create(
+            [CartItem(cart=cart, product_id=pid, quantity=qty) for pid, qty in quantities.items() if pid in prices],
+            update_conflicts=True, unique_fields=['cart', 'product'], update_fields=['quantity'],
+        )
+        cart.item_count, cart.subtotal = self._store_summary(prices)
+        Cart.objects.filter(pk=cart.pk).update(
+            updated_at=timezone.now(), item_count=cart.item_count, subtotal=cart.subtotal,
+        )
+        return cart
+
+def get_cart(request, create=False):
+    """
+    Returns the request's StoredCart. Anonymous visitors only get a session
+    (and a cart token) when `create` is true, i.e. when they add something.
+    """
+    if request.user.is_authenticated:
+        return StoredCart.for_user(request.user)
+    token = request.session.get(CART_SESSION_KEY)
+    if token is None:
+        if not create:
+            return None
+        if not request.session.session_key:
+            request.session.create()
+        token = request.session[CART_SESSION_KEY] = request.session.session_key
+    return StoredCart.for_session(token)
+
+def _merge_lines(cart, quantities):
+    # One set-based upsert: new products are inserted, products already in the
+    # cart have their quantities summed on the (cart, product) unique key
+    table = CartItem._meta.db_table
+    rows = [(cart.pk, product_id, quantity) for product_id, quantity in quantities.items()]
+    values = ', '.join(['(%s, %s, %s)'] * len(rows))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""INSERT INTO {table} (cart_id, product_id, quantity) VALUES {values}
+                ON CONFLICT (cart_id, product_id) DO UPDATE SET quantity = {table}.quantity + EXCLUDED.quantity""",
+            [value for row in rows for value in row],
+        )
+
+def merge_session_cart(request, user):
+    """
+    Folds the anonymous cart into the user's cart once, at login, in a single
+    transaction, then deletes the anonymous cart. Both Redis copies are dropped
+    afterwards so the next cart request reloads the merged lines with one
+    indexed lookup.
+    """
+    token = request.session.pop(CART_SESSION_KEY, None)
+    if token is None:
+        return None
+    anonymous = StoredCart.for_session(token)
+    user_cart = StoredCart.for_user(user, anonymous.backend)
+    quantities = anonymous.quantities()
+    with transaction.atomic():
+        cart = user_cart.persist() # Write through changes not flushed yet, so none are lost
+        existing = set(Product.objects.filter(id__in=quantities).values_list('id', flat=True))
+        lines = {product_id: quantity for product_id, quantity in quantities.items() if product_id in existing}
+        if lines:
+            _merge_lines(cart, lines)
+            cart.update_summary()
+        Cart.objects.filter(session_key=token, user__isnull=True).delete()
+    anonymous.discard()
+    user_cart.discard()
+    cache.set(user_cart.summary_key, CartSummary(cart.item_count, cart.subtotal), CART_TTL)
+    return cart
+
+def flush_dirty_carts(batch_size=500):
+    # Periodic write-behind: persists every cart changed since the last flush
+    backend = get_backend()
+    flushed = 0
+    while owners := backend.pop_dirty(batch_size):
+        for owner in owners:
+            cart = StoredCart(owner, backend)
+            try:
+                cart.persist()
+            except IntegrityError:
+                if cart.user_id is not None and not get_user_model().objects.filter(pk=cart.user_id).exists():
+                    cart.discard() # The user was deleted after changing the cart
+                else: # Kept in Redis; flushed again with its next change or at checkout
+                    logger.exception('Could not flush cart %s', owner)
+                continue
+            flushed += 1
+    return flushed
+
+def _live_sessions(session_keys):
+    """
+    The subset of session_keys whose session still exists, or None when that
+    can't be told: with IGNORE_EXCEPTIONS the cache answers every lookup with
+    a miss while Redis is down, which would make every session look dead.
+    """
+    if not session_keys:
+        return set()
+    if settings.SESSION_ENGINE == 'django.contrib.sessions.backends.cache':
+        from django_redis import get_redis_connection
+        from redis.exceptions import RedisError
+        prefix = import_module(settings.SESSION_ENGINE).SessionStore.cache_key_prefix
+        session_cache = caches[settings.SESSION_CACHE_ALIAS]
+        try:
+            client = get_redis_connection(settings.SESSION_CACHE_ALIAS)
+        except NotImplementedError: # Not django-redis; errors are not swallowed
+            found = session_cache.get_many([prefix + key for key in session_keys])
+            return {key for key in session_keys if prefix + key in found}
+        try:
+            # One MGET on the raw client, which raises instead of reporting misses
+            values = client.mget([session_cache.make_key(prefix + key) for key in session_keys])
+        except RedisError as e:
+            logger.warning('Session liveness unknown (%s); reaping carts by retention only', e)
+            return None
+        return {key for key, value in zip(session_keys, values) if value is not None}
+    store = import_module(settings.SESSION_ENGINE).SessionStore()
+    return {key for key in session_keys if store.exists(key)}
+
+def _discard_reaped(session_keys):
+    # Drops reaped carts' Redis copies and dirty marks, so that no later flush
+    # writes them back to Postgres
+    from redis.exceptions import RedisError
+    backend = get_backend()
+    carts = [StoredCart.for_session(key, backend) for key in session_keys]
+    try:
+        backend.clear_dirty([cart.owner for cart in carts])
+        for cart in carts:
+            cart.discard()
+    except RedisError as e:
+        logger.warning('Could not drop the Redis copies of %s reaped cart(s) (%s)', len(carts), e)
+
+def reap_abandoned_carts(retention=CART_RETENTION, batch_size=500, pause=0):
+    """
+    Deletes anonymous carts (and their items) whose session has expired or
+    that haven't changed within `retention`. Carts are walked by primary key
+    `batch_size` at a time and each batch is deleted in its own short
+    transaction, sleeping `pause` seconds in between, so no lock is held for
+    long. If Redis can't be asked which sessions are alive, only carts past
+    `retention` are deleted. Returns the number of carts deleted.
+    """
+    cutoff = timezone.now() - retention
+    last_pk, reaped = 0, 0
+    while batch := list(
+        Cart.objects.filter(user__isnull=True, pk__gt=last_pk).order_by('pk')
+        .values_list('pk', 'session_key', 'updated_at')[:batch_size]
+    ):
+        last_pk = batch[-1][0]
+        live = _live_sessions([key for _, key, _ in batch if key])
+        doomed = {
+            pk: key for pk, key, updated_at in batch
+            if updated_at < cutoff or (live is not None and key not in live)
+        }
+        if doomed:
+            # CartItem rows go with them in one DELETE ... WHERE cart_id IN (...)
+            Cart.objects.filter(pk__in=doomed, user__isnull=True).delete()
+            _discard_reaped([key for key in doomed.values() if key])
+            reaped += len(doomed)
+            if pause:
+                time.sleep(pause)
+    return reaped
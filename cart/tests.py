@@ -1,14 +1,27 @@
 # FreshCart/cart/tests.py
 # Example tests for the cart app.
 
+import datetime
+from io import StringIO
+from unittest.mock import MagicMock, patch
+from redis.exceptions import ConnectionError as RedisConnectionError
+from django.contrib.sessions.backends.cache import SessionStore
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
 from django.test import TestCase, Client
 from django.urls import reverse
+from django.utils import timezone
 from products.models import Product, Category
 from django.contrib.auth import get_user_model
 from .models import Cart, CartItem
+from .store import CART_SESSION_KEY, StoredCart, flush_dirty_carts, reap_abandoned_carts
 
 User = get_user_model()
 
+def get_cart_for(client):
+    return StoredCart.for_session(client.session[CART_SESSION_KEY])
+
 class CartModelTest(TestCase):
     def setUp(self):
         self.user = User.objects.create_user(username='testuser', email='test@example.com', password='testpassword')
@@ -40,8 +53,20 @@ class CartModelTest(TestCase):
         CartItem.objects.create(cart=cart, product=self.product2, quantity=3) # 150
         self.assertEqual(cart.get_total_price(), 350.00)
 
+    def test_cart_update_summary(self):
+        cart = Cart.objects.create(user=self.user)
+        CartItem.objects.create(cart=cart, product=self.product1, quantity=2)
+        CartItem.objects.create(cart=cart, product=self.product2, quantity=3)
+        cart.update_summary()
+        cart.refresh_from_db()
+        self.assertEqual((cart.item_count, cart.subtotal), (5, 350))
+        with self.assertNumQueries(1): # Lines and their products together
+            self.assertEqual([item.product.name for item in cart.lines()], ['Apple', 'Orange'])
+            self.assertEqual(cart.get_total_price(), 350)
+
 class CartViewTest(TestCase):
     def setUp(self):
+        cache.clear() # Cart lines live in the cache until flushed
         self.client = Client()
         self.user = User.objects.create_user(username='testuser', email='test@example.com', password='testpassword')
         self.category = Category.objects.create(name='Fruits', slug='fruits')
@@ -51,7 +76,8 @@ class CartViewTest(TestCase):
     def test_add_to_cart_anonymous(self):
         response = self.client.post(reverse('cart:add_to_cart', args=[self.product1.id]), {'quantity': 1})
         self.assertEqual(response.status_code, 302) # Redirects to cart detail
-        self.assertTrue(Cart.objects.exists())
+        self.assertFalse(Cart.objects.exists()) # Write-behind: nothing in Postgres yet
+        flush_dirty_carts()
         cart = Cart.objects.get(session_key=self.client.session.session_key)
         self.assertEqual(cart.items.count(), 1)
         self.assertEqual(cart.items.first().product, self.product1)
@@ -61,6 +87,7 @@ class CartViewTest(TestCase):
         self.client.login(username='testuser', password='testpassword')
         response = self.client.post(reverse('cart:add_to_cart', args=[self.product1.id]), {'quantity': 2})
         self.assertEqual(response.status_code, 302)
+        flush_dirty_carts()
         cart = Cart.objects.get(user=self.user)
         self.assertEqual(cart.items.count(), 1)
         self.assertEqual(cart.items.first().product, self.product1)
@@ -70,6 +97,7 @@ class CartViewTest(TestCase):
         self.client.login(username='testuser', password='testpassword')
         self.client.post(reverse('cart:add_to_cart', args=[self.product1.id]), {'quantity': 1})
         self.client.post(reverse('cart:add_to_cart', args=[self.product1.id]), {'quantity': 1}) # Add again
+        flush_dirty_carts()
         cart = Cart.objects.get(user=self.user)
         self.assertEqual(cart.items.count(), 1) # Still one item
         self.assertEqual(cart.items.first().quantity, 2) # Quantity updated
@@ -94,11 +122,13 @@ class CartViewTest(TestCase):
     def test_remove_from_cart(self):
         self.client.login(username='testuser', password='testpassword')
         self.client.post(reverse('cart:add_to_cart', args=[self.product1.id]), {'quantity': 1})
+        flush_dirty_carts()
         cart = Cart.objects.get(user=self.user)
         self.assertEqual(cart.items.count(), 1)
 
         response = self.client.post(reverse('cart:remove_from_cart', args=[self.product1.id]))
         self.assertEqual(response.status_code, 302) # Redirects
+        flush_dirty_carts()
         cart.refresh_from_db() # Refresh cart instance
         self.assertEqual(cart.items.count(), 0)
 
@@ -112,4 +142,218 @@ class CartViewTest(TestCase):
         messages = list(response.wsgi_request._messages)
         self.assertEqual(str(messages[0]), "Not enough stock for Apple. Available: 0")
 
+    def test_add_to_cart_checks_the_whole_line(self):
+        url = reverse('cart:add_to_cart', args=[self.product1.id])
+        self.client.post(url, {'quantity': 8})
+        response = self.client.post(url, {'quantity': 3}) # 11 of 10
+        self.assertEqual(str(list(response.wsgi_request._messages)[-1]), "Not enough stock for Apple. Available: 10")
+        self.assertEqual(get_cart_for(self.client).quantities(), {self.product1.id: 8})
+
+    def test_add_to_cart_rejects_bad_quantities(self):
+        url = reverse('cart:add_to_cart', args=[self.product1.id])
+        for quantity in ('0', '-2', 'two', ''):
+            response = self.client.post(url, {'quantity': quantity})
+            self.assertRedirects(response, reverse('products:product_detail', args=[self.product1.id, 'apple']),
+                                 fetch_redirect_response=False)
+            self.assertEqual(str(list(response.wsgi_request._messages)[-1]), "Please enter a quantity of at least 1.")
+        self.assertNotIn(CART_SESSION_KEY, self.client.session) # Nothing was created
+        response = self.client.post(reverse('cart:update_cart_item', args=[self.product1.id]), {'quantity': 'x'})
+        self.assertEqual(response.status_code, 404) # Still checked for a cart line first
+        with self.assertRaises(ValueError):
+            StoredCart.for_session('somesession').add(self.product1.id, -1)
+
+    def test_update_cart_item_sets_quantity(self):
+        self.client.post(reverse('cart:add_to_cart', args=[self.product1.id]), {'quantity': 2})
+        self.client.post(reverse('cart:update_cart_item', args=[self.product1.id]), {'quantity': 5})
+        cart = get_cart_for(self.client)
+        self.assertEqual(cart.quantities(), {self.product1.id: 5})
+        self.client.post(reverse('cart:update_cart_item', args=[self.product1.id]), {'quantity': 0})
+        self.assertEqual(get_cart_for(self.client).quantities(), {})
+        self.client.post(reverse('cart:add_to_cart', args=[self.product1.id]), {'quantity': 2})
+        self.client.post(reverse('cart:update_cart_item', args=[self.product1.id]), {'quantity': '-1'})
+        self.assertEqual(get_cart_for(self.client).quantities(), {self.product1.id: 2}) # Refused
+        response = self.client.post(reverse('cart:update_cart_item', args=[self.product2.id]), {'quantity': 1})
+        self.assertEqual(response.status_code, 404) # Not in the cart
+
+    def _update_cart(self, *lines):
+        return self.client.post(reverse('cart:update_cart'), {'lines': list(lines)}, content_type='application/json')
+
+    def test_update_cart_batch(self):
+        self.client.post(reverse('cart:add_to_cart', args=[self.product1.id]), {'quantity': 1})
+        with self.assertNumQueries(2): # Products for the checks and the summary together, stock holds
+            response = self._update_cart(
+                {'product_id': self.product1.id, 'quantity': 2}, # add
+                {'product_id': self.product2.id, 'quantity': 4, 'op': 'set'},
+            )
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual((data['item_count'], data['subtotal']), (7, '500.00'))
+        self.assertEqual(sorted((line['product_id'], line['quantity'], line['cost']) for line in data['lines']),
+                         [(self.product1.id, 3, '300.00'), (self.product2.id, 4, '200.00')])
+
+        data = self._update_cart({'product_id': self.product1.id, 'op': 'remove'}).json()
+        self.assertEqual((data['item_count'], data['subtotal']), (4, '200.00'))
+        self.assertEqual(get_cart_for(self.client).quantities(), {self.product2.id: 4})
+
+    def test_update_cart_rejects_whole_batch(self):
+        self.client.post(reverse('cart:add_to_cart', args=[self.product1.id]), {'quantity': 1})
+        response = self._update_cart(
+            {'product_id': self.product1.id, 'quantity': 3, 'op': 'set'},
+            {'product_id': self.product2.id, 'quantity': 21},
+            {'product_id': 999999, 'quantity': 1},
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['errors'], [
+            {'product_id': self.product2.id, 'error': "Not enough stock for Orange. Available: 20"},
+            {'product_id': 999999, 'error': "Product is not available."},
+        ])
+        self.assertEqual(get_cart_for(self.client).quantities(), {self.product1.id: 1})
+
+    def test_update_cart_invalid_payload(self):
+        for body in ('not json', '{"lines": []}', '{"lines": [{"product_id": "x"}]}',
+                     '{"lines": [{"product_id": 1, "op": "double"}]}', '{"lines": [{"product_id": 1, "quantity": -1}]}'):
+            response = self.client.post(reverse('cart:update_cart'), body, content_type='application/json')
+            self.assertEqual(response.status_code, 400, body)
+            self.assertIn('error', response.json())
+        self.assertNotIn(CART_SESSION_KEY, self.client.session) # Nothing was created
+
+class CartStoreTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.category = Category.objects.create(name='Fruits', slug='fruits')
+        self.apple = Product.objects.create(category=self.category, name='Apple', slug='apple', price=100, stock=10)
+        self.orange = Product.objects.create(category=self.category, name='Orange', slug='orange', price=50, stock=20)
+
+    def test_browsing_never_writes_to_postgres(self):
+        self.client.post(reverse('cart:add_to_cart', args=[self.apple.id]), {'quantity': 2})
+        with self.assertNumQueries(3): # The product, its stock holds and prices for the cart summary
+            self.client.post(reverse('cart:add_to_cart', args=[self.orange.id]), {'quantity': 1})
+        with self.assertNumQueries(1): # Products for the rendered lines; the badge is cached
+            response = self.client.get(reverse('cart:cart_detail'))
+        self.assertContains(response, 'title="Subtotal ₹250.00">3</span>', html=False)
+        self.assertEqual([(line.product, line.quantity) for line in response.context['cart'].items.all()],
+                         [(self.apple, 2), (self.orange, 1)])
+        self.assertEqual(response.context['cart'].get_total_price(), 250)
+        self.assertFalse(CartItem.objects.exists())
+
+    def test_empty_cart_page_creates_nothing(self):
+        response = self.client.get(reverse('cart:cart_detail'))
+        self.assertIsNone(response.context['cart'])
+        self.assertContains(response, 'Your cart is empty.')
+
+    def test_flushed_cart_reloads_from_postgres(self):
+        cart = StoredCart.for_user(self.user)
+        cart.add(self.apple.id, 3)
+        self.assertEqual(flush_dirty_carts(), 1)
+        self.assertEqual(flush_dirty_carts(), 0) # Nothing changed since
+        cache.clear() # e.g. Redis eviction or restart
+        self.assertEqual(StoredCart.for_user(self.user).quantities(), {self.apple.id: 3})
+
+    def test_login_merges_anonymous_cart(self):
+        StoredCart.for_user(self.user).add(self.apple.id, 1)
+        self.client.post(reverse('cart:add_to_cart', args=[self.apple.id]), {'quantity': 2})
+        self.client.post(reverse('cart:add_to_cart', args=[self.orange.id]), {'quantity': 1})
+        token = self.client.session[CART_SESSION_KEY]
+        flush_dirty_carts()
+        self.client.login(username='testuser', password='testpassword')
+
+        self.assertNotIn(CART_SESSION_KEY, self.client.session)
+        self.assertFalse(Cart.objects.filter(session_key=token).exists())
+        cart = Cart.objects.get(user=self.user)
+        self.assertEqual(dict(cart.items.values_list('product_id', 'quantity')), {self.apple.id: 3, self.orange.id: 1})
+        self.assertEqual(StoredCart.for_user(self.user).quantities(), {self.apple.id: 3, self.orange.id: 1})
+
+    def test_login_merge_keeps_unflushed_lines(self):
+        StoredCart.for_user(self.user).add(self.orange.id, 4) # Never flushed
+        self.client.post(reverse('cart:add_to_cart', args=[self.orange.id]), {'quantity': 1})
+        self.client.login(username='testuser', password='testpassword')
+        cart = Cart.objects.get(user=self.user)
+        self.assertEqual(dict(cart.items.values_list('product_id', 'quantity')), {self.orange.id: 5})
+        self.assertEqual(Cart.objects.count(), 1)
+
+    def test_cart_requests_after_login(self):
+        self.client.post(reverse('cart:add_to_cart', args=[self.apple.id]), {'quantity': 1})
+        self.client.login(username='testuser', password='testpassword')
+        with self.assertNumQueries(3): # User, one indexed cart lookup, products
+            self.client.get(reverse('cart:cart_detail'))
+        with self.assertNumQueries(2): # Lines now come from Redis
+            self.client.get(reverse('cart:cart_detail'))
+
+    def test_summary_follows_cart_writes(self):
+        cart = StoredCart.for_user(self.user)
+        self.assertEqual(cart.summary(), (0, 0))
+        cart.add(self.apple.id, 2)
+        cart.add(self.orange.id, 1)
+        self.assertEqual(cart.summary(), (3, 250))
+        cart.set(self.apple.id, 1)
+        self.assertEqual(cart.summary(), (2, 150))
+        cart.remove(self.orange.id)
+        with self.assertNumQueries(0):
+            self.assertEqual(StoredCart.for_user(self.user).summary(), (1, 100))
+
+        db_cart = cart.persist()
+        db_cart.refresh_from_db()
+        self.assertEqual((db_cart.item_count, db_cart.subtotal), (1, 100))
+        cart.clear()
+        self.assertEqual(cart.summary(), (0, 0))
+
+    def test_navbar_badge_without_cart(self):
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('cart:cart_detail'))
+        self.assertContains(response, 'title="Subtotal ₹0.00">0</span>', html=False)
+
+    def test_login_merge_updates_summary(self):
+        StoredCart.for_user(self.user).add(self.apple.id, 1)
+        self.client.post(reverse('cart:add_to_cart', args=[self.orange.id]), {'quantity': 2})
+        self.client.login(username='testuser', password='testpassword')
+        cart = Cart.objects.get(user=self.user)
+        self.assertEqual((cart.item_count, cart.subtotal), (3, 200))
+        self.assertEqual(StoredCart.for_user(self.user).summary(), (3, 200))
+
+    def test_flush_keeps_carts_it_cannot_write(self):
+        cart = StoredCart.for_user(self.user)
+        cart.add(self.apple.id, 2)
+        cart.backend.set(cart.key, self.orange.id, -1) # Not a valid CartItem quantity
+        with self.assertLogs('cart.store', 'ERROR'):
+            self.assertEqual(flush_dirty_carts(), 0)
+        self.assertEqual(StoredCart.for_user(self.user).quantities(), {self.apple.id: 2, self.orange.id: -1})
+
+        gone = User.objects.create_user(username='gone', password='testpassword')
+        StoredCart.for_user(gone).add(self.apple.id, 1)
+        gone.delete()
+        with connection.cursor() as cursor:
+            cursor.execute('SET CONSTRAINTS ALL IMMEDIATE') # As at commit, outside a test's transaction
+        self.assertEqual(flush_dirty_carts(), 0)
+        self.assertIsNone(StoredCart.for_user(gone).backend.lines(StoredCart.for_user(gone).key)) # Discarded
+
+    def test_reaper_deletes_abandoned_anonymous_carts(self):
+        self.client.post(reverse('cart:add_to_cart', args=[self.apple.id]), {'quantity': 1})
+        live_key = self.client.session[CART_SESSION_KEY]
+        StoredCart.for_session('expiredsession').add(self.apple.id, 2)
+        StoredCart.for_session('stalesession').add(self.orange.id, 1)
+        StoredCart.for_user(self.user).add(self.apple.id, 1)
+        flush_dirty_carts()
+        StoredCart.for_session('expiredsession').add(self.orange.id, 1) # Changed again, not flushed yet
+        stale = Cart.objects.get(session_key='stalesession')
+        SessionStore(session_key='stalesession').save(must_create=True) # Still alive
+        Cart.objects.filter(pk=stale.pk).update(updated_at=timezone.now() - datetime.timedelta(days=31))
+
+        self.assertEqual(reap_abandoned_carts(batch_size=1), 2)
+        self.assertEqual(set(Cart.objects.values_list('session_key', flat=True)), {live_key, None})
+        self.assertFalse(CartItem.objects.filter(cart__session_key__in=['expiredsession', 'stalesession']).exists())
+        self.assertEqual(flush_dirty_carts(), 0) # Its pending change doesn't bring it back
+        self.assertEqual(StoredCart.for_session('expiredsession').quantities(), {}) # Redis copy gone too
+        call_command('reap_carts', stdout=StringIO())
+        self.assertEqual(Cart.objects.count(), 2)
 
+    def test_reaper_keeps_recent_carts_when_redis_is_down(self):
+        StoredCart.for_session('recentsession').add(self.apple.id, 2)
+        StoredCart.for_session('stalesession').add(self.orange.id, 1)
+        flush_dirty_carts()
+        Cart.objects.filter(session_key='stalesession').update(updated_at=timezone.now() - datetime.timedelta(days=31))
+        client = MagicMock()
+        client.mget.side_effect = client.srem.side_effect = RedisConnectionError('Connection refused')
+        with patch('django_redis.get_redis_connection', return_value=client), self.assertLogs('cart.store', 'WARNING'):
+            self.assertEqual(reap_abandoned_carts(), 1) # Past retention only; liveness is unknown
+        self.assertEqual(list(Cart.objects.values_list('session_key', flat=True)), ['recentsession'])
@@ -10,6 +10,7 @@ urlpatterns = [
     path('', views.cart_detail, name='cart_detail'),
     path('add/<int:product_id>/', views.add_to_cart, name='add_to_cart'),
     path('remove/<int:product_id>/', views.remove_from_cart, name='remove_from_cart'),
-    # path('update/<int:product_id>/', views.update_cart_item, name='update_cart_item'), # If you implement update
+    path('update/<int:product_id>/', views.update_cart_item, name='update_cart_item'),
+    path('update/', views.update_cart, name='update_cart'), # Batch JSON changes
 ]
 
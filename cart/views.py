@@ -1,87 +1,147 @@
 # FreshCart/cart/views.py
 # Handles adding, updating, and removing items from the cart.
 
+import json
+from django.http import Http404, JsonResponse
 from django.shortcuts import render, redirect, get_object_or_404
 from django.views.decorators.http import require_POST
+from orders.reservations import available_to_sell
 from products.models import Product
-from .models import Cart, CartItem
+from .store import CART_OPS, apply_changes, get_cart
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 
-def _get_or_create_cart(request):
-    # This function needs to handle anonymous carts merging with user carts upon login
-    # For simplicity, this version prioritizes authenticated user's cart.
-    # A more robust solution would merge session cart into user's cart on login.
-    if request.user.is_authenticated:
-        cart, created = Cart.objects.get_or_create(user=request.user)
-        # If there was an anonymous session cart, merge it here
-        if request.session.session_key:
-            anonymous_cart_items = CartItem.objects.filter(cart__session_key=request.session.session_key)
-            for item in anonymous_cart_items:
-                existing_item = CartItem.objects.filter(cart=cart, product=item.product).first()
-                if existing_item:
-                    existing_item.quantity += item.quantity
-                    existing_item.save()
-                else:
-                    item.cart = cart
-                    item.save()
-            # Delete the anonymous cart after merging
-            Cart.objects.filter(session_key=request.session.session_key).delete()
-            request.session.pop('session_key', None) # Clear session key
-    else:
-        session_key = request.session.session_key
-        if not session_key:
-            request.session.create()
-            session_key = request.session.session_key
-        cart, created = Cart.objects.get_or_create(session_key=session_key, user__isnull=True) # Ensure it's truly anonymous
-    return cart
+# Cart lines are kept in Redis by cart/store.py and only written to Postgres at
+# checkout, login merge or the periodic flush_carts run. The login merge itself
+# happens once, in cart/signals.py, rather than on every request.
+
+MAX_CART_CHANGES = 100 # Lines accepted by one update_cart request
+
+def _posted_quantity(request, minimum):
+    # The form's quantity as an int, or None if it isn't one of at least `minimum`
+    try:
+        quantity = int(request.POST.get('quantity', 1))
+    except (TypeError, ValueError):
+        return None
+    return quantity if quantity >= minimum else None
 
 @require_POST
 def add_to_cart(request, product_id):
     product = get_object_or_404(Product, id=product_id)
-    cart = _get_or_create_cart(request)
-    quantity = int(request.POST.get('quantity', 1))
+    quantity = _posted_quantity(request, 1)
+    if quantity is None:
+        messages.error(request, "Please enter a quantity of at least 1.")
+        return redirect('products:product_detail', id=product.id, slug=product.slug)
+    cart = get_cart(request, create=True)
 
-    # Basic stock check
-    if product.stock < quantity:
-        messages.error(request, f"Not enough stock for {product.name}. Available: {product.stock}")
+    # Stock held for other customers' checkouts isn't for sale; check the line
+    # as it would be after adding, as update_cart does
+    available = available_to_sell([product], cart.db_carts())[product.id]
+    if available < cart.quantities().get(product.id, 0) + quantity:
+        messages.error(request, f"Not enough stock for {product.name}. Available: {max(available, 0)}")
         return redirect('products:product_detail', id=product.id, slug=product.slug)
 
-    cart_item, created = CartItem.objects.get_or_create(cart=cart, product=product)
-    if not created:
-        cart_item.quantity += quantity
-    else:
-        cart_item.quantity = quantity
-    cart_item.save()
+    cart.add(product.id, quantity)
     messages.success(request, f"{product.name} added to cart.")
     return redirect('cart:cart_detail')
 
 def cart_detail(request):
-    cart = _get_or_create_cart(request)
+    cart = get_cart(request) # None for visitors who never added anything
     return render(request, 'cart/cart_detail.html', {'cart': cart})
 
 @require_POST
 def remove_from_cart(request, product_id):
     product = get_object_or_404(Product, id=product_id)
-    cart = _get_or_create_cart(request)
-    cart_item = get_object_or_404(CartItem, cart=cart, product=product)
-    cart_item.delete()
+    cart = get_cart(request)
+    if cart is None or not cart.remove(product.id):
+        raise Http404("No cart item matches the given query.")
     messages.info(request, f"{product.name} removed from cart.")
     return redirect('cart:cart_detail')
 
-# You might also want an update_cart_item view for quantity changes
-# @require_POST
-# def update_cart_item(request, product_id):
-#     product = get_object_or_404(Product, id=product_id)
-#     cart = _get_or_create_cart(request)
-#     quantity = int(request.POST.get('quantity', 1))
-#     cart_item = get_object_or_404(CartItem, cart=cart, product=product)
-#     if quantity > 0:
-#         cart_item.quantity = quantity
-#         cart_item.save()
-#         messages.success(request, f"Quantity for {product.name} updated.")
-#     else:
-#         cart_item.delete()
-#         messages.info(request, f"{product.name} removed from cart.")
-#     return redirect('cart:cart_detail')
+@require_POST
+def update_cart_item(request, product_id):
+    # Sets (rather than adds to) a line's quantity; 0 removes it
+    product = get_object_or_404(Product, id=product_id)
+    cart = get_cart(request)
+    if cart is None or product.id not in cart.quantities():
+        raise Http404("No cart item matches the given query.")
+    quantity = _posted_quantity(request, 0)
+    if quantity is None:
+        messages.error(request, "Please enter a quantity of 0 or more.")
+        return redirect('cart:cart_detail')
+
+    available = available_to_sell([product], cart.db_carts())[product.id]
+    if available < quantity:
+        messages.error(request, f"Not enough stock for {product.name}. Available: {max(available, 0)}")
+        return redirect('cart:cart_detail')
+
+    cart.set(product.id, quantity)
+    if quantity > 0:
+        messages.success(request, f"Quantity for {product.name} updated.")
+    else:
+        messages.info(request, f"{product.name} removed from cart.")
+    return redirect('cart:cart_detail')
+
+def _parse_changes(data):
+    # [(op, product_id, quantity), ...] from the request body; raises ValueError
+    lines = data.get('lines') if isinstance(data, dict) else None
+    if not isinstance(lines, list) or not 0 < len(lines) <= MAX_CART_CHANGES:
+        raise ValueError(f"Expected 'lines': a list of 1 to {MAX_CART_CHANGES} changes.")
+    changes = []
+    for number, line in enumerate(lines):
+        try:
+            op = line.get('op', 'add')
+            product_id = int(line['product_id'])
+            quantity = int(line.get('quantity', 1 if op == 'add' else 0))
+        except (AttributeError, KeyError, TypeError, ValueError):
+            raise ValueError(f"Line {number}: product_id and quantity must be integers.")
+        if op not in CART_OPS:
+            raise ValueError(f"Line {number}: op must be one of {', '.join(CART_OPS)}.")
+        if quantity < (1 if op == 'add' else 0):
+            raise ValueError(f"Line {number}: invalid quantity {quantity}.")
+        changes.append((op, product_id, quantity))
+    return changes
+
+@require_POST
+def update_cart(request):
+    """
+    Applies a batch of cart changes posted as JSON, e.g.
+    {"lines": [{"product_id": 1, "quantity": 2, "op": "set"}, ...]} with op one
+    of add (the default), set or remove. Every line is checked before any is
+    written; the batch is then applied in one Redis transaction and the new
+    lines and summary are returned, so the page can update in place.
+    """
+    try:
+        changes = _parse_changes(json.loads(request.body))
+    except ValueError as e: # Includes malformed JSON
+        return JsonResponse({'error': str(e)}, status=400)
+
+    cart = get_cart(request)
+    quantities = cart.quantities() if cart is not None else {}
+    # One query for the batch's products and the cart's, for checks and the summary
+    products = Product.objects.in_bulk({product_id for _, product_id, _ in changes} | set(quantities))
+    result = apply_changes(quantities, changes)
+    available = available_to_sell(products.values(), cart.db_carts() if cart is not None else None)
+    errors = []
+    for product_id in dict.fromkeys(product_id for _, product_id, _ in changes):
+        product, quantity = products.get(product_id), result.get(product_id, 0)
+        if quantity == 0:
+            continue
+        if product is None or not product.available:
+            errors.append({'product_id': product_id, 'error': "Product is not available."})
+        elif available[product_id] < quantity:
+            errors.append({'product_id': product_id, 'error': f"Not enough stock for {product.name}. Available: {max(available[product_id], 0)}"})
+    if errors:
+        return JsonResponse({'errors': errors}, status=400)
 
+    cart = cart or get_cart(request, create=True)
+    cart.apply(changes, {product_id: product.price for product_id, product in products.items()})
+    summary = cart.summary()
+    return JsonResponse({
+        'lines': [
+            {'product_id': product_id, 'quantity': quantity, 'cost': products[product_id].price * quantity}
+            for product_id, quantity in cart.quantities().items() if product_id in products
+        ],
+        'item_count': summary.item_count,
+        'subtotal': summary.subtotal,
+    })
@@ -21,12 +21,14 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres', # Full-text and trigram product search
     'rest_framework', # If using Django REST Framework
     'accounts',       # Your custom app - MUST BE BEFORE admin and auth if it defines AUTH_USER_MODEL
     'products',       # Your custom app
     'cart',           # Your custom app
     'orders',         # Your custom app
     'payments',       # Your custom app
+    'jobs',           # Background job queue (manage.py run_worker)
 ]
 
 MIDDLEWARE = [
@@ -52,6 +54,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'cart.context_processors.cart_summary', # Navbar cart badge
             ],
         },
     },
@@ -122,6 +125,11 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Django REST Framework: the catalog API is read-only JSON
+REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': ['rest_framework.renderers.JSONRenderer'],
+}
+
 # Redis Cache Configuration (using django-redis)
 CACHES = {
     "default": {
@@ -143,6 +151,17 @@ STRIPE_PUBLISHABLE_KEY = config('STRIPE_PUBLISHABLE_KEY')
 STRIPE_SECRET_KEY = config('STRIPE_SECRET_KEY')
 STRIPE_WEBHOOK_SECRET = config('STRIPE_WEBHOOK_SECRET') # For verifying webhook signatures
 
+# Email (order confirmations are sent by the job worker)
+# The console backend prints messages instead of sending them; set
+# EMAIL_BACKEND=django.core.mail.backends.smtp.EmailBackend in production
+EMAIL_BACKEND = config('EMAIL_BACKEND', default='django.core.mail.backends.console.EmailBackend')
+EMAIL_HOST = config('EMAIL_HOST', default='localhost')
+EMAIL_PORT = config('EMAIL_PORT', default=25, cast=int)
+EMAIL_HOST_USER = config('EMAIL_HOST_USER', default='')
+EMAIL_HOST_PASSWORD = config('EMAIL_HOST_PASSWORD', default='')
+EMAIL_USE_TLS = config('EMAIL_USE_TLS', default=False, cast=bool)
+DEFAULT_FROM_EMAIL = config('DEFAULT_FROM_EMAIL', default='FreshCart <orders@freshcart.local>')
+
 # Custom User Model (if you create one in accounts/models.py)
 AUTH_USER_MODEL = 'accounts.User' # Uncommented to use your custom User model
 
@@ -15,6 +15,7 @@ urlpatterns = [
     path('cart/', include('cart.urls')),         # Include URLs from the cart app
     path('orders/', include('orders.urls')),     # Include URLs from the orders app
     path('payments/', include('payments.urls')), # Include URLs from the payments app
+    path('api/', include('products.api_urls')),   # Read-only catalog REST API
 
     # Now using actual Django views for login and landing page
     path('', accounts_views.user_login, name='login_page'), # Maps root to login view
@@ -0,0 +1,2 @@
+# FreshCart/jobs/__init__.py
+# This file makes the jobs directory a Python package.
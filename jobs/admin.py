@@ -0,0 +1,22 @@
+# FreshCart/jobs/admin.py
+# Registers the Job model with the Django admin interface, where dead-lettered
+# jobs can be inspected and requeued.
+
+from django.contrib import admin
+from django.utils import timezone
+from .models import Job
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'name', 'status', 'attempts', 'max_attempts', 'run_at', 'created_at']
+    list_filter = ['status', 'name']
+    search_fields = ['name']
+    readonly_fields = ['created_at', 'updated_at', 'last_error']
+    actions = ['requeue']
+
+    @admin.action(description='Requeue selected jobs with fresh attempts')
+    def requeue(self, request, queryset):
+        requeued = queryset.exclude(status=Job.RUNNING).update(
+            status=Job.QUEUED, attempts=0, run_at=timezone.now(), updated_at=timezone.now(),
+        )
+        self.message_user(request, f'Requeued {requeued} job(s).')
@@ -0,0 +1,12 @@
+# FreshCart/jobs/apps.py
+
+from django.apps import AppConfig
+from django.utils.module_loading import autodiscover_modules
+
+
+class JobsConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'jobs'
+
+    def ready(self):
+        autodiscover_modules('tasks') # Registers each app's @task functions with the worker
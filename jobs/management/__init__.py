@@ -0,0 +1 @@
+# FreshCart/jobs/management/__init__.py
@@ -0,0 +1 @@
+# FreshCart/jobs/management/commands/__init__.py
@@ -0,0 +1,37 @@
+# FreshCart/jobs/management/commands/run_worker.py
+# Runs background jobs (order confirmation emails and other post-payment work).
+# Keep one or more running under a process supervisor; stop with SIGTERM or Ctrl+C.
+# Usage: python manage.py run_worker [--concurrency 4] [--poll-interval 1] [--burst]
+
+import signal
+import threading
+from django.core.management.base import BaseCommand, CommandError
+from jobs.worker import run_worker
+
+class Command(BaseCommand):
+    help = 'Claims and runs queued jobs, retrying failures with backoff and dead-lettering those that keep failing.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=1,
+                            help='Jobs (or batches) run at the same time, each on its own thread and connection.')
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help='Seconds to wait before checking an empty queue again.')
+        parser.add_argument('--burst', action='store_true',
+                            help='Exit once no job is ready instead of waiting for more.')
+
+    def handle(self, *args, **options):
+        if options['concurrency'] < 1:
+            raise CommandError('--concurrency must be at least 1.')
+        stop = threading.Event()
+        def shut_down(signum, frame):
+            self.stdout.write('Stopping after the jobs in progress...')
+            stop.set()
+        handlers = {}
+        if threading.current_thread() is threading.main_thread():
+            handlers = {signum: signal.signal(signum, shut_down) for signum in (signal.SIGTERM, signal.SIGINT)}
+        try:
+            processed = run_worker(options['concurrency'], options['burst'], options['poll_interval'], stop)
+        finally:
+            for signum, handler in handlers.items():
+                signal.signal(signum, handler)
+        self.stdout.write(self.style.SUCCESS(f'Processed {processed} job(s).'))
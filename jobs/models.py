@@ -0,0 +1,31 @@
+# FreshCart/jobs/models.py
+# Defines the Job model: one queued call of a registered task (see jobs/queue.py).
+
+from django.db import models
+from django.db.models import Q
+
+class Job(models.Model):
+    QUEUED, RUNNING, DEAD = 'queued', 'running', 'dead'
+    STATUS_CHOICES = [(QUEUED, 'Queued'), (RUNNING, 'Running'), (DEAD, 'Dead')]
+
+    name = models.CharField(max_length=200) # Registered task name, e.g. 'orders.tasks.send_order_confirmation'
+    payload = models.JSONField(default=dict) # Keyword arguments for the task
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    # When a queued job may run; for a running job, when its worker's lease
+    # expires and another worker may take it over
+    run_at = models.DateTimeField()
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ('run_at', 'id')
+        indexes = [
+            # Claiming: finished jobs are deleted and dead ones never match
+            models.Index(fields=['run_at', 'id'], name='job_ready_idx', condition=~Q(status='dead')),
+        ]
+
+    def __str__(self):
+        return f'{self.name} #{self.id} ({self.status})'
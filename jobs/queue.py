@@ -0,0 +1,124 @@
+# FreshCart/jobs/queue.py
+# A small PostgreSQL-backed job queue: the @task registry, enqueue() and the
+# claim/run/retry cycle that manage.py run_worker drives.
+# Jobs live in the same database as the data they act on, so a job enqueued
+# inside a transaction (as mark_order_paid does) only reaches the workers if
+# that transaction commits. Delivery is at least once: a worker that dies
+# mid-job loses its lease and the job runs again, so tasks must tolerate repeats.
+
+import datetime
+import logging
+import traceback
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+JOB_LEASE = datetime.timedelta(minutes=5) # A claimed job is run again if not finished by then
+RETRY_DELAY = datetime.timedelta(seconds=30) # Before the first retry; doubles with each failed attempt
+MAX_RETRY_DELAY = datetime.timedelta(hours=1)
+DEFAULT_MAX_ATTEMPTS = 5
+
+TASKS = {} # Task name -> function, filled by @task as each app's tasks.py is imported
+
+def task(batch_size=None, max_attempts=DEFAULT_MAX_ATTEMPTS):
+    """
+    Registers a function as a task. A plain task is called once per job with
+    the job's payload as keyword arguments. A task with `batch_size` is called
+    with a list of up to that many payloads of ready jobs, and returns a list
+    of the same length holding None for each payload it handled and the
+    exception (or an error message) for each that failed.
+    """
+    def register(func):
+        func.task_name = f'{func.__module__}.{func.__name__}'
+        func.batch_size = batch_size
+        func.max_attempts = max_attempts
+        TASKS[func.task_name] = func
+        return func
+    return register
+
+def enqueue(func, delay=None, **kwargs):
+    # kwargs must be JSON-serializable; pass ids rather than model instances
+    return Job.objects.create(
+        name=func.task_name, payload=kwargs, max_attempts=func.max_attempts,
+        run_at=timezone.now() + (delay or datetime.timedelta(0)),
+    )
+
+def retry_delay(attempts):
+    return min(RETRY_DELAY * 2 ** (attempts - 1), MAX_RETRY_DELAY)
+
+def claim():
+    """
+    Leases the oldest ready job to the caller, together with more ready jobs
+    of the same task up to its batch_size. Jobs leased to other workers are
+    skipped, not waited for. Returns the claimed Jobs, or [] if none is ready.
+    """
+    now = timezone.now()
+    ready = Job.objects.exclude(status=Job.DEAD).filter(run_at__lte=now)
+    with transaction.atomic():
+        first = ready.select_for_update(skip_locked=True).first()
+        if first is None:
+            return []
+        jobs = [first]
+        batch_size = getattr(TASKS.get(first.name), 'batch_size', None)
+        if batch_size and batch_size > 1:
+            jobs += ready.filter(name=first.name).exclude(pk=first.pk).select_for_update(skip_locked=True)[:batch_size - 1]
+        Job.objects.filter(pk__in=[job.pk for job in jobs]).update(
+            status=Job.RUNNING, attempts=F('attempts') + 1, run_at=now + JOB_LEASE, updated_at=now,
+        )
+    for job in jobs:
+        job.status, job.attempts = Job.RUNNING, job.attempts + 1
+    return jobs
+
+def _describe(error):
+    if isinstance(error, BaseException):
+        return ''.join(traceback.format_exception(type(error), error, error.__traceback__))
+    return str(error)
+
+def _fail(job, error):
+    # Retry with exponential backoff, or dead-letter once attempts run out
+    now = timezone.now()
+    if job.attempts >= job.max_attempts:
+        status, run_at = Job.DEAD, now
+        logger.error('Job %s (%s) dead after %s attempt(s): %s', job.pk, job.name, job.attempts, _describe(error))
+    else:
+        status, run_at = Job.QUEUED, now + retry_delay(job.attempts)
+    Job.objects.filter(pk=job.pk).update(status=status, run_at=run_at, last_error=_describe(error), updated_at=now)
+    job.status, job.run_at = status, run_at
+
+def run_jobs(jobs):
+    """
+    Runs jobs returned by claim() and records each outcome: finished jobs are
+    deleted, failed ones retried or dead-lettered. Returns the number finished.
+    """
+    for job in [job for job in jobs if job.attempts > job.max_attempts]:
+        _fail(job, 'Lease expired on the final attempt') # Its worker died or overran JOB_LEASE
+        jobs.remove(job)
+    if not jobs:
+        return 0
+    func = TASKS.get(jobs[0].name)
+    try:
+        if func is None:
+            raise LookupError(f'Unknown task {jobs[0].name!r}') # Retried: a newer worker may know it
+        if func.batch_size:
+            errors = list(func([job.payload for job in jobs]))
+        else:
+            func(**jobs[0].payload)
+            errors = [None]
+    except Exception as e:
+        errors = [e] * len(jobs)
+    done = [job.pk for job, error in zip(jobs, errors) if error is None]
+    Job.objects.filter(pk__in=done).delete()
+    for job, error in zip(jobs, errors):
+        if error is not None:
+            _fail(job, error)
+    return len(done)
+
+def work_once():
+    # Claims and runs one job or batch; returns the number of jobs claimed
+    jobs = claim()
+    if jobs:
+        run_jobs(list(jobs))
+    return len(jobs)
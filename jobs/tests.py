@@ -0,0 +1,111 @@
+# FreshCart/jobs/tests.py
+# Tests for the background job queue and worker.
+
+import datetime
+import io
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
+from .models import Job
+from .queue import JOB_LEASE, RETRY_DELAY, claim, enqueue, run_jobs, task, work_once
+from .worker import run_worker
+
+CALLS = []
+
+@task(max_attempts=3)
+def record(value):
+    CALLS.append(value)
+
+@task(max_attempts=2)
+def explode(value):
+    raise RuntimeError(f'boom {value}')
+
+@task(batch_size=3)
+def record_batch(payloads):
+    CALLS.append([payload['value'] for payload in payloads])
+    return [ValueError('odd') if payload['value'] % 2 else None for payload in payloads]
+
+class JobQueueTest(TestCase):
+    def setUp(self):
+        CALLS.clear()
+
+    def test_enqueue_and_run(self):
+        job = enqueue(record, value='a')
+        self.assertEqual((job.name, job.payload, job.max_attempts), ('jobs.tests.record', {'value': 'a'}, 3))
+        enqueue(record, delay=datetime.timedelta(minutes=5), value='later')
+        self.assertEqual(work_once(), 1)
+        self.assertEqual(work_once(), 0) # The delayed job is not ready yet
+        self.assertEqual(CALLS, ['a'])
+        self.assertEqual(list(Job.objects.values_list('payload', flat=True)), [{'value': 'later'}])
+
+    def test_failures_back_off_then_dead_letter(self):
+        job = enqueue(explode, value=1)
+        before = timezone.now()
+        work_once()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.QUEUED, 1))
+        self.assertIn('RuntimeError: boom 1', job.last_error)
+        self.assertGreaterEqual(job.run_at, before + RETRY_DELAY)
+        self.assertEqual(work_once(), 0) # Waiting out the backoff
+
+        Job.objects.filter(pk=job.pk).update(run_at=timezone.now())
+        with self.assertLogs('jobs.queue', 'ERROR') as logs:
+            work_once()
+        self.assertIn(f'Job {job.pk} (jobs.tests.explode) dead after 2 attempt(s)', logs.output[0])
+        self.assertIn('RuntimeError: boom 1', logs.output[0])
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.DEAD, 2))
+        Job.objects.filter(pk=job.pk).update(run_at=timezone.now() - datetime.timedelta(hours=1))
+        self.assertEqual(work_once(), 0) # Dead jobs are never claimed
+
+    def test_batch_task_retries_only_failed_payloads(self):
+        for value in range(5):
+            enqueue(record_batch, value=value)
+        enqueue(record, value='x')
+        self.assertEqual(work_once(), 3)
+        self.assertEqual(CALLS, [[0, 1, 2]])
+        self.assertEqual(
+            sorted(Job.objects.filter(name='jobs.tests.record_batch').values_list('payload__value', 'status')),
+            [(1, Job.QUEUED), (3, Job.QUEUED), (4, Job.QUEUED)],
+        )
+
+    def test_expired_lease_is_reclaimed(self):
+        job = enqueue(record, value='a')
+        self.assertEqual(claim(), [job]) # A worker takes it and dies
+        self.assertEqual(claim(), [])
+        Job.objects.filter(pk=job.pk).update(run_at=timezone.now() - datetime.timedelta(seconds=1))
+        jobs = claim()
+        self.assertEqual(jobs[0].attempts, 2)
+        self.assertGreater(Job.objects.get().run_at, timezone.now() + JOB_LEASE - datetime.timedelta(minutes=1))
+
+        Job.objects.filter(pk=job.pk).update(attempts=3, run_at=timezone.now())
+        self.assertEqual(run_jobs(claim()), 0) # Its last attempt was lost with the worker
+        self.assertEqual(Job.objects.get().status, Job.DEAD)
+        self.assertEqual(CALLS, [])
+
+    def test_unknown_task_is_retried(self):
+        Job.objects.create(name='jobs.tests.gone', run_at=timezone.now())
+        work_once()
+        job = Job.objects.get()
+        self.assertEqual(job.status, Job.QUEUED)
+        self.assertIn("Unknown task 'jobs.tests.gone'", job.last_error)
+
+    def test_run_worker_command_burst(self):
+        for value in range(3):
+            enqueue(record, value=value)
+        out = io.StringIO()
+        call_command('run_worker', '--burst', stdout=out)
+        self.assertIn('Processed 3 job(s).', out.getvalue())
+        self.assertEqual(sorted(CALLS), [0, 1, 2])
+        self.assertFalse(Job.objects.exists())
+
+class ConcurrentWorkerTest(TransactionTestCase):
+    def setUp(self):
+        CALLS.clear()
+
+    def test_each_job_runs_once(self):
+        for value in range(40):
+            enqueue(record, value=value)
+        self.assertEqual(run_worker(concurrency=4, burst=True), 40)
+        self.assertEqual(sorted(CALLS), list(range(40)))
+        self.assertFalse(Job.objects.exists())
@@ -0,0 +1,55 @@
+# FreshCart/jobs/worker.py
+# The loop behind manage.py run_worker: one or more threads, each claiming and
+# running jobs from jobs/queue.py and sleeping while the queue is empty.
+
+import logging
+import threading
+from django.db import close_old_connections, connection
+from .queue import work_once
+
+logger = logging.getLogger(__name__)
+
+def _work(stop, burst, poll_interval):
+    processed = 0
+    while not stop.is_set():
+        # Drop a connection the database has closed under us, unless running
+        # inside a transaction (a test's) that this would end
+        if not connection.in_atomic_block:
+            close_old_connections()
+        try:
+            claimed = work_once()
+        except Exception:
+            logger.exception('Could not claim or run jobs') # Database trouble; the jobs' leases will run out and they are retried
+            if burst:
+                break
+            stop.wait(poll_interval)
+            continue
+        processed += claimed
+        if not claimed:
+            if burst:
+                break
+            stop.wait(poll_interval)
+    return processed
+
+def run_worker(concurrency=1, burst=False, poll_interval=1.0, stop=None):
+    """
+    Processes jobs on `concurrency` threads until `stop` (a threading.Event)
+    is set or, with `burst`, until no job is ready. Returns the number of jobs
+    claimed. A single worker runs on the calling thread.
+    """
+    stop = stop or threading.Event()
+    if concurrency <= 1:
+        return _work(stop, burst, poll_interval)
+
+    results = []
+    def thread_main():
+        try:
+            results.append(_work(stop, burst, poll_interval))
+        finally:
+            connection.close() # Each thread has its own connection
+    threads = [threading.Thread(target=thread_main, name=f'job-worker-{n}') for n in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sum(results)
@@ -1,8 +1,16 @@
 # FreshCart/orders/admin.py
-# Registers Order and OrderItem models with the Django admin interface.
+# Registers Order and OrderItem models with the Django admin interface, plus
+# the sales dashboard served from the rollups in orders/sales.py.
 
 from django.contrib import admin
+from django.core.exceptions import PermissionDenied
+from django.template.response import TemplateResponse
+from django.urls import path
 from .models import Order, OrderItem
+from .history import invalidate_order_summary
+from .sales import mark_order_paid, sales_report
+
+DASHBOARD_DAYS = (7, 30, 90) # Windows offered on the sales dashboard
 
 class OrderItemInline(admin.TabularInline):
     model = OrderItem
@@ -11,13 +19,51 @@ class OrderItemInline(admin.TabularInline):
 
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
-    list_display = ['id', 'user', 'first_name', 'last_name', 'email', 'paid', 'created_at', 'get_total_cost']
-    list_filter = ['paid', 'created_at', 'updated_at']
+    list_display = ['id', 'user', 'first_name', 'last_name', 'email', 'paid', 'created_at', 'item_count', 'subtotal']
+    list_filter = ['paid', 'short_of_stock', 'created_at', 'updated_at']
     search_fields = ['id', 'user__username', 'first_name', 'last_name', 'email']
     inlines = [OrderItemInline]
-    readonly_fields = ['created_at', 'updated_at', 'stripe_id'] # These fields should not be editable in admin
+    readonly_fields = ['created_at', 'updated_at', 'stripe_id', 'paid_at', 'item_count', 'subtotal', 'short_of_stock'] # These fields should not be editable in admin
+
+    def _marks_paid(self, form):
+        return 'paid' in form.changed_data and form.cleaned_data['paid']
+
+    def save_model(self, request, obj, form, change):
+        # Manual payments go through mark_order_paid (once the inline items are
+        # saved) so the sales rollup sees them
+        if self._marks_paid(form):
+            obj.paid = False
+        super().save_model(request, obj, form, change)
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        form.instance.update_totals() # The inlines may have changed the items
+        invalidate_order_summary(form.instance.user_id)
+        if self._marks_paid(form):
+            mark_order_paid(form.instance)
 
-    def get_total_cost(self, obj):
-        return obj.get_total_cost()
-    get_total_cost.short_description = 'Total Cost'
+    def get_urls(self):
+        dashboard = path('sales/', self.admin_site.admin_view(self.sales_dashboard), name='orders_order_sales')
+        return [dashboard] + super().get_urls()
 
+    def sales_dashboard(self, request):
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        try:
+            days = int(request.GET.get('days', 30))
+        except ValueError:
+            days = 30
+        if days not in DASHBOARD_DAYS:
+            days = 30
+        report = sales_report(days)
+        context = {
+            **self.admin_site.each_context(request),
+            'title': 'Sales dashboard',
+            'opts': self.model._meta,
+            'report': report,
+            'days': days,
+            'day_choices': DASHBOARD_DAYS,
+            'max_daily': max(row['revenue'] for row in report['daily']),
+            'max_hourly': max(row['revenue'] for row in report['hourly']),
+        }
+        return TemplateResponse(request, 'admin/orders/sales_dashboard.html', context)
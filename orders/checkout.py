@@ -0,0 +1,37 @@
+# FreshCart/orders/checkout.py
+# Turns a persisted cart into an order in one transaction without overselling.
+# Stock is checked against what is available to sell (orders/reservations.py)
+# with the cart's products locked, and stays held for the order until the
+# payment webhook converts the holds into a stock decrement.
+
+from django.db import transaction
+from cart.models import Cart
+from .history import invalidate_order_summary
+from .models import OrderItem
+from .reservations import check_cart, hold_for_order
+
+@transaction.atomic
+def place_order(order, cart):
+    """
+    Saves `order` with one OrderItem per line of `cart` (a Cart), priced at
+    the current product prices, holds the stock for payment and empties the
+    cart. Raises OutOfStock, with nothing written, if any line can't be
+    fulfilled.
+    """
+    products = check_cart(cart)
+    items = [
+        OrderItem(product_id=line.product_id, price=products[line.product_id].price, quantity=line.quantity)
+        for line in cart.lines()
+    ]
+    order.item_count = sum(item.quantity for item in items)
+    order.subtotal = sum(item.get_cost() for item in items)
+    order.save()
+    for item in items:
+        item.order = order
+    OrderItem.objects.bulk_create(items)
+    hold_for_order(order, cart)
+    invalidate_order_summary(order.user_id)
+    cart.items.all().delete()
+    cart.item_count, cart.subtotal = 0, 0
+    Cart.objects.filter(pk=cart.pk).update(item_count=0, subtotal=0)
+    return order
@@ -5,6 +5,9 @@ from django import forms
 from .models import Order
 
 class OrderCreateForm(forms.ModelForm):
+    # One token per checkout page: resubmitting the same form places no second order
+    idempotency_key = forms.CharField(max_length=100, required=False, widget=forms.HiddenInput)
+
     class Meta:
         model = Order
         fields = ['first_name', 'last_name', 'email', 'address', 'postal_code', 'city']
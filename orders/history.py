@@ -0,0 +1,40 @@
+# FreshCart/orders/history.py
+# Order history: keyset-paginated listing and cached per-user order totals.
+
+from decimal import Decimal
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Q, Sum, Value
+from django.db.models.functions import Coalesce
+from products.pagination import paginate_keyset
+from .models import Order
+
+ORDER_PAGE_SIZE = 20
+ORDER_HISTORY_KEYS = ('-created_at', '-id') # Served by order_user_created_idx
+ORDER_SUMMARY_TIMEOUT = 60 * 60 * 24 # Dropped on every change anyway; this only bounds stale entries
+
+def order_page(user, cursor=None, limit=ORDER_PAGE_SIZE):
+    # (orders, next_cursor), newest first; raises InvalidCursor
+    return paginate_keyset(Order.objects.filter(user=user), ORDER_HISTORY_KEYS, cursor, limit)
+
+def _summary_key(user_id):
+    return f'orders:summary:{user_id}'
+
+def get_order_summary(user):
+    # {'order_count': ..., 'total_spent': ...}; spend counts paid orders only
+    key = _summary_key(user.pk)
+    summary = cache.get(key)
+    if summary is None:
+        summary = Order.objects.filter(user=user).aggregate(
+            order_count=Count('id'),
+            total_spent=Coalesce(Sum('subtotal', filter=Q(paid=True)), Value(Decimal('0.00'))),
+        )
+        cache.set(key, summary, ORDER_SUMMARY_TIMEOUT)
+    return summary
+
+def invalidate_order_summary(user_id):
+    # Dropped now and again after commit, in case a concurrent request
+    # re-cached the old totals in between
+    key = _summary_key(user_id)
+    cache.delete(key)
+    transaction.on_commit(lambda: cache.delete(key))
@@ -0,0 +1,90 @@
+# FreshCart/orders/idempotency.py
+# Idempotency keys: run a non-repeatable action (placing an order, creating a
+# Stripe PaymentIntent) at most once per key, and answer retries - a double
+# click, a resubmitted form, a client that timed out - with the stored result.
+
+import datetime
+from django.db import connection, transaction
+from django.utils import timezone
+from .models import IdempotencyKey
+
+# Matches how long Stripe honours its own idempotency keys
+IDEMPOTENCY_TTL = datetime.timedelta(hours=24)
+# How long an unfinished run_once(atomic=False) claim blocks repeats
+IDEMPOTENCY_CLAIM_TIMEOUT = datetime.timedelta(minutes=2)
+
+def stored_result(scope, key, user):
+    # The result of a completed, unexpired attempt, or None
+    if not key:
+        return None
+    return (
+        IdempotencyKey.objects.filter(user=user, scope=scope, key=key, expires_at__gt=timezone.now())
+        .values_list('result', flat=True).first()
+    )
+
+def _claim(scope, key, user, now, expires_at):
+    # Claims the key, returning the claim's id, or None if an unexpired claim
+    # exists; an expired claim is taken over rather than honoured
+    table = IdempotencyKey._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            INSERT INTO {table} (user_id, scope, key, created_at, expires_at)
+            VALUES (%s, %s, %s, %s, %s)
+            ON CONFLICT (user_id, scope, key) DO UPDATE
+            SET created_at = EXCLUDED.created_at, expires_at = EXCLUDED.expires_at, result = NULL
+            WHERE {table}.expires_at <= EXCLUDED.created_at
+            RETURNING id
+            """,
+            [user.pk, scope, key, now, expires_at],
+        )
+        claimed = cursor.fetchone()
+    return claimed[0] if claimed else None
+
+def run_once(scope, key, user, action, atomic=True):
+    """
+    Runs action() once per user, scope and key within IDEMPOTENCY_TTL and
+    returns (result, fresh): action's JSON-serializable result, and whether
+    this call produced it. If action raises, nothing is stored and a retry
+    runs it afresh. Without a key, action simply runs.
+
+    By default action runs in the claim's transaction, so a concurrent repeat
+    waits on the unique index for the first call to commit and then gets its
+    result. Actions that call another service (Stripe) pass atomic=False: the
+    claim is committed first and the result recorded afterwards, so no
+    connection or lock is held during the call. A repeat arriving meanwhile
+    gets (None, False) at once, and a claim left by a process that died
+    mid-call lapses after IDEMPOTENCY_CLAIM_TIMEOUT.
+    """
+    if not key:
+        return action(), True
+    now = timezone.now()
+    if atomic:
+        with transaction.atomic():
+            claimed = _claim(scope, key, user, now, now + IDEMPOTENCY_TTL)
+            if claimed is None:
+                return stored_result(scope, key, user), False
+            result = action()
+            IdempotencyKey.objects.filter(pk=claimed).update(result=result)
+        return result, True
+
+    claimed = _claim(scope, key, user, now, now + IDEMPOTENCY_CLAIM_TIMEOUT)
+    if claimed is None:
+        return stored_result(scope, key, user), False # None while the first call is still running
+    try:
+        result = action()
+    except BaseException:
+        IdempotencyKey.objects.filter(pk=claimed).delete()
+        raise
+    IdempotencyKey.objects.filter(pk=claimed).update(result=result, expires_at=timezone.now() + IDEMPOTENCY_TTL)
+    return result, True
+
+def purge_expired_keys(batch_size=1000):
+    # Deletes expired keys in bounded batches; returns how many were deleted
+    purged = 0
+    while expired := list(
+        IdempotencyKey.objects.filter(expires_at__lte=timezone.now()).values_list('pk', flat=True)[:batch_size]
+    ):
+        IdempotencyKey.objects.filter(pk__in=expired).delete()
+        purged += len(expired)
+    return purged
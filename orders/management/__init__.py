@@ -0,0 +1 @@
+# FreshCart/orders/management/__init__.py
@@ -0,0 +1 @@
+# FreshCart/orders/management/commands/__init__.py
@@ -0,0 +1,36 @@
+# FreshCart/orders/management/commands/check_order_totals.py
+# Verifies the stored Order.item_count/subtotal columns against the OrderItem rows.
+# Usage: python manage.py check_order_totals [--fix]
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import DecimalField, ExpressionWrapper, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from orders.models import Order, OrderItem
+
+def mismatched_orders():
+    # One query: each order's stored totals next to the totals of its items
+    items = OrderItem.objects.filter(order=OuterRef('pk')).order_by().values('order')
+    cost = ExpressionWrapper(F('quantity') * F('price'), output_field=DecimalField())
+    return Order.objects.annotate(
+        actual_count=Coalesce(Subquery(items.annotate(n=Sum('quantity')).values('n')), Value(0)),
+        actual_subtotal=Coalesce(Subquery(items.annotate(total=Sum(cost)).values('total')), Value(0), output_field=DecimalField()),
+    ).exclude(item_count=F('actual_count'), subtotal=F('actual_subtotal')).order_by('pk')
+
+class Command(BaseCommand):
+    help = 'Checks every order\'s stored item count and subtotal against its items.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true', help='Recompute the totals of mismatched orders.')
+
+    def handle(self, *args, **options):
+        mismatched = list(mismatched_orders())
+        for order in mismatched:
+            self.stdout.write(
+                f'Order {order.pk}: stored {order.item_count} item(s) / {order.subtotal}, '
+                f'items say {order.actual_count} / {order.actual_subtotal}'
+            )
+            if options['fix']:
+                order.update_totals()
+        if mismatched and not options['fix']:
+            raise CommandError(f'{len(mismatched)} order(s) with wrong totals; rerun with --fix to repair them.')
+        self.stdout.write(self.style.SUCCESS(f'Checked order totals: {len(mismatched)} fixed.' if mismatched else 'All order totals match their items.'))
@@ -0,0 +1,60 @@
+# FreshCart/orders/management/commands/order_partitions.py
+# Maintains the monthly orders_order partitions; run periodically (e.g. daily from cron).
+# Usage: python manage.py order_partitions [--ahead 3] [--archive-after 24 (--archive-dir DIR | --detach-only)]
+
+import os
+import subprocess
+from django.core.management.base import BaseCommand, CommandError
+from orders.partitions import (
+    add_months, archive_partition, current_month, detach_partition, ensure_partitions, list_partitions,
+    stranded_months,
+)
+
+class Command(BaseCommand):
+    help = 'Creates upcoming monthly order partitions and detaches or archives old ones.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ahead', type=int, default=3,
+                            help='Months of partitions to keep ready beyond the current one.')
+        parser.add_argument('--archive-after', type=int, metavar='MONTHS',
+                            help='Take partitions older than this many months out of the live table.')
+        parser.add_argument('--archive-dir',
+                            help='Directory for the compressed pg_dump of each old partition (dropped afterwards).')
+        parser.add_argument('--detach-only', action='store_true',
+                            help='Detach old partitions but keep them, with their items, as standalone tables.')
+
+    def handle(self, *args, **options):
+        # Checked first: a month's partition can't be created while the default
+        # partition holds some of its orders
+        stranded = stranded_months()
+        for month, rows in sorted(stranded.items()):
+            self.stdout.write(self.style.WARNING(
+                f'{rows} order(s) from {month:%Y-%m} fell into the default partition; '
+                f'move them out and create that month\'s partition by hand.'
+            ))
+        for name in ensure_partitions(options['ahead'], skip=stranded):
+            self.stdout.write(f'Created partition {name}.')
+
+        if options['archive_after'] is not None:
+            self._archive(options)
+        self.stdout.write(self.style.SUCCESS('Order partitions are up to date.'))
+
+    def _archive(self, options):
+        if not (options['detach_only'] or options['archive_dir']):
+            raise CommandError('Pass --archive-dir or --detach-only with --archive-after.')
+        if options['archive_dir'] and not os.path.isdir(options['archive_dir']):
+            raise CommandError(f"Archive directory {options['archive_dir']} does not exist.")
+
+        cutoff = add_months(current_month(), -options['archive_after'])
+        for month, name in sorted(list_partitions().items()):
+            if month >= cutoff:
+                break
+            if options['detach_only']:
+                orders, items = detach_partition(month)
+                self.stdout.write(f'Detached {orders} (items in {items}).')
+            else:
+                try:
+                    path = archive_partition(month, options['archive_dir'])
+                except (OSError, subprocess.CalledProcessError) as e:
+                    raise CommandError(f'Could not dump {name} ({e}); it was re-attached.')
+                self.stdout.write(f'Archived {name} to {path}.')
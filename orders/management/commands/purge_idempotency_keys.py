@@ -0,0 +1,18 @@
+# FreshCart/orders/management/commands/purge_idempotency_keys.py
+# Deletes expired idempotency keys; run periodically (e.g. hourly from cron).
+# Expired keys are already ignored, so this only keeps the table small.
+# Usage: python manage.py purge_idempotency_keys [--batch-size 1000]
+
+from django.core.management.base import BaseCommand
+from orders.idempotency import purge_expired_keys
+
+class Command(BaseCommand):
+    help = 'Deletes checkout and payment idempotency keys whose retry window has passed.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Keys deleted per statement.')
+
+    def handle(self, *args, **options):
+        purged = purge_expired_keys(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Purged {purged} expired idempotency key(s).'))
@@ -0,0 +1,24 @@
+# FreshCart/orders/management/commands/rebuild_sales_rollup.py
+# Recomputes the product, category and store sales rollups from paid orders.
+# Usage: python manage.py rebuild_sales_rollup [--since 2024-01-31]
+
+import datetime
+from django.core.management.base import BaseCommand, CommandError
+from orders.sales import rebuild_sales
+
+class Command(BaseCommand):
+    help = 'Rebuilds the hourly product, category and store sales rollups from OrderItem rows of paid orders.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', help='Only rebuild days on or after this date (YYYY-MM-DD).')
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            try:
+                since = datetime.date.fromisoformat(options['since'])
+            except ValueError:
+                raise CommandError(f"Invalid --since date: {options['since']}")
+        rows = rebuild_sales(since)
+        scope = f'from {since}' if since else 'for all days'
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {rows} sales rollup row(s) {scope}.'))
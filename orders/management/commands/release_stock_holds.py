@@ -0,0 +1,18 @@
+# FreshCart/orders/management/commands/release_stock_holds.py
+# Deletes expired stock holds; run periodically (e.g. every few minutes from cron).
+# Expired holds already stop counting against stock, so this only keeps the table small.
+# Usage: python manage.py release_stock_holds [--batch-size 1000]
+
+from django.core.management.base import BaseCommand
+from orders.reservations import release_expired_holds
+
+class Command(BaseCommand):
+    help = 'Deletes stock holds whose checkout or payment window has expired.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Holds deleted per statement.')
+
+    def handle(self, *args, **options):
+        released = release_expired_holds(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Released {released} expired stock hold(s).'))
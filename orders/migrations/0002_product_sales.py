@@ -0,0 +1,36 @@
+# Generated by Django 4.2 on 2026-10-18 06:54
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0004_product_keyset_indexes'),
+        ('orders', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductSales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('units', models.PositiveIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_sales', to='products.product')),
+            ],
+            options={
+                'verbose_name_plural': 'Product sales',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='productsales',
+            index=models.Index(fields=['date', 'product'], name='product_sales_date_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='productsales',
+            unique_together={('product', 'date')},
+        ),
+    ]
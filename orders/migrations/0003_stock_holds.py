@@ -0,0 +1,35 @@
+# Generated by Django 4.2 on 2026-10-18 07:09
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cart', '0003_cart_summary'),
+        ('products', '0005_catalog_change_feed'),
+        ('orders', '0002_product_sales'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockHold',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField()),
+                ('expires_at', models.DateTimeField()),
+                ('cart', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='stock_holds', to='cart.cart')),
+                ('order', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='stock_holds', to='orders.order')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_holds', to='products.product')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='stockhold',
+            index=models.Index(fields=['product', 'expires_at'], include=('quantity',), name='stock_hold_product_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stockhold',
+            index=models.Index(fields=['expires_at'], name='stock_hold_expires_at_idx'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 4.2 on 2026-10-18 07:12
+
+from django.db import migrations, models
+from django.db.models import DecimalField, ExpressionWrapper, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def populate_totals(apps, schema_editor):
+    # Set-based backfill; mirrors Order.update_totals()
+    Order = apps.get_model('orders', 'Order')
+    OrderItem = apps.get_model('orders', 'OrderItem')
+    items = OrderItem.objects.filter(order=OuterRef('pk')).order_by().values('order')
+    cost = ExpressionWrapper(F('quantity') * F('price'), output_field=DecimalField())
+    Order.objects.update(
+        item_count=Coalesce(Subquery(items.annotate(n=Sum('quantity')).values('n')), Value(0)),
+        subtotal=Coalesce(Subquery(items.annotate(total=Sum(cost)).values('total')), Value(0), output_field=DecimalField()),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0003_stock_holds'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='item_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='subtotal',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.RunPython(populate_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,101 @@
+# Generated by Django 4.2 on 2026-10-18 07:16
+
+import datetime
+from django.db import migrations, models
+import django.db.models.deletion
+
+TABLE = 'orders_order'
+MONTHS_AHEAD = 3 # Partitions created up front; manage.py order_partitions keeps this up
+
+
+def _next_month(month):
+    return datetime.date(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+def _rebuild(schema_editor, partitioned):
+    """
+    Recreates orders_order as a partitioned (or, in reverse, a plain) table
+    and copies the rows over, keeping the table's other indexes and foreign
+    keys under their names.
+    """
+    execute = schema_editor.execute
+    old = f'{TABLE}_rebuild'
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT indexdef FROM pg_indexes WHERE tablename = %s AND indexname <> %s",
+            [TABLE, f'{TABLE}_pkey'],
+        )
+        indexes = [row[0] for row in cursor.fetchall()]
+        cursor.execute(
+            "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint WHERE conrelid = %s::regclass AND contype = 'f'",
+            [TABLE],
+        )
+        foreign_keys = cursor.fetchall()
+        cursor.execute(f"SELECT min(created_at) FROM {TABLE}")
+        first = cursor.fetchone()[0]
+
+    execute(f"ALTER TABLE {TABLE} RENAME TO {old}")
+    execute(
+        f"CREATE TABLE {TABLE} (LIKE {old} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"
+        + (" PARTITION BY RANGE (created_at)" if partitioned else "")
+    )
+    execute(f"ALTER TABLE {TABLE} ALTER COLUMN id DROP DEFAULT") # Still bound to the old table's sequence
+    if partitioned:
+        # Monthly partitions (UTC month boundaries) from the oldest order on,
+        # plus a default partition so an insert never fails for lack of one
+        today = datetime.datetime.now(datetime.timezone.utc).date()
+        month = (first.date() if first else today).replace(day=1)
+        last = today.replace(day=1)
+        for _ in range(MONTHS_AHEAD):
+            last = _next_month(last)
+        while month <= last:
+            execute(
+                f"CREATE TABLE {TABLE}_y{month.year}m{month.month:02d} PARTITION OF {TABLE} "
+                f"FOR VALUES FROM ('{month.isoformat()} 00:00:00+00') TO ('{_next_month(month).isoformat()} 00:00:00+00')"
+            )
+            month = _next_month(month)
+        execute(f"CREATE TABLE {TABLE}_default PARTITION OF {TABLE} DEFAULT")
+    execute(f"INSERT INTO {TABLE} SELECT * FROM {old}")
+    execute(f"DROP TABLE {old}") # Takes the old id sequence, indexes and constraints with it
+
+    # A partitioned table's primary key must include the partition key
+    execute(f"ALTER TABLE {TABLE} ADD PRIMARY KEY ({'id, created_at' if partitioned else 'id'})")
+    execute(f"CREATE SEQUENCE {TABLE}_id_seq OWNED BY {TABLE}.id")
+    execute(f"SELECT setval('{TABLE}_id_seq', COALESCE(max(id), 0) + 1, false) FROM {TABLE}")
+    execute(f"ALTER TABLE {TABLE} ALTER COLUMN id SET DEFAULT nextval('{TABLE}_id_seq')")
+    for index in indexes:
+        execute(index)
+    for name, definition in foreign_keys:
+        execute(f"ALTER TABLE {TABLE} ADD CONSTRAINT {name} {definition}")
+
+
+def partition_orders(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        _rebuild(schema_editor, partitioned=True)
+
+
+def unpartition_orders(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        _rebuild(schema_editor, partitioned=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0005_order_history_index'),
+    ]
+
+    operations = [
+        # Nothing can reference a partitioned table's id alone
+        migrations.AlterField(
+            model_name='orderitem',
+            name='order',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='items', to='orders.order'),
+        ),
+        migrations.AlterField(
+            model_name='stockhold',
+            name='order',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='stock_holds', to='orders.order'),
+        ),
+        migrations.RunPython(partition_orders, unpartition_orders),
+    ]
@@ -0,0 +1,116 @@
+# Generated by Django 4.2 on 2026-10-18 07:20
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.utils import timezone
+
+
+def backfill_rollups(apps, schema_editor):
+    # Old rows are whole days without order counts: recompute every rollup
+    # from paid orders in one pass, as orders.sales.rebuild_sales() does
+    schema_editor.execute('DELETE FROM orders_productsales')
+    schema_editor.execute(
+        """
+        WITH lines AS (
+            SELECT i.product_id, p.category_id, o.id AS order_id, i.quantity, i.price * i.quantity AS amount,
+                   (o.created_at AT TIME ZONE %s)::date AS date,
+                   EXTRACT(HOUR FROM o.created_at AT TIME ZONE %s)::smallint AS hour
+            FROM orders_orderitem i
+            JOIN orders_order o ON o.id = i.order_id
+            JOIN products_product p ON p.id = i.product_id
+            WHERE o.paid
+        ), products AS (
+            INSERT INTO orders_productsales (product_id, date, hour, units, revenue, orders)
+            SELECT product_id, date, hour, SUM(quantity), SUM(amount), COUNT(DISTINCT order_id)
+            FROM lines GROUP BY 1, 2, 3
+        ), categories AS (
+            INSERT INTO orders_categorysales (category_id, date, hour, units, revenue, orders)
+            SELECT category_id, date, hour, SUM(quantity), SUM(amount), COUNT(DISTINCT order_id)
+            FROM lines GROUP BY 1, 2, 3
+        )
+        INSERT INTO orders_storesales (date, hour, units, revenue, orders)
+        SELECT date, hour, SUM(quantity), SUM(amount), COUNT(DISTINCT order_id)
+        FROM lines GROUP BY 1, 2
+        """,
+        [timezone.get_current_timezone_name()] * 2,
+    )
+
+
+def collapse_hours(apps, schema_editor):
+    # Back to one row per product and day before the hour column goes
+    schema_editor.execute(
+        """
+        WITH hours AS (DELETE FROM orders_productsales RETURNING product_id, date, units, revenue)
+        INSERT INTO orders_productsales (product_id, date, hour, units, revenue, orders)
+        SELECT product_id, date, 0, SUM(units), SUM(revenue), 0 FROM hours GROUP BY 1, 2
+        """
+    )
+    schema_editor.execute('SET CONSTRAINTS ALL IMMEDIATE') # Run the FK checks before the ALTER TABLEs that follow
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0005_catalog_change_feed'),
+        ('orders', '0006_partition_orders'),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='productsales',
+            unique_together=set(),
+        ),
+        migrations.AddField(
+            model_name='productsales',
+            name='hour',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='productsales',
+            name='orders',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AlterUniqueTogether(
+            name='productsales',
+            unique_together={('product', 'date', 'hour')},
+        ),
+        migrations.CreateModel(
+            name='StoreSales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('hour', models.PositiveSmallIntegerField(default=0)),
+                ('units', models.PositiveIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('orders', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name_plural': 'Store sales',
+                'unique_together': {('date', 'hour')},
+            },
+        ),
+        migrations.CreateModel(
+            name='CategorySales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('hour', models.PositiveSmallIntegerField(default=0)),
+                ('units', models.PositiveIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('orders', models.PositiveIntegerField(default=0)),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='hourly_sales', to='products.category')),
+            ],
+            options={
+                'verbose_name_plural': 'Category sales',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='categorysales',
+            index=models.Index(fields=['date', 'category'], name='category_sales_date_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='categorysales',
+            unique_together={('category', 'date', 'hour')},
+        ),
+        migrations.RunPython(backfill_rollups, collapse_hours),
+    ]
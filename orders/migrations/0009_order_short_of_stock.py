@@ -0,0 +1,18 @@
+# Generated by Django 4.2 on 2026-10-18 07:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0008_idempotency_keys'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='short_of_stock',
+            field=models.BooleanField(default=False),
+        ),
+    ]
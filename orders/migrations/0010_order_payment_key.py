@@ -0,0 +1,21 @@
+# Generated by Django 4.2 on 2026-10-18 07:44
+
+from django.db import migrations, models
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0009_order_short_of_stock'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='payment_key',
+            field=models.UUIDField(default=uuid.uuid4, editable=False),
+        ),
+        # AddField gave existing orders one shared default; give each its own
+        migrations.RunSQL('UPDATE orders_order SET payment_key = gen_random_uuid()', migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 4.2 on 2026-10-18 07:57
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0005_catalog_change_feed'),
+        ('orders', '0010_order_payment_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='paid_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        # The best record of when earlier orders were paid
+        migrations.RunSQL('UPDATE orders_order SET paid_at = updated_at WHERE paid', migrations.RunSQL.noop),
+        migrations.AlterField(
+            model_name='productsales',
+            name='product',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='hourly_sales', to='products.product'),
+        ),
+    ]
@@ -1,11 +1,17 @@
 # FreshCart/orders/models.py
-# Defines the Order and OrderItem models.
+# Defines the Order and OrderItem models, stock holds, the sales rollups and
+# idempotency keys.
 
+import uuid
 from django.db import models
-from products.models import Product
+from django.db.models import ExpressionWrapper, F, Sum
+from products.models import Category, Product
 from django.conf import settings
 
 class Order(models.Model):
+    # orders_order is range-partitioned by created_at month in PostgreSQL
+    # (migration 0006, orders/partitions.py). The table's primary key is
+    # (id, created_at), so foreign keys to it are kept by Django only.
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='orders')
     first_name = models.CharField(max_length=50)
     last_name = models.CharField(max_length=50)
@@ -16,19 +22,42 @@ class Order(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     paid = models.BooleanField(default=False)
+    paid_at = models.DateTimeField(null=True, blank=True) # Set by mark_order_paid; sales are bucketed by it
     stripe_id = models.CharField(max_length=255, blank=True) # To store Stripe PaymentIntent ID
+    # Stripe idempotency key for this order's PaymentIntent: unlike the id, never
+    # reused after a database reset or by another environment on the same account
+    payment_key = models.UUIDField(default=uuid.uuid4, editable=False)
+    # Stored totals, set at checkout (and by the admin when items are edited);
+    # manage.py check_order_totals verifies them against the items
+    item_count = models.PositiveIntegerField(default=0)
+    subtotal = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    # Paid for although some of its stock was gone (see mark_order_paid); needs
+    # a refund or a restock
+    short_of_stock = models.BooleanField(default=False)
 
     class Meta:
         ordering = ('-created_at',)
+        indexes = [
+            models.Index(fields=['user', '-created_at', '-id'], name='order_user_created_idx'), # Order history pages
+        ]
 
     def __str__(self):
         return f'Order {self.id}'
 
     def get_total_cost(self):
+        # Recomputed from the items; listings read the stored subtotal instead
         return sum(item.get_cost() for item in self.items.all())
 
+    def update_totals(self):
+        totals = self.items.aggregate(
+            count=Sum('quantity'),
+            subtotal=Sum(ExpressionWrapper(F('quantity') * F('price'), output_field=models.DecimalField())),
+        )
+        self.item_count, self.subtotal = totals['count'] or 0, totals['subtotal'] or 0
+        Order.objects.filter(pk=self.pk).update(item_count=self.item_count, subtotal=self.subtotal)
+
 class OrderItem(models.Model):
-    order = models.ForeignKey(Order, related_name='items', on_delete=models.CASCADE)
+    order = models.ForeignKey(Order, related_name='items', on_delete=models.CASCADE, db_constraint=False)
     product = models.ForeignKey(Product, related_name='order_items', on_delete=models.CASCADE)
     price = models.DecimalField(max_digits=10, decimal_places=2)
     quantity = models.PositiveIntegerField(default=1)
@@ -39,4 +68,97 @@ class OrderItem(models.Model):
     def get_cost(self):
         return self.price * self.quantity
 
+class StockHold(models.Model):
+    # Stock set aside for a cart in checkout or an unpaid order until expires_at.
+    # Expired holds no longer count; release_stock_holds deletes them later.
+    product = models.ForeignKey(Product, related_name='stock_holds', on_delete=models.CASCADE)
+    cart = models.ForeignKey('cart.Cart', related_name='stock_holds', null=True, blank=True, on_delete=models.CASCADE)
+    order = models.ForeignKey(Order, related_name='stock_holds', null=True, blank=True, on_delete=models.CASCADE,
+                              db_constraint=False)
+    quantity = models.PositiveIntegerField()
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            # Available-to-sell: an index-only range scan per product
+            models.Index(fields=['product', 'expires_at'], include=['quantity'], name='stock_hold_product_idx'),
+            models.Index(fields=['expires_at'], name='stock_hold_expires_at_idx'), # Bulk release
+        ]
+
+    def __str__(self):
+        return f'{self.quantity} x {self.product_id} until {self.expires_at}'
+
+class ProductSales(models.Model):
+    # Hourly sales rollup per product, maintained incrementally by orders/sales.py;
+    # daily figures are the sum of a date's hours
+    product = models.ForeignKey(Product, related_name='hourly_sales', on_delete=models.CASCADE)
+    date = models.DateField() # Day the order was paid, in TIME_ZONE
+    hour = models.PositiveSmallIntegerField(default=0) # Local hour of day, 0-23
+    units = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    orders = models.PositiveIntegerField(default=0) # Paid orders containing the product
+
+    class Meta:
+        verbose_name_plural = 'Product sales'
+        unique_together = ('product', 'date', 'hour') # Upsert target
+        indexes = [
+            models.Index(fields=['date', 'product'], name='product_sales_date_idx'), # Bestseller windows
+        ]
+
+    def __str__(self):
+        return f'{self.product_id} on {self.date} {self.hour:02}:00'
+
+class CategorySales(models.Model):
+    # Hourly sales rollup per category; an order counts once per category it bought from
+    category = models.ForeignKey(Category, related_name='hourly_sales', on_delete=models.CASCADE)
+    date = models.DateField()
+    hour = models.PositiveSmallIntegerField(default=0)
+    units = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    orders = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name_plural = 'Category sales'
+        unique_together = ('category', 'date', 'hour')
+        indexes = [
+            models.Index(fields=['date', 'category'], name='category_sales_date_idx'), # Dashboard windows
+        ]
+
+    def __str__(self):
+        return f'{self.category_id} on {self.date} {self.hour:02}:00'
+
+class StoreSales(models.Model):
+    # Hourly store-wide totals; the only rollup whose order count gives the true
+    # average basket, since an order can span categories
+    date = models.DateField()
+    hour = models.PositiveSmallIntegerField(default=0)
+    units = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    orders = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name_plural = 'Store sales'
+        unique_together = ('date', 'hour')
 
+    def __str__(self):
+        return f'{self.date} {self.hour:02}:00'
+
+class IdempotencyKey(models.Model):
+    # A client-supplied key for one attempt at a non-repeatable action (placing
+    # an order, creating a PaymentIntent) and the action's result, so a retry
+    # within the TTL gets the same answer; see orders/idempotency.py
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, related_name='idempotency_keys', on_delete=models.CASCADE)
+    scope = models.CharField(max_length=50) # The action, e.g. 'checkout'
+    key = models.CharField(max_length=100)
+    result = models.JSONField(null=True, blank=True)
+    created_at = models.DateTimeField()
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = ('user', 'scope', 'key') # Upsert target and lookup index
+        indexes = [
+            models.Index(fields=['expires_at'], name='idempotency_expires_at_idx'), # Purging
+        ]
+
+    def __str__(self):
+        return f'{self.scope} {self.key}'
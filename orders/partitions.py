@@ -0,0 +1,145 @@
+# FreshCart/orders/partitions.py
+# Monthly range partitions of orders_order (set up by migration 0006).
+# Each month's orders live in orders_order_y<year>m<month>, with partition
+# bounds on UTC month starts. Future partitions are created ahead of time;
+# old ones are detached and archived together with their items, so the live
+# tables, their indexes and vacuum work only cover recent orders.
+
+import datetime
+import os
+import re
+import subprocess
+from django.db import connection, transaction
+from .models import Order, OrderItem, StockHold
+
+TABLE = Order._meta.db_table
+DEFAULT_PARTITION = f'{TABLE}_default' # Catches rows outside every monthly partition
+PARTITION_NAME = re.compile(rf'^{TABLE}_y(\d{{4}})m(\d{{2}})$')
+
+def month_start(value):
+    return datetime.date(value.year, value.month, 1)
+
+def add_months(month, count):
+    years, month_index = divmod(month.month - 1 + count, 12)
+    return datetime.date(month.year + years, month_index + 1, 1)
+
+def partition_name(month):
+    return f'{TABLE}_y{month.year}m{month.month:02d}'
+
+def current_month():
+    return month_start(datetime.datetime.now(datetime.timezone.utc))
+
+def list_partitions():
+    # {month: table name} for the monthly partitions currently attached
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid WHERE i.inhparent = %s::regclass",
+            [TABLE],
+        )
+        names = [row[0] for row in cursor.fetchall()]
+    return {
+        datetime.date(int(match[1]), int(match[2]), 1): name
+        for name in names if (match := PARTITION_NAME.match(name))
+    }
+
+def _bound(month):
+    # A UTC month start as a literal; DDL takes no parameters, and these are generated dates
+    return f"'{month.isoformat()} 00:00:00+00'"
+
+def create_partition(month):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"CREATE TABLE {partition_name(month)} PARTITION OF {TABLE} "
+            f"FOR VALUES FROM ({_bound(month)}) TO ({_bound(add_months(month, 1))})"
+        )
+
+def stranded_months():
+    # {month: order count} for orders that fell into the default partition
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT date_trunc('month', created_at AT TIME ZONE 'UTC')::date, count(*) FROM {DEFAULT_PARTITION} GROUP BY 1"
+        )
+        return dict(cursor.fetchall())
+
+def ensure_partitions(ahead=3, skip=()):
+    """
+    Creates any missing partitions from this month to `ahead` months on,
+    except for the months in `skip`, and returns their names. A month with
+    orders in the default partition must be skipped: PostgreSQL refuses to
+    create a partition whose rows the default partition already holds.
+    """
+    existing = list_partitions()
+    created = []
+    for offset in range(ahead + 1):
+        month = add_months(current_month(), offset)
+        if month not in existing and month not in skip:
+            create_partition(month)
+            created.append(partition_name(month))
+    return created
+
+@transaction.atomic
+def detach_partition(month):
+    """
+    Detaches a month's partition and moves its orders' items (and any stock
+    holds) out of the live tables into <partition>_items. Returns the two
+    table names, which hold the month's complete orders from then on.
+    """
+    name = partition_name(month)
+    items = f'{name}_items'
+    orders_of_month = f"SELECT id FROM {name}"
+    with connection.cursor() as cursor:
+        cursor.execute(f"ALTER TABLE {TABLE} DETACH PARTITION {name}")
+        cursor.execute(
+            f"CREATE TABLE {items} AS SELECT * FROM {OrderItem._meta.db_table} WHERE order_id IN ({orders_of_month})"
+        )
+        cursor.execute(f"DELETE FROM {OrderItem._meta.db_table} WHERE order_id IN ({orders_of_month})")
+        cursor.execute(f"DELETE FROM {StockHold._meta.db_table} WHERE order_id IN ({orders_of_month})")
+    return name, items
+
+@transaction.atomic
+def reattach_partition(month):
+    # Undoes detach_partition, putting the month's orders and items back in the
+    # live tables (its stock holds, long expired, stay deleted)
+    name = partition_name(month)
+    items = f'{name}_items'
+    with connection.cursor() as cursor:
+        cursor.execute(f"INSERT INTO {OrderItem._meta.db_table} SELECT * FROM {items}")
+        cursor.execute(f"DROP TABLE {items}")
+        cursor.execute(
+            f"ALTER TABLE {TABLE} ATTACH PARTITION {name} "
+            f"FOR VALUES FROM ({_bound(month)}) TO ({_bound(add_months(month, 1))})"
+        )
+
+def _pg_dump(path, tables):
+    # Custom-format dump, compressed; restore with pg_restore
+    db = connection.settings_dict
+    command = ['pg_dump', '--format=custom', '--compress=9', f'--file={path}']
+    command += [f'--table={table}' for table in tables]
+    if db['HOST']:
+        command += ['--host', db['HOST']]
+    if db['PORT']:
+        command += ['--port', str(db['PORT'])]
+    if db['USER']:
+        command += ['--username', db['USER']]
+    env = {**os.environ, 'PGPASSWORD': db['PASSWORD']} if db['PASSWORD'] else None
+    subprocess.run(command + [db['NAME']], check=True, env=env)
+
+def archive_partition(month, archive_dir):
+    """
+    Detaches a month's partition, dumps it and its items to
+    <archive_dir>/<partition>.dump and drops the tables once the dump has
+    succeeded. Returns the dump's path. If pg_dump fails (or can't be run),
+    the partition is re-attached and the error re-raised.
+    """
+    tables = detach_partition(month)
+    path = os.path.join(archive_dir, f'{tables[0]}.dump')
+    try:
+        _pg_dump(path, tables)
+    except (OSError, subprocess.CalledProcessError):
+        reattach_partition(month)
+        if os.path.exists(path):
+            os.remove(path) # Incomplete
+        raise
+    with connection.cursor() as cursor:
+        cursor.execute(f"DROP TABLE {', '.join(tables)}")
+    return path
@@ -0,0 +1,160 @@
+# FreshCart/orders/reservations.py
+# Time-limited stock reservations (StockHold). A cart entering checkout holds
+# its lines for CHECKOUT_HOLD_TTL; placing the order turns those into holds on
+# the order for PAYMENT_HOLD_TTL, which the payment page renews (or refuses
+# payment if the stock has gone), and payment converts them into a stock
+# decrement. Available-to-sell is Product.stock minus the unexpired holds,
+# summed from stock_hold_product_idx.
+
+import datetime
+from django.db import connection, transaction
+from django.db.models import Sum
+from django.utils import timezone
+from products.catalog import bump_catalog_version
+from products.models import Product
+from .models import StockHold
+
+CHECKOUT_HOLD_TTL = datetime.timedelta(minutes=15) # From the checkout page to placing the order
+PAYMENT_HOLD_TTL = datetime.timedelta(hours=1) # From placing the order to paying for it
+
+class OutOfStock(Exception):
+    # Carries one message per cart line that can't be fulfilled
+    def __init__(self, problems):
+        super().__init__(' '.join(problems))
+        self.problems = problems
+
+def held_quantities(product_ids, exclude_carts=None, exclude_order=None):
+    """
+    Returns {product_id: quantity} held by unexpired holds. `exclude_carts`
+    (Carts or a Cart queryset) leaves out a customer's own checkout holds,
+    `exclude_order` an order's own payment holds.
+    """
+    holds = StockHold.objects.filter(product_id__in=product_ids, expires_at__gt=timezone.now())
+    if exclude_carts is not None:
+        holds = holds.exclude(cart__in=exclude_carts)
+    if exclude_order is not None:
+        holds = holds.exclude(order=exclude_order)
+    return dict(holds.values('product_id').annotate(held=Sum('quantity')).values_list('product_id', 'held'))
+
+def available_to_sell(products, exclude_carts=None, exclude_order=None):
+    # {product.id: stock not held by anyone else} for Product instances
+    held = held_quantities([product.id for product in products], exclude_carts, exclude_order)
+    return {product.id: product.stock - held.get(product.id, 0) for product in products}
+
+def _lock_products(product_ids):
+    # Locks in id order, so concurrent checkouts of the same products queue
+    # up instead of deadlocking
+    return Product.objects.select_for_update().filter(id__in=product_ids).order_by('id').in_bulk()
+
+def check_cart(cart):
+    """
+    Locks the cart's products (call inside a transaction) and returns them as
+    {product_id: Product}. Raises OutOfStock naming every unavailable line or
+    line with more than is available to sell, counting the cart's own holds
+    as its own.
+    """
+    lines = cart.lines()
+    products = _lock_products([line.product_id for line in lines])
+    available = available_to_sell(products.values(), exclude_carts=[cart])
+    problems = []
+    for line in lines:
+        product = products.get(line.product_id)
+        if product is None or not product.available:
+            problems.append(f"{line.product.name} is no longer available.")
+        elif available[product.id] < line.quantity:
+            problems.append(f"Not enough stock for {product.name}. Available: {max(available[product.id], 0)}")
+    if problems:
+        raise OutOfStock(problems)
+    return products
+
+@transaction.atomic
+def reserve_cart(cart, ttl=CHECKOUT_HOLD_TTL):
+    # Holds (or re-holds, with a fresh expiry) every line of a Cart entering checkout
+    check_cart(cart)
+    expires_at = timezone.now() + ttl
+    cart.stock_holds.all().delete()
+    StockHold.objects.bulk_create([
+        StockHold(cart=cart, product_id=line.product_id, quantity=line.quantity, expires_at=expires_at)
+        for line in cart.lines()
+    ])
+
+def hold_for_order(order, cart, ttl=PAYMENT_HOLD_TTL):
+    # Moves the cart's holds onto the order it became (inside place_order's transaction)
+    expires_at = timezone.now() + ttl
+    cart.stock_holds.all().delete()
+    StockHold.objects.bulk_create([
+        StockHold(order=order, product_id=line.product_id, quantity=line.quantity, expires_at=expires_at)
+        for line in cart.lines()
+    ])
+
+@transaction.atomic
+def renew_order_holds(order, ttl=PAYMENT_HOLD_TTL):
+    """
+    Re-checks an unpaid order's stock before it is paid for and holds it for
+    another `ttl`, whether or not its holds have expired meanwhile. Raises
+    OutOfStock naming every line that can no longer be fulfilled; the order
+    must not be paid for then, or payment would oversell.
+    """
+    quantities = {}
+    for product_id, quantity in order.items.values_list('product_id', 'quantity'):
+        quantities[product_id] = quantities.get(product_id, 0) + quantity
+    products = _lock_products(quantities)
+    available = available_to_sell(products.values(), exclude_order=order)
+    problems = []
+    for product_id, quantity in quantities.items():
+        product = products[product_id]
+        if not product.available:
+            problems.append(f"{product.name} is no longer available.")
+        elif available[product_id] < quantity:
+            problems.append(f"Not enough stock for {product.name}. Available: {max(available[product_id], 0)}")
+    if problems:
+        raise OutOfStock(problems)
+    expires_at = timezone.now() + ttl
+    order.stock_holds.all().delete()
+    StockHold.objects.bulk_create([
+        StockHold(order=order, product_id=product_id, quantity=quantity, expires_at=expires_at)
+        for product_id, quantity in quantities.items()
+    ])
+
+def _take_stock(quantities):
+    # One conditional UPDATE for every line: products without enough stock are
+    # left alone. Returns {product_id: remaining stock} for the rows updated.
+    table = Product._meta.db_table
+    values = ', '.join(['(%s, %s)'] * len(quantities))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""UPDATE {table} AS p SET stock = p.stock - v.quantity, updated_at = %s
+                FROM (VALUES {values}) AS v(id, quantity)
+                WHERE p.id = v.id AND p.stock >= v.quantity
+                RETURNING p.id, p.stock""",
+            [timezone.now()] + [value for line in quantities.items() for value in line],
+        )
+        return dict(cursor.fetchall())
+
+@transaction.atomic
+def convert_order_holds(order):
+    """
+    Takes the stock for a paid order and drops its holds. Works from the
+    order's items, so a payment arriving after the holds expired still takes
+    the stock if it's there. Returns the product ids that were short.
+    """
+    quantities = dict(order.items.values_list('product_id', 'quantity'))
+    _lock_products(quantities)
+    remaining = _take_stock(quantities) if quantities else {}
+    order.stock_holds.all().delete()
+    if remaining:
+        # Stock is part of the cached listings and the API's list ETag, and
+        # sold-out products drop out of facet counts; the update above skipped
+        # the post_save signals that would otherwise bump the version
+        transaction.on_commit(bump_catalog_version)
+    return [product_id for product_id in quantities if product_id not in remaining]
+
+def release_expired_holds(batch_size=1000):
+    # Deletes expired holds in bounded batches; returns how many were deleted
+    released = 0
+    while expired := list(
+        StockHold.objects.filter(expires_at__lte=timezone.now()).values_list('pk', flat=True)[:batch_size]
+    ):
+        StockHold.objects.filter(pk__in=expired).delete()
+        released += len(expired)
+    return released
@@ -0,0 +1,182 @@
+# FreshCart/orders/sales.py
+# Sales rollup maintenance (hourly ProductSales, CategorySales and StoreSales)
+# and the bestseller ranking and admin sales report built on them.
+# Paid orders are added to the rollups as they are paid, so rankings and
+# reports never aggregate raw OrderItem history at request time.
+
+import datetime
+import logging
+from decimal import Decimal
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Sum
+from django.utils import timezone
+from products.catalog import PRODUCT_PAGE_SIZE, catalog_key
+from jobs.queue import enqueue
+from products.models import Product
+from .history import invalidate_order_summary
+from .models import CategorySales, Order, OrderItem, ProductSales, StoreSales
+from .reservations import convert_order_holds
+from .tasks import send_order_confirmations
+
+logger = logging.getLogger(__name__)
+
+BESTSELLER_DAYS = 30 # Ranking window
+BESTSELLER_TIMEOUT = 60 * 10 # Rankings may lag new sales by this much
+ROLLUP_MODELS = (ProductSales, CategorySales, StoreSales)
+
+def _upsert_sql(table, key=None):
+    # Adds one grouping of `lines` to a rollup, summing into existing hour rows
+    # instead of overwriting them
+    columns = f'{key}, date, hour' if key else 'date, hour'
+    return f"""
+        INSERT INTO {table} ({columns}, units, revenue, orders)
+        SELECT {columns}, SUM(quantity), SUM(amount), COUNT(DISTINCT order_id)
+        FROM lines GROUP BY {columns}
+        ON CONFLICT ({columns}) DO UPDATE
+        SET units = {table}.units + EXCLUDED.units, revenue = {table}.revenue + EXCLUDED.revenue,
+            orders = {table}.orders + EXCLUDED.orders
+        RETURNING 1
+    """
+
+def _rollup_sql(where):
+    # One set-based statement feeds all three rollups from a single scan of the
+    # matching order lines, bucketed by when each order was paid (when it was
+    # placed, for orders marked paid without a time); returns the number of
+    # rollup rows written
+    items, orders, products = OrderItem._meta.db_table, Order._meta.db_table, Product._meta.db_table
+    return f"""
+        WITH lines AS (
+            SELECT i.product_id, p.category_id, o.id AS order_id, i.quantity, i.price * i.quantity AS amount,
+                   (COALESCE(o.paid_at, o.created_at) AT TIME ZONE %s)::date AS date,
+                   EXTRACT(HOUR FROM COALESCE(o.paid_at, o.created_at) AT TIME ZONE %s)::smallint AS hour
+            FROM {items} i
+            JOIN {orders} o ON o.id = i.order_id
+            JOIN {products} p ON p.id = i.product_id
+            WHERE {where}
+        ),
+        product_rows AS ({_upsert_sql(ProductSales._meta.db_table, 'product_id')}),
+        category_rows AS ({_upsert_sql(CategorySales._meta.db_table, 'category_id')}),
+        store_rows AS ({_upsert_sql(StoreSales._meta.db_table)})
+        SELECT (SELECT COUNT(*) FROM product_rows) + (SELECT COUNT(*) FROM category_rows)
+             + (SELECT COUNT(*) FROM store_rows)
+    """
+
+def _run_rollup(where, params):
+    tz = timezone.get_current_timezone_name()
+    with connection.cursor() as cursor:
+        cursor.execute(_rollup_sql(where), [tz, tz, *params])
+        return cursor.fetchone()[0]
+
+def record_order_sales(order):
+    # created_at lets PostgreSQL prune to the order's partition
+    _run_rollup('o.id = %s AND o.created_at = %s', [order.pk, order.created_at])
+
+@transaction.atomic
+def mark_order_paid(order):
+    """
+    Marks an order paid, converts its stock holds, adds it to the sales
+    rollup and queues its confirmation email, exactly once: the conditional
+    UPDATE means a retried Stripe webhook (or a second admin save) is a no-op.
+    Returns True if this call flipped the order.
+    """
+    now = timezone.now()
+    flipped = Order.objects.filter(pk=order.pk, paid=False).update(paid=True, paid_at=now, updated_at=now)
+    order.paid = True
+    if flipped:
+        order.paid_at = now
+        short = convert_order_holds(order)
+        if short: # Paid for after its holds expired and the stock was sold
+            Order.objects.filter(pk=order.pk).update(short_of_stock=True)
+            order.short_of_stock = True
+            logger.error('Order %s paid but short of stock for products %s', order.pk, short)
+        record_order_sales(order)
+        invalidate_order_summary(order.user_id) # Lifetime spend counts paid orders
+        enqueue(send_order_confirmations, order_id=order.pk) # Committed with the order, or not at all
+    return bool(flipped)
+
+@transaction.atomic
+def rebuild_sales(since=None):
+    """
+    Recomputes the product, category and store rollups from paid orders'
+    OrderItems, for every day or only from `since` (a date of payment)
+    onwards. Returns the number of rollup rows written.
+    """
+    where, params = 'o.paid', []
+    for model in ROLLUP_MODELS:
+        stale = model.objects.all()
+        if since is not None:
+            stale = stale.filter(date__gte=since)
+        stale.delete()
+    if since is not None:
+        where += ' AND COALESCE(o.paid_at, o.created_at) >= %s' # Start of the local day
+        params.append(timezone.make_aware(datetime.datetime.combine(since, datetime.time())))
+    return _run_rollup(where, params)
+
+def top_products(limit=PRODUCT_PAGE_SIZE, days=BESTSELLER_DAYS):
+    # Served by product_sales_date_idx: a range over the last `days` days only
+    since = timezone.localdate() - datetime.timedelta(days=days - 1)
+    ranking = list(
+        ProductSales.objects.filter(date__gte=since, product__available=True)
+        .values('product_id').annotate(sold=Sum('units'))
+        .order_by('-sold', 'product_id').values_list('product_id', flat=True)[:limit]
+    )
+    products = Product.objects.in_bulk(ranking)
+    return [products[pk] for pk in ranking]
+
+def get_bestsellers():
+    # Keyed under the catalog version so product edits drop it at once; new
+    # sales show up when the short timeout expires. With no sales in the
+    # window (a new store), the newest in-stock products fill the slider.
+    key = catalog_key('bestsellers')
+    products = cache.get(key)
+    if products is None:
+        products = top_products() or list(
+            Product.objects.filter(available=True, stock__gt=0).order_by('-created_at', '-id')[:PRODUCT_PAGE_SIZE]
+        )
+        cache.set(key, products, BESTSELLER_TIMEOUT)
+    return products
+
+def _with_basket(row):
+    # Average basket: revenue per paid order in the row's scope
+    row['basket'] = (row['revenue'] / row['orders']).quantize(Decimal('0.01')) if row['orders'] else Decimal('0.00')
+    return row
+
+def _empty(**row):
+    return _with_basket({'units': 0, 'revenue': Decimal('0.00'), 'orders': 0, **row})
+
+def sales_report(days=30, limit=10):
+    """
+    Sales figures for the admin dashboard over the last `days` days, read from
+    the rollups only: {'since', 'until', 'totals', 'daily', 'hourly' (today),
+    'categories', 'products'}. Every row carries units, revenue, orders and
+    basket; 'daily' and 'hourly' have a row for every day and hour, sold or not.
+    """
+    until = timezone.localdate()
+    since = until - datetime.timedelta(days=days - 1)
+    store = StoreSales.objects.filter(date__gte=since).order_by()
+    totals = {'units': Sum('units'), 'revenue': Sum('revenue'), 'orders': Sum('orders')}
+
+    by_day = {row['date']: row for row in store.values('date').annotate(**totals)}
+    by_hour = {row['hour']: row for row in store.filter(date=until).values('hour', 'units', 'revenue', 'orders')}
+    summary = store.aggregate(**totals)
+    categories = (
+        CategorySales.objects.filter(date__gte=since).order_by()
+        .values('category_id', 'category__name').annotate(**totals).order_by('-revenue', 'category_id')
+    )
+    products = (
+        ProductSales.objects.filter(date__gte=since).order_by()
+        .values('product_id', 'product__name').annotate(**totals).order_by('-revenue', 'product_id')[:limit]
+    )
+    return {
+        'since': since,
+        'until': until,
+        'totals': _with_basket({key: value or 0 for key, value in summary.items()}),
+        'daily': [
+            _with_basket(by_day[day]) if day in by_day else _empty(date=day)
+            for day in (since + datetime.timedelta(days=n) for n in range(days))
+        ],
+        'hourly': [_with_basket(by_hour[hour]) if hour in by_hour else _empty(hour=hour) for hour in range(24)],
+        'categories': [_with_basket(row) for row in categories],
+        'products': [_with_basket(row) for row in products],
+    }
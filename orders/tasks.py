@@ -0,0 +1,37 @@
+# FreshCart/orders/tasks.py
+# Background jobs for paid orders, run by manage.py run_worker.
+
+from django.core.mail import EmailMessage, get_connection
+from django.db.models import Prefetch
+from django.template.loader import render_to_string
+from jobs.queue import task
+from .models import Order, OrderItem
+
+CONFIRMATION_BATCH_SIZE = 50 # Emails sent per SMTP session
+
+@task(batch_size=CONFIRMATION_BATCH_SIZE)
+def send_order_confirmations(payloads):
+    # One SMTP connection for the whole batch; each message is sent on its
+    # own so a rejected address only fails (and retries) that order's job
+    orders = Order.objects.prefetch_related(
+        Prefetch('items', queryset=OrderItem.objects.select_related('product')),
+    ).in_bulk([payload['order_id'] for payload in payloads])
+    errors = []
+    with get_connection() as connection:
+        for payload in payloads:
+            order = orders.get(payload['order_id'])
+            if order is None: # Deleted since it was paid; nothing to confirm
+                errors.append(None)
+                continue
+            message = EmailMessage(
+                subject=f'FreshCart order {order.id} confirmed',
+                body=render_to_string('orders/emails/order_confirmation.txt', {'order': order}),
+                to=[order.email],
+                connection=connection,
+            )
+            try:
+                message.send()
+                errors.append(None)
+            except Exception as e:
+                errors.append(e)
+    return errors
@@ -1,12 +1,40 @@
 # FreshCart/orders/tests.py
 # Example tests for the orders app.
 
-from django.test import TestCase, Client
+import datetime
+import io
+import os
+import shutil
+import smtplib
+import subprocess
+import tempfile
+import threading
+import time
+from decimal import Decimal
+from unittest import mock, skipUnless
+from django.core import mail
+from django.core.cache import cache
+from django.core.mail import EmailMessage, get_connection
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db.models import Sum
+from django.test import TestCase, TransactionTestCase, Client
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 from django.contrib.auth import get_user_model
 from products.models import Product, Category
+from jobs.models import Job
+from jobs.queue import work_once
 from cart.models import Cart, CartItem
-from .models import Order, OrderItem
+from products.catalog import get_catalog_version
+from . import partitions
+from .checkout import place_order
+from .history import get_order_summary
+from .idempotency import IDEMPOTENCY_CLAIM_TIMEOUT, run_once, stored_result
+from .models import CategorySales, IdempotencyKey, Order, OrderItem, ProductSales, StockHold, StoreSales
+from .reservations import OutOfStock, release_expired_holds, renew_order_holds, reserve_cart
+from .sales import get_bestsellers, mark_order_paid, rebuild_sales, sales_report, top_products
 
 User = get_user_model()
 
@@ -48,6 +76,16 @@ class OrderModelTest(TestCase):
     def test_order_str(self):
         self.assertEqual(str(self.order), f'Order {self.order.id}')
 
+    def test_order_totals_check(self):
+        with self.assertRaises(CommandError): # Items were added without updating the totals
+            call_command('check_order_totals', stdout=io.StringIO())
+        call_command('check_order_totals', '--fix', stdout=io.StringIO())
+        self.order.refresh_from_db()
+        self.assertEqual((self.order.item_count, self.order.subtotal), (5, 350))
+        out = io.StringIO()
+        call_command('check_order_totals', stdout=out)
+        self.assertIn('All order totals match', out.getvalue())
+
 class OrderViewTest(TestCase):
     def setUp(self):
         self.client = Client()
@@ -90,11 +128,16 @@ class OrderViewTest(TestCase):
         order = Order.objects.get(user=self.user, first_name='Jane')
         self.assertEqual(order.items.count(), 2)
         self.assertEqual(order.get_total_cost(), 2 * 100 + 1 * 50) # 250
+        self.assertEqual((order.item_count, order.subtotal), (3, 250))
 
         # Check if cart is cleared
         self.assertEqual(self.cart.items.count(), 0)
 
-        # Check if product stock is reduced
+        # Stock is held for the order, and taken once it is paid
+        self.assertEqual(dict(order.stock_holds.values_list('product_id', 'quantity')),
+                         {self.product1.id: 2, self.product2.id: 1})
+        mark_order_paid(order)
+        self.assertFalse(order.stock_holds.exists())
         self.product1.refresh_from_db()
         self.product2.refresh_from_db()
         self.assertEqual(self.product1.stock, initial_stock_p1 - 2)
@@ -108,6 +151,20 @@ class OrderViewTest(TestCase):
         messages = list(response.wsgi_request._messages)
         self.assertEqual(str(messages[0]), "Your cart is empty. Please add items before checking out.")
 
+    def test_order_create_resubmit_returns_first_order(self):
+        response = self.client.get(reverse('orders:order_create'))
+        key = response.context['form']['idempotency_key'].value()
+        self.assertContains(response, f'<input type="hidden" name="idempotency_key" value="{key}"')
+        data = {**self.order_data, 'idempotency_key': key}
+        first = self.client.post(reverse('orders:order_create'), data)
+        order = Order.objects.get(user=self.user)
+        with self.assertNumQueries(2): # The user, then the stored result; the cart is empty by now
+            second = self.client.post(reverse('orders:order_create'), data)
+        for response in (first, second):
+            self.assertRedirects(response, reverse('payments:process_payment', args=[order.id]),
+                                 fetch_redirect_response=False)
+        self.assertEqual(Order.objects.count(), 1)
+
     def test_order_history_view(self):
         # Create a paid order
         Order.objects.create(
@@ -128,8 +185,585 @@ class OrderViewTest(TestCase):
         self.assertContains(response, 'Paid Order')
         self.assertContains(response, 'Unpaid Order')
 
+    def test_order_history_reads_stored_totals(self):
+        for i in range(30):
+            order = Order.objects.create(user=self.user, first_name='Jane', last_name='Doe', email='jane@example.com',
+                                         address='1 Oak Ave', postal_code='54321', city='Anotherville')
+            OrderItem.objects.create(order=order, product=self.product1, price=100, quantity=i + 1)
+            order.update_totals()
+        self.client.get(reverse('orders:order_history')) # Warms the cart badge summary
+        with self.assertNumQueries(2): # User, orders
+            response = self.client.get(reverse('orders:order_history'))
+        self.assertContains(response, '₹3000.00')
+
     def test_order_history_view_no_orders(self):
         Order.objects.filter(user=self.user).delete() # Ensure no orders for this user
         response = self.client.get(reverse('orders:order_history'))
         self.assertEqual(response.status_code, 200)
         self.assertContains(response, 'You have no past orders.')
+
+    def test_order_create_out_of_stock_writes_nothing(self):
+        Product.objects.filter(pk=self.product2.pk).update(stock=0)
+        response = self.client.post(reverse('orders:order_create'), self.order_data)
+        self.assertRedirects(response, reverse('cart:cart_detail'), fetch_redirect_response=False)
+        self.assertEqual([str(m) for m in response.wsgi_request._messages],
+                         ["Not enough stock for Orange. Available: 0"])
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(self.cart.items.count(), 2) # Cart kept for the customer to fix
+        self.product1.refresh_from_db()
+        self.assertEqual(self.product1.stock, 10)
+
+class CheckoutTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.category = Category.objects.create(name='Fruits', slug='fruits')
+
+    def _cart(self, count, stock=5, quantity=2):
+        cart = Cart.objects.create(user=self.user)
+        for i in range(count):
+            product = Product.objects.create(category=self.category, name=f'Fruit {i}', slug=f'fruit-{i}', price=10, stock=stock)
+            CartItem.objects.create(cart=cart, product=product, quantity=quantity)
+        return Cart.objects.get(pk=cart.pk)
+
+    def _order(self):
+        return Order(user=self.user, first_name='Jane', last_name='Doe', email='jane@example.com',
+                     address='1 Oak Ave', postal_code='54321', city='Anotherville')
+
+    def test_query_count_does_not_grow_with_the_cart(self):
+        # Savepoint, lines, lock, holds, order, items, old holds, new holds, cart delete, cart summary, release
+        small = self._cart(2)
+        with self.assertNumQueries(11) as small_queries:
+            place_order(self._order(), small)
+        Cart.objects.all().delete()
+        Product.objects.all().delete()
+        large = self._cart(40)
+        with self.assertNumQueries(11):
+            order = place_order(self._order(), large)
+        self.assertEqual(order.items.count(), 40)
+        self.assertEqual(order.get_total_cost(), 800)
+        self.assertEqual(order.stock_holds.count(), 40)
+        with self.assertNumQueries(11): # Paying takes the stock in one UPDATE too
+            mark_order_paid(order)
+        self.assertFalse(Product.objects.exclude(stock=3).exists())
+        self.assertEqual((large.item_count, large.items.count()), (0, 0))
+        self.assertIn('FOR UPDATE', small_queries.captured_queries[2]['sql'])
+
+    def test_every_short_line_is_reported(self):
+        cart = self._cart(3, stock=1)
+        with self.assertRaises(OutOfStock) as raised:
+            place_order(self._order(), cart)
+        self.assertEqual(raised.exception.problems, [
+            f"Not enough stock for Fruit {i}. Available: 1" for i in range(3)
+        ])
+        self.assertFalse(Order.objects.exists())
+
+    def test_selling_out_refreshes_catalog_caches(self):
+        cart = self._cart(1, stock=2)
+        version = get_catalog_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            mark_order_paid(place_order(self._order(), cart))
+        self.assertEqual(Product.objects.get().stock, 0)
+        self.assertNotEqual(get_catalog_version(), version)
+
+    def test_taking_stock_invalidates_the_api_list_etag(self):
+        cart = self._cart(1, stock=5)
+        url = reverse('catalog_api:product_list')
+        etag = self.client.get(url)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            mark_order_paid(place_order(self._order(), cart))
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'][0]['stock'], 3)
+
+class OrderHistoryTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.client.login(username='testuser', password='testpassword')
+        self.category = Category.objects.create(name='Fruits', slug='fruits')
+        self.apple = Product.objects.create(category=self.category, name='Apple', slug='apple', price=100, stock=50)
+
+    def _order(self, user=None, quantity=1):
+        order = Order.objects.create(user=user or self.user, first_name='Jane', last_name='Doe', email='jane@example.com',
+                                     address='1 Oak Ave', postal_code='54321', city='Anotherville')
+        OrderItem.objects.create(order=order, product=self.apple, price=100, quantity=quantity)
+        order.update_totals()
+        return order
+
+    def test_history_pages_by_keyset(self):
+        orders = [self._order() for _ in range(25)]
+        # Same timestamp down to the microsecond for some, so the id tiebreaker matters
+        Order.objects.filter(pk__in=[o.pk for o in orders[10:]]).update(created_at=timezone.now())
+        response = self.client.get(reverse('orders:order_history'))
+        first = response.context['orders']
+        self.assertEqual(len(first), 20)
+        response = self.client.get(reverse('orders:order_history'), {'cursor': response.context['next_cursor']})
+        second = response.context['orders']
+        self.assertIsNone(response.context['next_cursor'])
+        self.assertEqual([o.pk for o in first + second],
+                         list(Order.objects.order_by('-created_at', '-id').values_list('pk', flat=True)))
+        self.assertEqual(self.client.get(reverse('orders:order_history'), {'cursor': 'junk'}).status_code, 400)
+
+    def test_summary_is_cached_and_invalidated(self):
+        self._order(quantity=2)
+        self.assertEqual(get_order_summary(self.user), {'order_count': 1, 'total_spent': 0})
+        with self.assertNumQueries(0):
+            get_order_summary(self.user)
+
+        cart = Cart.objects.create(user=self.user)
+        CartItem.objects.create(cart=cart, product=self.apple, quantity=3)
+        with self.captureOnCommitCallbacks(execute=True):
+            order = place_order(Order(user=self.user, first_name='Jane', last_name='Doe', email='jane@example.com',
+                                      address='1 Oak Ave', postal_code='54321', city='Anotherville'), cart)
+        self.assertEqual(get_order_summary(self.user)['order_count'], 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            mark_order_paid(order)
+        self.assertEqual(get_order_summary(self.user), {'order_count': 2, 'total_spent': 300})
+        self.assertContains(self.client.get(reverse('orders:order_history')), '₹300.00')
+
+    def test_order_detail(self):
+        order = self._order(quantity=2)
+        self.client.get(reverse('orders:order_detail', args=[order.id])) # Warms the cart badge summary
+        with self.assertNumQueries(3): # User, order, items with their products
+            response = self.client.get(reverse('orders:order_detail', args=[order.id]))
+        self.assertContains(response, 'Apple (x2 at ₹100.00)')
+        self.assertContains(response, '₹200.00')
+        other = User.objects.create_user(username='other', password='testpassword')
+        response = self.client.get(reverse('orders:order_detail', args=[self._order(user=other).id]))
+        self.assertEqual(response.status_code, 404)
+
+class StockReservationTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.other = User.objects.create_user(username='other', password='testpassword')
+        self.category = Category.objects.create(name='Fruits', slug='fruits')
+        self.apple = Product.objects.create(category=self.category, name='Apple', slug='apple', price=100, stock=5)
+        self.cart = Cart.objects.create(user=self.user)
+        CartItem.objects.create(cart=self.cart, product=self.apple, quantity=4)
+
+    def test_checkout_holds_stock_for_others(self):
+        self.client.login(username='testuser', password='testpassword')
+        self.client.get(reverse('orders:order_create'))
+        self.assertEqual(dict(self.cart.stock_holds.values_list('product_id', 'quantity')), {self.apple.id: 4})
+        self.client.get(reverse('orders:order_create')) # Reloading renews rather than doubles the hold
+        self.assertEqual(StockHold.objects.get().quantity, 4)
+
+        self.client.login(username='other', password='testpassword')
+        response = self.client.post(reverse('cart:add_to_cart', args=[self.apple.id]), {'quantity': 2})
+        self.assertEqual([str(m) for m in response.wsgi_request._messages], ["Not enough stock for Apple. Available: 1"])
+
+    def test_held_stock_blocks_checkout(self):
+        other_cart = Cart.objects.create(user=self.other)
+        CartItem.objects.create(cart=other_cart, product=self.apple, quantity=2)
+        reserve_cart(other_cart)
+        with self.assertRaises(OutOfStock) as raised:
+            reserve_cart(Cart.objects.get(pk=self.cart.pk))
+        self.assertEqual(raised.exception.problems, ["Not enough stock for Apple. Available: 3"])
+
+    def test_expired_holds_are_ignored_and_released(self):
+        StockHold.objects.create(product=self.apple, quantity=5, expires_at=timezone.now() - datetime.timedelta(seconds=1))
+        reserve_cart(self.cart) # The expired hold doesn't count
+        self.assertEqual(release_expired_holds(batch_size=1), 1)
+        self.assertEqual(list(StockHold.objects.values_list('cart_id', flat=True)), [self.cart.id])
+        call_command('release_stock_holds', stdout=io.StringIO())
+
+    def _expired_order(self):
+        # Placed, then left unpaid until its payment holds expired
+        order = place_order(Order(user=self.user, first_name='Jane', last_name='Doe', email='jane@example.com',
+                                  address='1 Oak Ave', postal_code='54321', city='Anotherville'), self.cart)
+        order.stock_holds.update(expires_at=timezone.now() - datetime.timedelta(seconds=1))
+        return order
+
+    def test_renewing_an_order_refuses_stock_sold_meanwhile(self):
+        order = self._expired_order()
+        renew_order_holds(order) # Still there: held again
+        self.assertGreater(StockHold.objects.get(order=order).expires_at, timezone.now())
+
+        order.stock_holds.update(expires_at=timezone.now() - datetime.timedelta(seconds=1))
+        other_cart = Cart.objects.create(user=self.other)
+        CartItem.objects.create(cart=other_cart, product=self.apple, quantity=5)
+        mark_order_paid(place_order(Order(user=self.other, first_name='B', last_name='B', email='b@example.com',
+                                          address='2 St', postal_code='1', city='C'), other_cart))
+        with self.assertRaises(OutOfStock) as raised:
+            renew_order_holds(order)
+        self.assertEqual(raised.exception.problems, ["Not enough stock for Apple. Available: 0"])
+
+    def test_paying_without_stock_flags_the_order(self):
+        order = self._expired_order()
+        Product.objects.filter(pk=self.apple.pk).update(stock=1) # Sold elsewhere once the holds lapsed
+        with self.assertLogs('orders.sales', 'ERROR') as logs:
+            mark_order_paid(order)
+        order.refresh_from_db()
+        self.assertTrue(order.paid and order.short_of_stock)
+        self.assertEqual(Product.objects.get(pk=self.apple.pk).stock, 1) # Never oversold
+        self.assertIn(f'Order {order.pk} paid but short of stock', logs.output[0])
+
+class OrderPartitionTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.category = Category.objects.create(name='Fruits', slug='fruits')
+        self.apple = Product.objects.create(category=self.category, name='Apple', slug='apple', price=100, stock=50)
+
+    def _order(self, created_at=None):
+        order = Order.objects.create(user=self.user, first_name='Jane', last_name='Doe', email='jane@example.com',
+                                     address='1 Oak Ave', postal_code='54321', city='Anotherville')
+        OrderItem.objects.create(order=order, product=self.apple, price=100, quantity=1)
+        if created_at:
+            Order.objects.filter(pk=order.pk).update(created_at=created_at) # Moves the row to that month's partition
+        return order
+
+    def _partition_of(self, order):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT tableoid::regclass::text FROM orders_order WHERE id = %s", [order.pk])
+            return cursor.fetchone()[0]
+
+    def test_orders_land_in_monthly_partitions(self):
+        order = self._order()
+        self.assertEqual(self._partition_of(order), partitions.partition_name(partitions.current_month()))
+        self.assertEqual(Order.objects.get(pk=order.pk).items.count(), 1)
+
+    def test_command_creates_partitions_ahead(self):
+        call_command('order_partitions', '--ahead', '6', stdout=io.StringIO())
+        months = partitions.list_partitions()
+        for offset in range(7):
+            self.assertIn(partitions.add_months(partitions.current_month(), offset), months)
+
+    def test_old_partitions_are_detached_with_their_items(self):
+        old_month = partitions.add_months(partitions.current_month(), -30)
+        partitions.create_partition(old_month)
+        old = self._order(datetime.datetime(old_month.year, old_month.month, 15, tzinfo=datetime.timezone.utc))
+        recent = self._order()
+        call_command('order_partitions', '--archive-after', '24', '--detach-only', stdout=io.StringIO())
+
+        self.assertEqual(list(Order.objects.values_list('pk', flat=True)), [recent.pk])
+        self.assertEqual(list(OrderItem.objects.values_list('order_id', flat=True)), [recent.pk])
+        self.assertNotIn(old_month, partitions.list_partitions())
+        name = partitions.partition_name(old_month)
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT count(*) FROM {name}_items WHERE order_id = %s", [old.pk])
+            self.assertEqual(cursor.fetchone()[0], 1)
+        with self.assertRaises(CommandError): # Archiving needs somewhere to put the dump
+            call_command('order_partitions', '--archive-after', '24', stdout=io.StringIO())
+
+    def test_months_with_stranded_orders_are_skipped(self):
+        month = partitions.add_months(partitions.current_month(), 12) # No partition yet
+        self._order(datetime.datetime(month.year, month.month, 3, tzinfo=datetime.timezone.utc))
+        out = io.StringIO()
+        call_command('order_partitions', '--ahead', '13', stdout=out)
+        self.assertIn(f'1 order(s) from {month:%Y-%m} fell into the default partition', out.getvalue())
+        months = partitions.list_partitions()
+        self.assertNotIn(month, months)
+        self.assertIn(partitions.add_months(month, 1), months)
+
+    def test_failed_dump_reattaches_the_partition(self):
+        old_month = partitions.add_months(partitions.current_month(), -30)
+        partitions.create_partition(old_month)
+        old = self._order(datetime.datetime(old_month.year, old_month.month, 15, tzinfo=datetime.timezone.utc))
+        with tempfile.TemporaryDirectory() as archive_dir, \
+                mock.patch('orders.partitions._pg_dump', side_effect=subprocess.CalledProcessError(1, 'pg_dump')):
+            with self.assertRaisesMessage(CommandError, 'it was re-attached'):
+                call_command('order_partitions', '--archive-after', '24', '--archive-dir', archive_dir, stdout=io.StringIO())
+        self.assertIn(old_month, partitions.list_partitions())
+        self.assertEqual(Order.objects.get(pk=old.pk).items.count(), 1)
+        self.assertNotIn(f'{partitions.partition_name(old_month)}_items', connection.introspection.table_names())
+
+@skipUnless(shutil.which('pg_dump'), 'pg_dump is not installed')
+class OrderArchiveTest(TransactionTestCase):
+    # pg_dump reads from its own connection, so the data has to be committed
+    def test_archive_dumps_and_drops_old_partition(self):
+        user = User.objects.create_user(username='testuser', password='testpassword')
+        old_month = partitions.add_months(partitions.current_month(), -30)
+        partitions.create_partition(old_month)
+        order = Order.objects.create(user=user)
+        Order.objects.filter(pk=order.pk).update(created_at=datetime.datetime(old_month.year, old_month.month, 2, tzinfo=datetime.timezone.utc))
+        with tempfile.TemporaryDirectory() as archive_dir:
+            call_command('order_partitions', '--archive-after', '24', '--archive-dir', archive_dir, stdout=io.StringIO())
+            name = partitions.partition_name(old_month)
+            self.assertTrue(os.path.getsize(os.path.join(archive_dir, f'{name}.dump')) > 0)
+        self.assertFalse(Order.objects.exists())
+        self.assertNotIn(name, connection.introspection.table_names())
+
+class SalesRollupTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.category = Category.objects.create(name='Fruits', slug='fruits')
+        self.apple = Product.objects.create(category=self.category, name='Apple', slug='apple', price=100, stock=50)
+        self.mango = Product.objects.create(category=self.category, name='Mango', slug='mango', price=80, stock=50)
+        self.kiwi = Product.objects.create(category=self.category, name='Kiwi', slug='kiwi', price=60, stock=50)
+
+    def _order(self, *lines, paid=False):
+        order = Order.objects.create(
+            user=self.user, first_name='A', last_name='B', email='a@example.com',
+            address='1 St', postal_code='1', city='C', paid=paid,
+        )
+        for product, quantity in lines:
+            OrderItem.objects.create(order=order, product=product, price=product.price, quantity=quantity)
+        return order
+
+    def _rollup(self, model=ProductSales, key='product_id'):
+        # Per-key totals, whichever hours the orders fell in
+        rows = model.objects.values(key).annotate(u=Sum('units'), r=Sum('revenue'), o=Sum('orders'))
+        return {(row[key], row['u'], row['r'], row['o']) for row in rows}
+
+    def test_paid_orders_accumulate_once(self):
+        first = self._order((self.apple, 2), (self.mango, 1))
+        second = self._order((self.apple, 3))
+        self.assertTrue(mark_order_paid(first))
+        self.assertFalse(mark_order_paid(first)) # Webhook retry
+        mark_order_paid(second)
+        self.assertEqual(self._rollup(), {(self.apple.id, 5, 500, 2), (self.mango.id, 1, 80, 1)})
+        self._order((self.kiwi, 9)) # Unpaid orders never count
+        self.assertFalse(ProductSales.objects.filter(product=self.kiwi).exists())
+
+    def test_rebuild_matches_incremental_rollup(self):
+        mark_order_paid(self._order((self.apple, 2), (self.mango, 1)))
+        self._order((self.kiwi, 4), paid=True) # Paid outside mark_order_paid, e.g. by an old import
+        incremental = self._rollup(), self._rollup(CategorySales, 'category_id'), self._rollup(StoreSales, 'date')
+        call_command('rebuild_sales_rollup', stdout=io.StringIO())
+        self.assertEqual(self._rollup(), incremental[0] | {(self.kiwi.id, 4, 240, 1)})
+        self.assertEqual(self._rollup(CategorySales, 'category_id'), {(self.category.id, 7, 520, 2)})
+        self.assertEqual({row[1:] for row in self._rollup(StoreSales, 'date')}, {(7, 520, 2)})
+        self.assertNotEqual(incremental[1], self._rollup(CategorySales, 'category_id'))
+
+    def test_category_and_store_rollups(self):
+        veg = Category.objects.create(name='Vegetables', slug='vegetables')
+        carrot = Product.objects.create(category=veg, name='Carrot', slug='carrot', price=30, stock=50)
+        mark_order_paid(self._order((self.apple, 2), (self.mango, 1), (carrot, 1)))
+        mark_order_paid(self._order((self.kiwi, 1)))
+        # An order counts once per category it bought from, and once store-wide
+        self.assertEqual(self._rollup(CategorySales, 'category_id'), {(self.category.id, 4, 340, 2), (veg.id, 1, 30, 1)})
+        self.assertEqual({row[1:] for row in self._rollup(StoreSales, 'date')}, {(5, 370, 2)})
+        hour = StoreSales.objects.get()
+        now = timezone.localtime()
+        self.assertEqual((hour.date, hour.hour), (now.date(), now.hour))
+
+    def test_sales_are_bucketed_when_paid(self):
+        order = self._order((self.apple, 1))
+        placed = timezone.localtime() - datetime.timedelta(days=2)
+        Order.objects.filter(pk=order.pk).update(created_at=placed)
+        order.refresh_from_db()
+        mark_order_paid(order)
+        now = timezone.localtime()
+        self.assertEqual(list(StoreSales.objects.values_list('date', 'hour')), [(now.date(), now.hour)])
+        rebuild_sales()
+        self.assertEqual(list(ProductSales.objects.values_list('date', 'hour')), [(now.date(), now.hour)])
+        self.assertEqual(list(self.apple.hourly_sales.values_list('units', flat=True)), [1])
+
+    def test_rebuild_since_keeps_earlier_days(self):
+        old = self._order((self.apple, 1))
+        mark_order_paid(old)
+        three_days_ago = timezone.now() - datetime.timedelta(days=3)
+        Order.objects.filter(pk=old.pk).update(paid_at=three_days_ago)
+        mark_order_paid(self._order((self.mango, 2)))
+        ProductSales.objects.filter(product=self.apple).update( # Outside the rebuilt range
+            units=99, date=timezone.localtime(three_days_ago).date())
+        written = rebuild_sales(timezone.localdate())
+        self.assertEqual(written, 3)
+        self.assertEqual(self._rollup(), {(self.apple.id, 99, 100, 1), (self.mango.id, 2, 160, 1)})
+
+    def test_sales_report_reads_rollups_only(self):
+        mark_order_paid(self._order((self.apple, 2), (self.mango, 1)))
+        mark_order_paid(self._order((self.mango, 1)))
+        with CaptureQueriesContext(connection) as queries:
+            report = sales_report(days=7)
+        self.assertFalse([q for q in queries if OrderItem._meta.db_table in q['sql']])
+        self.assertEqual(report['totals'], {'units': 4, 'revenue': 360, 'orders': 2, 'basket': Decimal('180.00')})
+        self.assertEqual(len(report['daily']), 7)
+        self.assertEqual(report['daily'][-1]['orders'], 2)
+        self.assertEqual(report['daily'][0]['orders'], 0)
+        self.assertEqual(sum(row['orders'] for row in report['hourly']), 2)
+        self.assertEqual([row['product__name'] for row in report['products']], ['Apple', 'Mango'])
+        self.assertEqual(report['categories'][0]['basket'], Decimal('180.00'))
+
+    def test_admin_sales_dashboard(self):
+        mark_order_paid(self._order((self.apple, 1)))
+        url = reverse('admin:orders_order_sales')
+        self.client.login(username='testuser', password='testpassword')
+        self.assertEqual(self.client.get(url).status_code, 302) # Not staff
+        User.objects.create_superuser(username='admin', email='admin@example.com', password='adminpassword')
+        self.client.login(username='admin', password='adminpassword')
+        response = self.client.get(url, {'days': 7})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['days'], 7)
+        self.assertContains(response, '<strong id="sales-basket">₹100.00</strong>', html=True)
+        self.assertEqual(self.client.get(url, {'days': 'all'}).context['days'], 30)
+        self.assertContains(self.client.get(reverse('admin:orders_order_changelist')), url)
+
+    def test_bestsellers_ranking(self):
+        mark_order_paid(self._order((self.apple, 1), (self.mango, 4)))
+        mark_order_paid(self._order((self.kiwi, 2)))
+        self.assertEqual(top_products(), [self.mango, self.kiwi, self.apple])
+        self.assertEqual(top_products(limit=1), [self.mango])
+        self.mango.available = False
+        self.mango.save()
+        self.assertEqual(get_bestsellers(), [self.kiwi, self.apple])
+        with self.assertNumQueries(0):
+            get_bestsellers()
+
+    def test_bestsellers_fall_back_to_newest_in_stock(self):
+        self.mango.stock = 0
+        self.mango.save()
+        self.assertEqual(get_bestsellers(), [self.kiwi, self.apple]) # No sales yet
+        cache.clear()
+        mark_order_paid(self._order((self.apple, 1)))
+        self.assertEqual(get_bestsellers(), [self.apple])
+
+    def test_landing_page_shows_bestsellers(self):
+        mark_order_paid(self._order((self.kiwi, 2)))
+        self.client.login(username='testuser', password='testpassword')
+        response = self.client.get(reverse('landing_page'))
+        self.assertEqual(response.context['products'], [self.kiwi])
+
+class OrderConfirmationTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.category = Category.objects.create(name='Fruits', slug='fruits')
+        self.apple = Product.objects.create(category=self.category, name='Apple', slug='apple', price=100, stock=50)
+
+    def _order(self, email='a@example.com'):
+        order = Order.objects.create(
+            user=self.user, first_name='Asha', last_name='B', email=email,
+            address='1 St', postal_code='1', city='C', subtotal=200,
+        )
+        OrderItem.objects.create(order=order, product=self.apple, price=100, quantity=2)
+        return order
+
+    def test_paying_queues_one_confirmation(self):
+        order = self._order()
+        mark_order_paid(order)
+        mark_order_paid(order) # Webhook retry
+        job = Job.objects.get()
+        self.assertEqual((job.name, job.payload), ('orders.tasks.send_order_confirmations', {'order_id': order.id}))
+        self.assertEqual(mail.outbox, []) # Sent by the worker, not the webhook
+
+    def test_confirmations_share_one_connection(self):
+        orders = [self._order(f'buyer{n}@example.com') for n in range(3)]
+        for order in orders:
+            mark_order_paid(order)
+        with mock.patch('orders.tasks.get_connection', wraps=get_connection) as connect:
+            self.assertEqual(work_once(), 3)
+        connect.assert_called_once()
+        self.assertEqual(sorted(m.to[0] for m in mail.outbox), [order.email for order in orders])
+        message = mail.outbox[0]
+        self.assertEqual(message.subject, f'FreshCart order {orders[0].id} confirmed')
+        self.assertIn('2 x Apple at ₹100.00 = ₹200.00', message.body)
+        self.assertIn('Total: ₹200.00', message.body)
+        self.assertFalse(Job.objects.exists())
+
+    def test_failed_send_retries_only_that_order(self):
+        ok, bad = self._order('ok@example.com'), self._order('bad@example.com')
+        mark_order_paid(ok)
+        mark_order_paid(bad)
+        real_send = EmailMessage.send
+        def send(message, *args, **kwargs):
+            if message.to == ['bad@example.com']:
+                raise smtplib.SMTPRecipientsRefused({'bad@example.com': (550, b'No such user')})
+            return real_send(message, *args, **kwargs)
+        with mock.patch.object(EmailMessage, 'send', send):
+            work_once()
+        self.assertEqual([m.to for m in mail.outbox], [['ok@example.com']])
+        job = Job.objects.get()
+        self.assertEqual((job.payload, job.status, job.attempts), ({'order_id': bad.id}, Job.QUEUED, 1))
+        self.assertIn('SMTPRecipientsRefused', job.last_error)
+
+def _idempotent_action(calls, result):
+    def action():
+        calls.append(result)
+        return result
+    return action
+
+class IdempotencyKeyTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.other = User.objects.create_user(username='other', password='testpassword')
+
+    def test_repeat_returns_stored_result(self):
+        calls = []
+        self.assertEqual(run_once('test', 'k1', self.user, _idempotent_action(calls, {'n': 1})), ({'n': 1}, True))
+        self.assertEqual(run_once('test', 'k1', self.user, _idempotent_action(calls, {'n': 2})), ({'n': 1}, False))
+        self.assertEqual(run_once('test', 'k1', self.other, _idempotent_action(calls, {'n': 3}))[0], {'n': 3})
+        self.assertEqual(run_once('test', '', self.user, _idempotent_action(calls, {'n': 4}))[0], {'n': 4})
+        self.assertEqual(calls, [{'n': 1}, {'n': 3}, {'n': 4}])
+        self.assertEqual(stored_result('test', 'k1', self.user), {'n': 1})
+        self.assertIsNone(stored_result('other', 'k1', self.user))
+
+    def test_failed_action_is_not_stored(self):
+        def fail():
+            raise OutOfStock(['Apple: only 1 left.'])
+        with self.assertRaises(OutOfStock):
+            run_once('test', 'k1', self.user, fail)
+        self.assertFalse(IdempotencyKey.objects.exists())
+        self.assertEqual(run_once('test', 'k1', self.user, lambda: 'ok'), ('ok', True))
+
+    def test_expired_keys_run_again_and_are_purged(self):
+        calls = []
+        run_once('test', 'k1', self.user, _idempotent_action(calls, 1))
+        run_once('test', 'k2', self.user, _idempotent_action(calls, 2))
+        IdempotencyKey.objects.filter(key='k1').update(expires_at=timezone.now())
+        self.assertIsNone(stored_result('test', 'k1', self.user))
+        self.assertEqual(run_once('test', 'k1', self.user, _idempotent_action(calls, 3)), (3, True))
+        self.assertEqual(calls, [1, 2, 3])
+
+        IdempotencyKey.objects.filter(key='k2').update(expires_at=timezone.now())
+        out = io.StringIO()
+        call_command('purge_idempotency_keys', stdout=out)
+        self.assertIn('Purged 1 expired idempotency key(s).', out.getvalue())
+        self.assertEqual(list(IdempotencyKey.objects.values_list('key', flat=True)), ['k1'])
+
+    def test_unfinished_claim_lapses(self):
+        def fail():
+            raise RuntimeError('Stripe timed out')
+        with self.assertRaises(RuntimeError):
+            run_once('test', 'k1', self.user, fail, atomic=False)
+        self.assertFalse(IdempotencyKey.objects.exists()) # A retry may run at once
+
+        IdempotencyKey.objects.create(user=self.user, scope='test', key='k1', created_at=timezone.now(),
+                                      expires_at=timezone.now() + IDEMPOTENCY_CLAIM_TIMEOUT) # Its process died
+        self.assertEqual(run_once('test', 'k1', self.user, lambda: 'ok', atomic=False), (None, False))
+        IdempotencyKey.objects.update(expires_at=timezone.now())
+        self.assertEqual(run_once('test', 'k1', self.user, lambda: 'ok', atomic=False), ('ok', True))
+        self.assertGreater(IdempotencyKey.objects.get().expires_at, timezone.now() + IDEMPOTENCY_CLAIM_TIMEOUT)
+
+class ConcurrentIdempotencyTest(TransactionTestCase):
+    def test_concurrent_repeat_waits_for_first(self):
+        user = User.objects.create_user(username='testuser', password='testpassword')
+        calls, results, started = [], [], threading.Event()
+        def slow():
+            started.set()
+            time.sleep(0.3) # Still running when the repeat arrives
+            calls.append(1)
+            return {'order_id': 7}
+        def attempt(action):
+            try:
+                results.append(run_once('checkout', 'k1', user, action))
+            finally:
+                connection.close()
+        first = threading.Thread(target=attempt, args=(slow,))
+        first.start()
+        started.wait()
+        second = threading.Thread(target=attempt, args=(lambda: calls.append(2) or {'order_id': 8},))
+        second.start()
+        first.join()
+        second.join()
+        self.assertEqual(calls, [1])
+        self.assertEqual(sorted(results, key=lambda r: not r[1]), [({'order_id': 7}, True), ({'order_id': 7}, False)])
+
+    def test_non_atomic_claim_is_committed_before_the_action(self):
+        user = User.objects.create_user(username='testuser', password='testpassword')
+        seen = []
+        def slow():
+            # Another connection sees the claim, and a repeat returns without waiting on it
+            def repeat():
+                try:
+                    seen.append(run_once('payment_intent', 'k1', user, lambda: 'second', atomic=False))
+                finally:
+                    connection.close()
+            thread = threading.Thread(target=repeat)
+            thread.start()
+            thread.join(5)
+            return {'id': 'pi_1'}
+        self.assertEqual(run_once('payment_intent', 'k1', user, slow, atomic=False), ({'id': 'pi_1'}, True))
+        self.assertEqual(seen, [(None, False)])
+        self.assertEqual(stored_result('payment_intent', 'k1', user), {'id': 'pi_1'})
@@ -9,5 +9,6 @@ app_name = 'orders' # Namespace for orders URLs
 urlpatterns = [
     path('create/', views.order_create, name='order_create'),
     path('history/', views.order_history, name='order_history'),
+    path('<int:order_id>/', views.order_detail, name='order_detail'),
 ]
 
@@ -1,17 +1,31 @@
 # FreshCart/orders/views.py
 # Handles order creation and history.
 
+import uuid
+from django.db.models import Prefetch
+from django.http import HttpResponseBadRequest
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from cart.models import Cart # Make sure Cart is imported
+from cart.store import get_cart
+from .checkout import place_order
+from products.pagination import InvalidCursor
+from .history import get_order_summary, order_page
+from .idempotency import run_once, stored_result
 from .models import Order, OrderItem
+from .reservations import OutOfStock, reserve_cart
 from .forms import OrderCreateForm # Now importing actual form
 
 @login_required
 def order_create(request):
-    # Ensure the user has a cart, or create an empty one if not
-    cart, created = Cart.objects.get_or_create(user=request.user)
+    if request.method == 'POST':
+        placed = stored_result('checkout', request.POST.get('idempotency_key'), request.user)
+        if placed: # A resubmitted form: show the order it already placed
+            return redirect('payments:process_payment', order_id=placed['order_id'])
+
+    # Checkout writes the Redis cart through to Cart/CartItem (cart/store.py)
+    stored_cart = get_cart(request)
+    cart = stored_cart.persist()
 
     if not cart.items.exists():
         messages.warning(request, "Your cart is empty. Please add items before checking out.")
@@ -22,30 +36,35 @@ def order_create(request):
         if form.is_valid():
             order = form.save(commit=False)
             order.user = request.user
-            order.save()
-
-            for item in cart.items.all():
-                OrderItem.objects.create(
-                    order=order,
-                    product=item.product,
-                    price=item.product.price, # Capture price at time of order
-                    quantity=item.quantity
+            try:
+                # A concurrent double submit waits here and gets the first one's order
+                placed, fresh = run_once(
+                    'checkout', form.cleaned_data['idempotency_key'], request.user,
+                    lambda: {'order_id': place_order(order, cart).id},
                 )
-                # Reduce product stock
-                item.product.stock -= item.quantity
-                item.product.save()
-
-            cart.items.all().delete() # Clear the cart after order creation
-            messages.success(request, f"Order {order.id} created successfully. Proceed to payment.")
-            return redirect('payments:process_payment', order_id=order.id)
+            except OutOfStock as e:
+                for problem in e.problems: # One message per cart line to fix
+                    messages.error(request, problem)
+                return redirect('cart:cart_detail')
+            if fresh:
+                stored_cart.clear()
+                messages.success(request, f"Order {placed['order_id']} created successfully. Proceed to payment.")
+            return redirect('payments:process_payment', order_id=placed['order_id'])
         else:
             messages.error(request, "Please correct the errors in the order form.")
     else:
+        try:
+            reserve_cart(cart) # Hold the stock while the customer fills in the form
+        except OutOfStock as e:
+            for problem in e.problems:
+                messages.error(request, problem)
+            return redirect('cart:cart_detail')
         # Pre-fill form with user's existing details if available
         initial_data = {
             'first_name': request.user.first_name,
             'last_name': request.user.last_name,
             'email': request.user.email,
+            'idempotency_key': uuid.uuid4().hex,
         }
         # You might have a UserProfile model to store address, postal_code, city
         # if hasattr(request.user, 'userprofile'):
@@ -57,5 +76,19 @@ def order_create(request):
 
 @login_required
 def order_history(request):
-    orders = Order.objects.filter(user=request.user)
-    return render(request, 'orders/order_history.html', {'orders': orders})
+    try:
+        orders, next_cursor = order_page(request.user, request.GET.get('cursor'))
+    except InvalidCursor:
+        return HttpResponseBadRequest("Invalid cursor.")
+    return render(request, 'orders/order_history.html', {
+        'orders': orders,
+        'next_cursor': next_cursor,
+        'summary': get_order_summary(request.user),
+    })
+
+@login_required
+def order_detail(request, order_id):
+    # The order, then its items with their products in one more query
+    items = Prefetch('items', queryset=OrderItem.objects.select_related('product').order_by('id'))
+    order = get_object_or_404(Order.objects.prefetch_related(items), id=order_id, user=request.user)
+    return render(request, 'orders/order_detail.html', {'order': order})
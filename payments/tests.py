@@ -1,11 +1,13 @@
 # FreshCart/payments/tests.py
 # Example tests for the payments app.
 
+import datetime
 from django.test import TestCase, Client
+from django.utils import timezone
 from django.urls import reverse
 from django.contrib.auth import get_user_model
 from products.models import Product, Category
-from orders.models import Order, OrderItem
+from orders.models import IdempotencyKey, Order, OrderItem
 from unittest.mock import patch, MagicMock
 import json
 import stripe # Import stripe to mock its API calls
@@ -51,6 +53,7 @@ class PaymentViewTest(TestCase):
             amount=int(self.order.get_total_cost() * 100),
             currency='inr',
             metadata={'order_id': self.order.id},
+            idempotency_key=f'order-{self.order.payment_key}',
         )
 
     @patch('stripe.PaymentIntent.create')
@@ -63,6 +66,72 @@ class PaymentViewTest(TestCase):
         self.assertIn('error', json_response)
         self.assertEqual(json_response['error'], 'Stripe API error')
 
+    @patch('stripe.PaymentIntent.retrieve')
+    @patch('stripe.PaymentIntent.create')
+    def test_process_payment_get_creates_one_payment_intent(self, mock_create, mock_retrieve):
+        mock_create.return_value = mock_retrieve.return_value = MagicMock(
+            id='pi_test_id', status='requires_payment_method', client_secret='pi_test_client_secret')
+        url = reverse('payments:process_payment', args=[self.order.id])
+        for _ in range(2): # A reload fetches the stored PaymentIntent rather than creating another
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.context['client_secret'], 'pi_test_client_secret')
+        mock_create.assert_called_once_with(
+            amount=int(self.order.subtotal * 100),
+            currency='inr',
+            metadata={'order_id': self.order.id},
+            idempotency_key=f'order-{self.order.payment_key}',
+        )
+        mock_retrieve.assert_called_once_with('pi_test_id')
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.stripe_id, 'pi_test_id')
+        self.assertEqual(IdempotencyKey.objects.get(scope='payment_intent').result, {'id': 'pi_test_id'})
+
+    def test_payment_keys_differ_between_orders(self):
+        other = Order.objects.create(user=self.user, first_name='Test', last_name='User', email='test@example.com',
+                                     address='123 Test St', postal_code='12345', city='Testville')
+        self.assertNotEqual(other.payment_key, self.order.payment_key)
+
+    @patch('stripe.PaymentIntent.create')
+    def test_process_payment_get_retries_after_stripe_error(self, mock_create):
+        mock_create.side_effect = [
+            stripe.error.APIConnectionError('Network down'),
+            MagicMock(id='pi_test_id', status='requires_payment_method', client_secret='pi_test_client_secret'),
+        ]
+        url = reverse('payments:process_payment', args=[self.order.id])
+        self.assertRedirects(self.client.get(url), reverse('cart:cart_detail'), fetch_redirect_response=False)
+        self.assertEqual(self.client.get(url).context['client_secret'], 'pi_test_client_secret')
+        self.assertEqual(mock_create.call_count, 2) # The failed attempt stored nothing
+
+    @patch('stripe.PaymentIntent.retrieve')
+    def test_process_payment_get_after_key_expired(self, mock_retrieve):
+        mock_retrieve.return_value = MagicMock(id='pi_old', status='succeeded', client_secret='pi_old_secret')
+        self.order.stripe_id = 'pi_old'
+        self.order.save()
+        response = self.client.get(reverse('payments:process_payment', args=[self.order.id]))
+        self.assertRedirects(response, reverse('orders:order_history'), fetch_redirect_response=False)
+        mock_retrieve.assert_called_once_with('pi_old')
+
+    @patch('stripe.PaymentIntent.create')
+    def test_process_payment_while_another_request_creates_the_intent(self, mock_create):
+        IdempotencyKey.objects.create(user=self.user, scope='payment_intent', key=f'order-{self.order.payment_key}',
+                                      created_at=timezone.now(), expires_at=timezone.now() + datetime.timedelta(minutes=1))
+        response = self.client.get(reverse('payments:process_payment', args=[self.order.id]))
+        self.assertRedirects(response, reverse('orders:order_detail', args=[self.order.id]),
+                             fetch_redirect_response=False)
+        mock_create.assert_not_called()
+
+    @patch('stripe.PaymentIntent.create')
+    def test_process_payment_refuses_when_stock_is_gone(self, mock_create):
+        self.product.stock = 0 # Sold to someone else after this order's holds expired
+        self.product.save()
+        response = self.client.get(reverse('payments:process_payment', args=[self.order.id]))
+        self.assertRedirects(response, reverse('orders:order_detail', args=[self.order.id]),
+                             fetch_redirect_response=False)
+        self.assertEqual([str(m) for m in response.wsgi_request._messages],
+                         ['Not enough stock for Apple. Available: 0', f'Order {self.order.id} can no longer be paid for.'])
+        mock_create.assert_not_called()
+
     def test_process_payment_get(self):
         response = self.client.get(reverse('payments:process_payment', args=[self.order.id]))
         self.assertEqual(response.status_code, 200)
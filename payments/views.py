@@ -11,11 +11,32 @@ from django.http import JsonResponse, HttpResponse
 import json
 import traceback # Import traceback for detailed error logging
 
+from orders.idempotency import run_once
 from orders.models import Order
+from orders.reservations import OutOfStock, renew_order_holds
+from orders.sales import mark_order_paid
 
 # Set your Stripe API key
 stripe.api_key = settings.STRIPE_SECRET_KEY
 
+def payment_intent_key(order):
+    # Also sent to Stripe, so a create retried after a lost response returns
+    # the PaymentIntent Stripe already made instead of a second one
+    return f'order-{order.payment_key}'
+
+def _payment_intent(order):
+    if order.stripe_id: # Created before this order's idempotency key expired
+        return stripe.PaymentIntent.retrieve(order.stripe_id)
+    payment_intent = stripe.PaymentIntent.create(
+        amount=int(order.subtotal * 100), # Amount in cents
+        currency='inr', # Or your desired currency, e.g., 'usd'
+        metadata={'order_id': order.id},
+        idempotency_key=payment_intent_key(order),
+    )
+    order.stripe_id = payment_intent.id # Save PaymentIntent ID to order
+    order.save()
+    return payment_intent
+
 @login_required
 def process_payment(request, order_id):
     order = get_object_or_404(Order, id=order_id, user=request.user, paid=False)
@@ -24,24 +45,32 @@ def process_payment(request, order_id):
     if request.method == 'GET':
         client_secret = None
         try:
-            # Check if a PaymentIntent already exists for this order
-            if order.stripe_id:
-                payment_intent = stripe.PaymentIntent.retrieve(order.stripe_id)
-                # If it's already succeeded or canceled, redirect or show message
-                if payment_intent.status in ['succeeded', 'canceled']:
-                    messages.error(request, f"Order {order.id} payment is already {payment_intent.status}.")
-                    return redirect('orders:order_history') # Redirect to order history
-                client_secret = payment_intent.client_secret
-            else:
-                # Create a new PaymentIntent
-                payment_intent = stripe.PaymentIntent.create(
-                    amount=int(order.get_total_cost() * 100), # Amount in cents
-                    currency='inr', # Or your desired currency, e.g., 'usd'
-                    metadata={'order_id': order.id},
-                )
-                order.stripe_id = payment_intent.id # Save PaymentIntent ID to order
-                order.save()
-                client_secret = payment_intent.client_secret
+            # Stock is only taken at payment: hold it for this order again, and
+            # don't take a payment once it has been sold to someone else
+            renew_order_holds(order)
+        except OutOfStock as e:
+            for problem in e.problems:
+                messages.error(request, problem)
+            messages.error(request, f"Order {order.id} can no longer be paid for.")
+            return redirect('orders:order_detail', order_id=order.id)
+        try:
+            # At most one PaymentIntent created per order: reloads get the stored
+            # id and fetch its current state from Stripe (the client secret is
+            # never stored). No transaction is held open during the Stripe call.
+            fetched = []
+            def create():
+                fetched.append(_payment_intent(order))
+                return {'id': fetched[0].id}
+            stored, _ = run_once('payment_intent', payment_intent_key(order), request.user, create, atomic=False)
+            if stored is None: # Another request is creating it right now
+                messages.info(request, f"Payment for order {order.id} is being set up. Please try again in a moment.")
+                return redirect('orders:order_detail', order_id=order.id)
+            payment_intent = fetched[0] if fetched else stripe.PaymentIntent.retrieve(stored['id'])
+            # If it's already succeeded or canceled, redirect or show message
+            if payment_intent.status in ['succeeded', 'canceled']:
+                messages.error(request, f"Order {order.id} payment is already {payment_intent.status}.")
+                return redirect('orders:order_history') # Redirect to order history
+            client_secret = payment_intent.client_secret
             
             # --- Debugging: Print client_secret to console ---
             print(f"DEBUG: PaymentIntent client_secret for Order {order.id}: {client_secret}")
@@ -98,9 +127,8 @@ def stripe_webhook(request):
         order_id = payment_intent['metadata']['order_id']
         try:
             order = Order.objects.get(id=order_id)
-            order.paid = True
-            order.save()
-            # Send order confirmation email, update inventory, etc.
+            mark_order_paid(order) # Idempotent, as Stripe may deliver an event more than once
+            # Emails and other slow follow-up work are queued as jobs, not run here
             print(f"PaymentIntent {payment_intent.id} succeeded for Order {order.id}")
         except Order.DoesNotExist:
             print(f"Order {order_id} not found for PaymentIntent {payment_intent.id}")
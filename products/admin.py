@@ -3,6 +3,7 @@
 
 from django.contrib import admin
 from .models import Category, Product
+from .images import build_renditions
 
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
@@ -17,3 +18,8 @@ class ProductAdmin(admin.ModelAdmin):
     prepopulated_fields = {'slug': ('name',)}
     raw_id_fields = ['category'] # For large number of categories, use raw_id_fields
 
+    def save_model(self, request, obj, form, change):
+        # Regenerate the resized renditions only when a new image was uploaded or cleared
+        if 'image' in form.changed_data:
+            obj.image_renditions = build_renditions(obj.image)
+        super().save_model(request, obj, form, change)
@@ -0,0 +1,101 @@
+# FreshCart/products/api.py
+# Read-only catalog REST API for mobile clients.
+# Responses are built from .values() projections rather than model instances.
+# The listing endpoints send an ETag so unchanged data costs a 304 and, at most,
+# a single timestamp lookup; syncing clients use the change feed instead.
+
+import hashlib
+from django.core.files.storage import default_storage
+from django.http import Http404
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
+from rest_framework.decorators import api_view
+from rest_framework.response import Response
+from .catalog import PRODUCT_PAGE_SIZE, get_catalog_version, get_categories, get_category, get_category_version
+from .changes import CHANGE_FEED_LIMIT, MAX_CHANGE_FEED_LIMIT, catalog_changes
+from .models import Product
+from .pagination import InvalidCursor, paginate_keyset
+
+PRODUCT_LIST_FIELDS = ('id', 'name', 'slug', 'price', 'image', 'stock', 'category_id')
+PRODUCT_DETAIL_FIELDS = PRODUCT_LIST_FIELDS + ('description', 'created_at', 'updated_at')
+
+def _product_data(row):
+    row['price'] = str(row['price'])
+    row['image'] = default_storage.url(row['image']) if row['image'] else None
+    return row
+
+def _category_list_etag(request):
+    return f'categories-{get_category_version()}'
+
+def _product_list_etag(request):
+    # Any Product/Category change bumps the catalog version, so one cache read
+    # decides whether this exact page can have changed
+    params = f"{request.GET.get('category', '')}:{request.GET.get('cursor', '')}"
+    digest = hashlib.md5(params.encode()).hexdigest()[:12]
+    return f'products-{get_catalog_version()}-{digest}'
+
+def _product_updated_at(request, id):
+    # Shared by the ETag and Last-Modified callbacks: one indexed lookup per request
+    if not hasattr(request, '_product_updated_at'):
+        request._product_updated_at = (
+            Product.objects.filter(pk=id, available=True).values_list('updated_at', flat=True).first()
+        )
+    return request._product_updated_at
+
+def _product_detail_etag(request, id):
+    updated_at = _product_updated_at(request, id)
+    return f'product-{id}-{updated_at.timestamp()}' if updated_at else None
+
+@api_view(['GET'])
+@cache_control(no_cache=True) # Clients may store responses but must revalidate them
+@condition(etag_func=_category_list_etag)
+def category_list(request):
+    return Response([
+        {'id': category.id, 'name': category.name, 'slug': category.slug}
+        for category in get_categories()
+    ])
+
+@api_view(['GET'])
+@cache_control(no_cache=True)
+@condition(etag_func=_product_list_etag)
+def product_list(request):
+    products = Product.objects.filter(available=True)
+    if request.GET.get('category'):
+        category = get_category(slug=request.GET['category'])
+        if category is None:
+            raise Http404("No category matches the given query.")
+        products = products.filter(category=category)
+    try:
+        rows, next_cursor = paginate_keyset(
+            products.values(*PRODUCT_LIST_FIELDS), Product._meta.ordering,
+            request.GET.get('cursor'), PRODUCT_PAGE_SIZE,
+        )
+    except InvalidCursor as e:
+        return Response({'error': str(e)}, status=400)
+    return Response({
+        'results': [_product_data(row) for row in rows],
+        'next_cursor': next_cursor,
+    })
+
+@api_view(['GET'])
+@cache_control(no_cache=True)
+@condition(etag_func=_product_detail_etag, last_modified_func=_product_updated_at)
+def product_detail(request, id):
+    row = Product.objects.filter(pk=id, available=True).values(*PRODUCT_DETAIL_FIELDS).first()
+    if row is None:
+        raise Http404("No product matches the given query.")
+    return Response(_product_data(row))
+
+@api_view(['GET'])
+@cache_control(no_store=True) # Every call depends on the cursor and the clock
+def catalog_change_feed(request):
+    # ?cursor=<next_cursor from the previous call>&limit=<rows per stream>
+    try:
+        limit = min(max(int(request.GET.get('limit', CHANGE_FEED_LIMIT)), 1), MAX_CHANGE_FEED_LIMIT)
+        changes = catalog_changes(request.GET.get('cursor'), limit)
+    except InvalidCursor as e:
+        return Response({'error': str(e)}, status=400)
+    except ValueError:
+        return Response({'error': 'Invalid limit.'}, status=400)
+    changes['products'] = [_product_data(row) for row in changes['products']]
+    return Response(changes)
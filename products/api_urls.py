@@ -0,0 +1,14 @@
+# FreshCart/products/api_urls.py
+# URL patterns for the read-only catalog API (mounted at /api/).
+
+from django.urls import path
+from . import api
+
+app_name = 'catalog_api' # Namespace for catalog API URLs
+
+urlpatterns = [
+    path('categories/', api.category_list, name='category_list'),
+    path('products/', api.product_list, name='product_list'),
+    path('products/<int:id>/', api.product_detail, name='product_detail'),
+    path('changes/', api.catalog_change_feed, name='catalog_changes'),
+]
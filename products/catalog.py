@@ -0,0 +1,138 @@
+# FreshCart/products/catalog.py
+# Versioned catalog data: snapshots kept in the Redis cache, plus an in-process
+# category registry.
+# Every cached catalog entry is keyed under the current catalog version, so
+# bumping the version (see products/signals.py) invalidates all of them at once
+# without having to know which keys exist.
+
+import threading
+import time
+from django.core.cache import cache
+from .facets import apply_filters
+from .models import Category, Product
+from .pagination import paginate_keyset
+
+CATALOG_VERSION_KEY = 'catalog:version'
+CATEGORY_VERSION_KEY = 'catalog:categories:version' # Only bumped by Category changes
+CATALOG_SNAPSHOT_TIMEOUT = 60 * 60 * 24 # Entries for old versions simply age out
+
+DAILY_ESSENTIALS = 'Daily Essentials'
+FRESH_PRODUCE = 'Fresh Produce'
+
+PRODUCT_PAGE_SIZE = 12 # Cards per slider page / infinite-scroll fetch
+
+def _get_version(key):
+    version = cache.get(key)
+    if version is None:
+        # Seed from the clock so a lost version key never resurrects an old snapshot
+        cache.add(key, int(time.time()), timeout=None)
+        version = cache.get(key, int(time.time()))
+    return version
+
+def _bump_version(key):
+    try:
+        return cache.incr(key)
+    except ValueError: # Key was evicted, start a fresh version sequence
+        version = int(time.time())
+        cache.set(key, version, timeout=None)
+        return version
+
+def get_catalog_version():
+    return _get_version(CATALOG_VERSION_KEY)
+
+def bump_catalog_version():
+    return _bump_version(CATALOG_VERSION_KEY)
+
+def get_category_version():
+    return _get_version(CATEGORY_VERSION_KEY)
+
+def bump_category_version():
+    return _bump_version(CATEGORY_VERSION_KEY)
+
+class CategoryRegistry:
+    """
+    Process-wide, lazily loaded index of all categories (by id, slug and name,
+    plus the list ordered by name). A lookup costs one cache read to compare
+    the category version; the table is only re-read after a Category save or
+    delete bumps that version.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        # (version, ordered categories, by id, by slug, by name), swapped atomically
+        self._state = (None, (), {}, {}, {})
+
+    def _current(self):
+        version = get_category_version()
+        state = self._state
+        if state[0] != version:
+            with self._lock:
+                state = self._state
+                if state[0] != version:
+                    categories = tuple(Category.objects.order_by('name'))
+                    state = (
+                        version,
+                        categories,
+                        {category.id: category for category in categories},
+                        {category.slug: category for category in categories},
+                        {category.name: category for category in categories},
+                    )
+                    self._state = state
+        return state
+
+    def all(self):
+        return self._current()[1]
+
+    def get(self, id=None, slug=None, name=None):
+        _, _, by_id, by_slug, by_name = self._current()
+        if id is not None:
+            return by_id.get(id)
+        if slug is not None:
+            return by_slug.get(slug)
+        return by_name.get(name)
+
+category_registry = CategoryRegistry()
+
+def get_categories():
+    return category_registry.all()
+
+def get_category(id=None, slug=None, name=None):
+    return category_registry.get(id=id, slug=slug, name=name)
+
+def catalog_key(name, version=None):
+    if version is None:
+        version = get_catalog_version()
+    return f'catalog:{version}:{name}'
+
+def product_page(category=None, cursor=None, limit=PRODUCT_PAGE_SIZE, filters=None):
+    # Keyset page of available products in Product.Meta.ordering, (name, id),
+    # served by the partial (category, name, id) / (name, id) indexes.
+    # `filters` are the facet filters from products/facets.py.
+    products = apply_filters(Product.objects.all(), filters or {})
+    if category is not None:
+        products = products.filter(category=category)
+    return paginate_keyset(products, Product._meta.ordering, cursor, limit)
+
+def _build_landing_snapshot():
+    # Bestsellers are ranked from the sales rollup instead (orders/sales.py)
+    snapshot = {}
+    # Only the first page of each slider is cached; later pages are fetched by cursor
+    for key, category_name in (('daily_essentials', DAILY_ESSENTIALS), ('fresh_produce', FRESH_PRODUCE)):
+        category = get_category(name=category_name)
+        products, cursor = product_page(category) if category else ([], None)
+        snapshot[key] = products
+        snapshot[f'{key}_cursor'] = cursor
+        snapshot[f'{key}_category'] = category
+    return snapshot
+
+def get_landing_snapshot():
+    # A warm cache costs two cache reads and no database queries
+    key = catalog_key('landing')
+    snapshot = cache.get(key)
+    if snapshot is None:
+        snapshot = _build_landing_snapshot()
+        cache.set(key, snapshot, CATALOG_SNAPSHOT_TIMEOUT)
+    return snapshot
@@ -0,0 +1,199 @@
+# FreshCart/products/catalog_io.py
+# Streaming CSV/JSONL catalog import and export, used by the catalog_import and
+# catalog_export management commands.
+# Rows are read and written one at a time and upserted in fixed-size chunks, so
+# memory use stays flat however large the supplier file is.
+
+import csv
+import json
+import os
+from itertools import islice
+from django.core.exceptions import ValidationError
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from .models import Category, Product
+from .search import update_search_vectors
+
+CATALOG_FIELDS = ('slug', 'name', 'category_slug', 'category_name', 'description', 'price', 'stock', 'available', 'image')
+FORMATS = ('csv', 'jsonl')
+IMAGE_UPLOAD_DIR = 'products' # Matches Product.image upload_to
+PRODUCT_UPDATE_FIELDS = ['category', 'name', 'description', 'price', 'stock', 'available', 'image', 'image_renditions', 'updated_at']
+
+# Row columns checked against the model fields they are written to (length,
+# slug format, digits, integer range), so one bad row can't fail a chunk's upsert
+ROW_FIELDS = {
+    'slug': Product._meta.get_field('slug'),
+    'name': Product._meta.get_field('name'),
+    'category_slug': Category._meta.get_field('slug'),
+    'category_name': Category._meta.get_field('name'),
+    'price': Product._meta.get_field('price'),
+    'stock': Product._meta.get_field('stock'),
+}
+
+class RowError(ValueError):
+    pass
+
+def detect_format(path, fmt=None):
+    fmt = fmt or os.path.splitext(path)[1].lstrip('.').lower()
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown catalog format {fmt!r}; use one of {', '.join(FORMATS)}.")
+    return fmt
+
+def read_rows(stream, fmt):
+    # Yields (line_number, row) pairs without loading the whole file; a
+    # malformed JSON line is yielded as an error message instead of a dict
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for number, line in enumerate(stream, 1):
+        if line.strip():
+            try:
+                yield number, json.loads(line)
+            except ValueError as e:
+                yield number, f'invalid JSON ({e})'
+
+def write_rows(stream, fmt, rows):
+    if fmt == 'csv':
+        writer = csv.DictWriter(stream, fieldnames=CATALOG_FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+    else:
+        for row in rows:
+            stream.write(json.dumps(row, cls=DjangoJSONEncoder) + '\n')
+
+def export_rows(chunk_size=2000):
+    # Server-side cursor on PostgreSQL: only `chunk_size` rows are in memory at once
+    products = Product.objects.order_by('id').values(
+        'slug', 'name', 'category__slug', 'category__name', 'description', 'price', 'stock', 'available', 'image',
+    )
+    for row in products.iterator(chunk_size=chunk_size):
+        row['category_slug'] = row.pop('category__slug')
+        row['category_name'] = row.pop('category__name')
+        row['price'] = str(row['price'])
+        row['image'] = row['image'] or ''
+        yield row
+
+def _parse_bool(value):
+    if isinstance(value, bool):
+        return value
+    value = str(value).strip().lower()
+    if value in ('', '1', 'true', 'yes', 'y'):
+        return True # Missing means available, like the model default
+    if value in ('0', 'false', 'no', 'n'):
+        return False
+    raise RowError(f'invalid available value {value!r}')
+
+def clean_row(row):
+    """
+    Validates one input row and returns it with typed values.
+    Raises RowError with a message naming the bad field.
+    """
+    row = {field: row.get(field) for field in CATALOG_FIELDS}
+    for field in ('slug', 'name', 'category_slug', 'price'):
+        if row[field] in (None, ''):
+            raise RowError(f'missing {field}')
+    row['price'] = str(row['price']) # A JSON float would be converted with all its binary digits
+    row['stock'] = row['stock'] or 0
+    for field, model_field in ROW_FIELDS.items():
+        if row[field] in (None, ''):
+            continue # Only category_name is optional
+        try:
+            row[field] = model_field.clean(row[field], None)
+        except ValidationError as e:
+            raise RowError(f"invalid {field} ({' '.join(e.messages)})") from e
+    for field in ('price', 'stock'):
+        if row[field] < 0:
+            raise RowError(f'invalid {field} ({row[field]} is negative)')
+    row['available'] = _parse_bool(row['available'] if row['available'] is not None else '')
+    row['description'] = row['description'] or ''
+    row['image'] = (row['image'] or '').strip()
+    return row
+
+def resolve_image(value, image_dir=None):
+    """
+    Maps an image column to a storage name: names already in storage are used
+    as-is, anything else is looked up on disk (relative to `image_dir`) and
+    copied into the products/ upload directory. Returns None if not found.
+    """
+    if default_storage.exists(value):
+        return value
+    path = value if os.path.isabs(value) or not image_dir else os.path.join(image_dir, value)
+    if not os.path.isfile(path):
+        return None
+    name = f'{IMAGE_UPLOAD_DIR}/{os.path.basename(path)}'
+    if default_storage.exists(name): # Copied by an earlier import; don't duplicate it
+        return name
+    with open(path, 'rb') as f:
+        return default_storage.save(name, File(f))
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+@transaction.atomic
+def import_chunk(rows, image_dir=None):
+    """
+    Upserts one chunk of cleaned rows by slug in a single transaction.
+    Returns (imported, categories_changed, problems), where problems lists
+    (slug, message) pairs for rows skipped or imported without their image.
+    """
+    rows = list({row['slug']: row for row in rows}.values()) # Last row wins within a chunk
+
+    # Categories: insert new slugs, rename changed ones, leave the rest untouched
+    names = {row['category_slug']: row['category_name'] for row in rows if row['category_name']}
+    existing = dict(Category.objects.filter(slug__in={row['category_slug'] for row in rows}).values_list('slug', 'name'))
+    changed = [Category(slug=slug, name=name) for slug, name in names.items() if existing.get(slug) != name]
+    # Names are unique too: one already used by another slug (in the database
+    # or earlier in this chunk) would abort the upsert, so those rows are skipped
+    owners = dict(Category.objects.filter(name__in=[c.name for c in changed]).values_list('name', 'slug'))
+    clashes = {}
+    for category in list(changed):
+        owner = owners.setdefault(category.name, category.slug)
+        if owner != category.slug:
+            clashes[category.slug] = f'category name {category.name!r} is already used by {owner!r}'
+            changed.remove(category)
+    if changed:
+        Category.objects.bulk_create(changed, update_conflicts=True, unique_fields=['slug'], update_fields=['name', 'updated_at'])
+    category_ids = dict(Category.objects.filter(slug__in={row['category_slug'] for row in rows}).values_list('slug', 'id'))
+
+    # Products: keep the stored image (and its renditions) unless the row names a new one
+    current = {
+        slug: (image, renditions)
+        for slug, image, renditions in Product.objects.filter(slug__in=[row['slug'] for row in rows])
+        .values_list('slug', 'image', 'image_renditions')
+    }
+    products, problems = [], []
+    for row in rows:
+        if row['category_slug'] in clashes:
+            problems.append((row['slug'], f"skipped: {clashes[row['category_slug']]}"))
+            continue
+        if row['category_slug'] not in category_ids:
+            problems.append((row['slug'], f"skipped: unknown category {row['category_slug']!r}"))
+            continue
+        image, renditions = current.get(row['slug'], ('', {}))
+        if row['image'] and row['image'] != image:
+            resolved = resolve_image(row['image'], image_dir)
+            if resolved is None:
+                problems.append((row['slug'], f"image {row['image']!r} not found"))
+            elif resolved != image:
+                image, renditions = resolved, {} # build_image_renditions picks these up
+        products.append(Product(
+            category_id=category_ids[row['category_slug']], slug=row['slug'], name=row['name'],
+            description=row['description'], price=row['price'], stock=row['stock'],
+            available=row['available'], image=image or None, image_renditions=renditions,
+        ))
+    if products:
+        Product.objects.bulk_create(
+            products, update_conflicts=True, unique_fields=['slug'], update_fields=PRODUCT_UPDATE_FIELDS,
+        )
+
+    # bulk_create skips the post_save handlers in products/signals.py
+    update_search_vectors(Product.objects.filter(slug__in=[product.slug for product in products]))
+    if changed:
+        update_search_vectors(Product.objects.filter(category__slug__in=[c.slug for c in changed]))
+    return len(products), bool(changed), problems
@@ -0,0 +1,73 @@
+# FreshCart/products/changes.py
+# Incremental catalog change feed: the products and categories created, updated
+# or deleted since a cursor, so clients and sidecars sync deltas instead of
+# re-downloading the catalog.
+# Each of the three streams (products and categories by updated_at, deletions
+# by CatalogTombstone.deleted_at) is paged by keyset on (timestamp, id), and
+# the cursor carries the position in all three.
+
+import datetime
+from django.utils import timezone
+from .models import CatalogTombstone, Category, Product
+from .pagination import InvalidCursor, decode_cursor, encode_cursor, seek
+
+CHANGE_FEED_LIMIT = 500 # Rows per stream per call
+MAX_CHANGE_FEED_LIMIT = 1000
+# Rows are only reported once they are this old, so a transaction that stamped
+# updated_at before committing cannot slip in behind a cursor that has moved on
+CHANGE_FEED_SETTLE = datetime.timedelta(seconds=5)
+
+PRODUCT_FIELDS = ('id', 'category_id', 'name', 'slug', 'description', 'price', 'image', 'stock', 'available',
+                  'created_at', 'updated_at')
+CATEGORY_FIELDS = ('id', 'name', 'slug', 'description', 'updated_at')
+
+def _streams():
+    # (name, rows, timestamp field) in cursor order
+    return (
+        ('products', Product.objects.values(*PRODUCT_FIELDS), 'updated_at'),
+        ('categories', Category.objects.values(*CATEGORY_FIELDS), 'updated_at'),
+        ('deleted', CatalogTombstone.objects.values('id', 'kind', 'object_id', 'slug', 'deleted_at'), 'deleted_at'),
+    )
+
+def _encode(positions):
+    return encode_cursor(None if p is None else list(p) for p in positions)
+
+def _decode(cursor):
+    try:
+        return [
+            None if p is None else (datetime.datetime.fromisoformat(p[0]), int(p[1]))
+            for p in decode_cursor(cursor, 3)
+        ]
+    except (IndexError, TypeError, ValueError) as e:
+        raise InvalidCursor('Malformed cursor.') from e
+
+def catalog_changes(cursor=None, limit=CHANGE_FEED_LIMIT, settle=None):
+    """
+    Returns {'products': [...], 'categories': [...], 'deleted': [...],
+    'next_cursor': str, 'has_more': bool}. Start without a cursor for a full
+    sync, then keep the returned next_cursor; while has_more is true, call
+    again straight away. A row updated several times is reported once, at its
+    latest state.
+    """
+    positions = _decode(cursor) if cursor else [None, None, None]
+    horizon = timezone.now() - (CHANGE_FEED_SETTLE if settle is None else settle)
+    changes, has_more = {}, False
+    for i, (name, rows, timestamp) in enumerate(_streams()):
+        keys = (timestamp, 'id')
+        rows = rows.filter(**{f'{timestamp}__lt': horizon})
+        if positions[i] is not None:
+            rows = seek(rows, keys, positions[i])
+        rows = list(rows.order_by(*keys)[:limit + 1])
+        if len(rows) > limit:
+            rows, has_more = rows[:limit], True
+        if rows:
+            positions[i] = (rows[-1][timestamp], rows[-1]['id'])
+        changes[name] = rows
+
+    changes['deleted'] = [
+        {'kind': row['kind'], 'id': row['object_id'], 'slug': row['slug'], 'deleted_at': row['deleted_at']}
+        for row in changes['deleted']
+    ]
+    changes['next_cursor'] = _encode(positions)
+    changes['has_more'] = has_more
+    return changes
@@ -0,0 +1,139 @@
+# FreshCart/products/facets.py
+# Faceted product filtering (category, price band, stock, availability).
+# Facet counts come from one GROUP BY rollup over the whole catalog, cached under
+# the catalog version, so a facet sidebar costs a cache read instead of one
+# COUNT query per facet value.
+
+from collections import Counter
+from urllib.parse import urlencode
+from django.core.cache import cache
+from django.db.models import BooleanField, Case, CharField, Count, Q, Value, When
+from . import catalog
+from .models import Product
+
+# (key, label, lower bound inclusive, upper bound exclusive)
+PRICE_BANDS = (
+    ('under-50', 'Under ₹50', None, 50),
+    ('50-100', '₹50 - ₹100', 50, 100),
+    ('100-250', '₹100 - ₹250', 100, 250),
+    ('250-plus', '₹250 and above', 250, None),
+)
+STOCK_CHOICES = (('in', 'In stock'), ('out', 'Out of stock'))
+AVAILABILITY_CHOICES = (('available', 'Available'), ('unavailable', 'Unavailable'))
+DEFAULT_AVAILABILITY = 'available' # Shoppers only see available products unless they ask
+
+FACETS = ('category', 'price', 'stock', 'availability')
+
+def _price_q(band):
+    _, _, low, high = next(b for b in PRICE_BANDS if b[0] == band)
+    q = Q()
+    if low is not None:
+        q &= Q(price__gte=low)
+    if high is not None:
+        q &= Q(price__lt=high)
+    return q
+
+def parse_filters(params, category_slug=None):
+    # Unknown values are dropped rather than rejected, like a stale bookmarked link
+    filters = {}
+    slug = category_slug or params.get('category')
+    if slug:
+        filters['category'] = slug
+    if params.get('price') in {band[0] for band in PRICE_BANDS}:
+        filters['price'] = params['price']
+    if params.get('stock') in dict(STOCK_CHOICES):
+        filters['stock'] = params['stock']
+    if params.get('availability') in dict(AVAILABILITY_CHOICES):
+        filters['availability'] = params['availability']
+    return filters
+
+def filter_query(filters):
+    # Query-string form of the filters, used to carry them across pages
+    params = {k: v for k, v in filters.items() if not (k == 'availability' and v == DEFAULT_AVAILABILITY)}
+    return urlencode(sorted(params.items()))
+
+def apply_filters(queryset, filters):
+    # Every filter except category, which callers resolve through the registry
+    queryset = queryset.filter(available=filters.get('availability', DEFAULT_AVAILABILITY) == 'available')
+    if 'price' in filters:
+        queryset = queryset.filter(_price_q(filters['price']))
+    if filters.get('stock') == 'in':
+        queryset = queryset.filter(stock__gt=0)
+    elif filters.get('stock') == 'out':
+        queryset = queryset.filter(stock__lte=0)
+    return queryset
+
+def facet_rollup():
+    key = catalog.catalog_key('facets')
+    rows = cache.get(key)
+    if rows is None:
+        price_band = Case(
+            *[When(_price_q(band), then=Value(band)) for band, _, _, _ in PRICE_BANDS],
+            output_field=CharField(),
+        )
+        in_stock = Case(When(stock__gt=0, then=Value(True)), default=Value(False), output_field=BooleanField())
+        rows = list(
+            Product.objects.order_by()
+            .annotate(price_band=price_band, in_stock=in_stock)
+            .values('category_id', 'available', 'in_stock', 'price_band')
+            .annotate(count=Count('id'))
+        )
+        cache.set(key, rows, catalog.CATALOG_SNAPSHOT_TIMEOUT)
+    return rows
+
+def _row_values(row):
+    return {
+        'category': row['category_id'],
+        'price': row['price_band'],
+        'stock': 'in' if row['in_stock'] else 'out',
+        'availability': 'available' if row['available'] else 'unavailable',
+    }
+
+def facet_counts(filters):
+    """
+    Counts for every facet value, each computed with all *other* active
+    filters applied (so picking a price band still shows the other bands).
+    """
+    selected = {'availability': DEFAULT_AVAILABILITY, **filters}
+    if 'category' in selected:
+        category = catalog.get_category(slug=selected['category'])
+        selected['category'] = category.id if category else None
+    counts = {facet: Counter() for facet in FACETS}
+    for row in facet_rollup():
+        values = _row_values(row)
+        mismatched = [facet for facet in FACETS if facet in selected and values[facet] != selected[facet]]
+        if not mismatched:
+            for facet in FACETS:
+                counts[facet][values[facet]] += row['count']
+        elif len(mismatched) == 1:
+            counts[mismatched[0]][values[mismatched[0]]] += row['count']
+    return counts
+
+def build_facets(filters):
+    # Sidebar data: each option carries its count and the query string that toggles it
+    counts = facet_counts(filters)
+    groups = (
+        ('category', 'Category', [(c.slug, c.name, c.id) for c in catalog.get_categories()]),
+        ('price', 'Price', [(band, label, band) for band, label, _, _ in PRICE_BANDS]),
+        ('stock', 'Stock', [(value, label, value) for value, label in STOCK_CHOICES]),
+        ('availability', 'Availability', [(value, label, value) for value, label in AVAILABILITY_CHOICES]),
+    )
+    facets = []
+    for name, label, choices in groups:
+        current = filters.get(name, DEFAULT_AVAILABILITY if name == 'availability' else None)
+        options = []
+        for value, option_label, count_key in choices:
+            toggled = dict(filters)
+            if current == value:
+                toggled.pop(name, None)
+            else:
+                toggled[name] = value
+            options.append({
+                'value': value,
+                'label': option_label,
+                'count': counts[name][count_key],
+                'selected': current == value,
+                'query': filter_query(toggled),
+            })
+        facets.append({'name': name, 'label': label, 'options': options})
+    return facets
@@ -0,0 +1,99 @@
+# FreshCart/products/images.py
+# Builds resized WebP and JPEG renditions of Product.image.
+# Renditions are named after a hash of the source file, so their URLs never
+# change for the same upload and can be served with long cache lifetimes.
+
+import hashlib
+import io
+import os
+from PIL import Image, ImageOps
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+
+RENDITION_DIR = 'products/renditions'
+JPEG_QUALITY = 82
+WEBP_QUALITY = 80
+
+# Output formats in <picture> order: browsers pick the first type they support
+FORMATS = (
+    ('webp', 'WEBP', 'image/webp'),
+    ('jpg', 'JPEG', 'image/jpeg'),
+)
+
+# Each rendition lists its 1x/2x sizes and the `sizes` attribute used in templates.
+# Cropped renditions fill the box exactly (object-cover cards); the rest keep
+# their aspect ratio and fit inside it.
+RENDITIONS = {
+    'thumb': {'sizes': ((40, 40), (80, 80)), 'crop': True, 'sizes_attr': '40px'},
+    'card': {'sizes': ((256, 160), (512, 320)), 'crop': True, 'sizes_attr': '256px'},
+    'detail': {'sizes': ((400, 384), (800, 768)), 'crop': False, 'sizes_attr': '(min-width: 768px) 400px, 100vw'},
+}
+
+def source_digest(data):
+    return hashlib.sha1(data).hexdigest()[:12]
+
+def _encode(image, pil_format):
+    buffer = io.BytesIO()
+    if pil_format == 'JPEG':
+        image.save(buffer, 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+    else:
+        image.save(buffer, pil_format, quality=WEBP_QUALITY, method=4)
+    return buffer.getvalue()
+
+def render_renditions(data, source_name):
+    """
+    Renders every rendition of one source image.
+    Returns a list of (rendition, ext, width, storage_name, bytes) tuples.
+    Only touches Pillow, so it is safe to run in a worker process.
+    """
+    stem = os.path.splitext(os.path.basename(source_name))[0]
+    digest = source_digest(data)
+
+    with Image.open(io.BytesIO(data)) as original:
+        # Let the JPEG decoder downscale while loading so every rendition
+        # resamples a small image instead of the full multi-megapixel upload
+        largest = max(max(size) for spec in RENDITIONS.values() for size in spec['sizes'])
+        original.draft('RGB', (largest, largest))
+        original = ImageOps.exif_transpose(original) # Respect camera orientation
+        original = original.convert('RGB')
+
+        rendered = []
+        for rendition, spec in RENDITIONS.items():
+            for width, height in spec['sizes']:
+                if spec['crop']:
+                    resized = ImageOps.fit(original, (width, height), Image.LANCZOS)
+                else:
+                    resized = original.copy()
+                    resized.thumbnail((width, height), Image.LANCZOS)
+                for ext, pil_format, _ in FORMATS:
+                    name = f'{RENDITION_DIR}/{stem}-{digest}-{width}x{height}.{ext}'
+                    rendered.append((rendition, ext, resized.width, name, _encode(resized, pil_format)))
+    return rendered
+
+def render_file(path, source_name):
+    # Process-pool entry point for the build_image_renditions command
+    with open(path, 'rb') as f:
+        return render_renditions(f.read(), source_name)
+
+def store_renditions(rendered, storage=default_storage):
+    """
+    Writes rendered files that are not stored yet and returns the manifest kept
+    on Product.image_renditions: {rendition: {ext: [[name, width], ...]}}.
+    """
+    manifest = {}
+    for rendition, ext, width, name, content in rendered:
+        if not storage.exists(name): # Same source hash means same bytes
+            storage.save(name, ContentFile(content))
+        manifest.setdefault(rendition, {}).setdefault(ext, []).append([name, width])
+    return manifest
+
+def build_renditions(image):
+    # Works for both committed files and fresh uploads that are not saved yet
+    if not image:
+        return {}
+    image.open('rb')
+    try:
+        data = image.read()
+    finally:
+        image.seek(0)
+    return store_renditions(render_renditions(data, image.name))
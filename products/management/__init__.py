@@ -0,0 +1 @@
+# FreshCart/products/management/__init__.py
@@ -0,0 +1 @@
+# FreshCart/products/management/commands/__init__.py
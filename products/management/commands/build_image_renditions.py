@@ -0,0 +1,62 @@
+# FreshCart/products/management/commands/build_image_renditions.py
+# Backfills WebP/JPEG renditions for existing product images.
+# Usage: python manage.py build_image_renditions [--workers 4] [--force]
+
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from products.catalog import bump_catalog_version
+from products.images import render_file, store_renditions
+from products.models import Product
+
+class Command(BaseCommand):
+    help = 'Generates resized WebP/JPEG renditions for product images using a process pool.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='Number of worker processes (default: CPU count).')
+        parser.add_argument('--force', action='store_true',
+                            help='Rebuild renditions even for products that already have them.')
+        parser.add_argument('--batch-size', type=int, default=100,
+                            help='Number of products written per bulk_update.')
+
+    def handle(self, *args, **options):
+        products = Product.objects.exclude(image='').exclude(image__isnull=True)
+        if not options['force']:
+            products = products.filter(image_renditions={})
+        products = list(products.only('id', 'image'))
+        if not products:
+            self.stdout.write('No product images need renditions.')
+            return
+
+        by_id = {product.id: product for product in products}
+        pending, failed = [], 0
+        # Workers only decode and resize; files are written by this process
+        # through the configured storage backend.
+        with ProcessPoolExecutor(max_workers=options['workers']) as pool:
+            futures = {
+                pool.submit(render_file, default_storage.path(p.image.name), p.image.name): p.id
+                for p in products
+            }
+            for future in as_completed(futures):
+                product = by_id[futures[future]]
+                try:
+                    product.image_renditions = store_renditions(future.result())
+                    product.updated_at = timezone.now() # Expires the cached product card
+                except Exception as e:
+                    failed += 1
+                    self.stderr.write(f"Could not render {product.image.name}: {e}")
+                    continue
+                pending.append(product)
+                if len(pending) >= options['batch_size']:
+                    Product.objects.bulk_update(pending, ['image_renditions', 'updated_at'])
+                    pending = []
+        if pending:
+            Product.objects.bulk_update(pending, ['image_renditions', 'updated_at'])
+
+        bump_catalog_version() # bulk_update skips signals, so refresh cached catalog data here
+        self.stdout.write(self.style.SUCCESS(
+            f"Built renditions for {len(products) - failed} product(s), {failed} failed."
+        ))
@@ -0,0 +1,46 @@
+# FreshCart/products/management/commands/catalog_export.py
+# Dumps the product catalog in the format catalog_import reads.
+# Usage: python manage.py catalog_export catalog.csv [--format jsonl] [--chunk-size 2000]
+
+import sys
+import time
+from django.core.management.base import BaseCommand, CommandError
+from products.catalog_io import detect_format, export_rows, write_rows
+
+class Command(BaseCommand):
+    help = 'Streams every product to a CSV or JSONL file using a server-side cursor.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Output file, or '-' for stdout (requires --format).")
+        parser.add_argument('--format', choices=('csv', 'jsonl'),
+                            help='Output format (default: taken from the file extension).')
+        parser.add_argument('--chunk-size', type=int, default=2000,
+                            help='Rows fetched from the database per round trip.')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        try:
+            fmt = detect_format(path, options['format'])
+            stream = sys.stdout if path == '-' else open(path, 'w', newline='', encoding='utf-8')
+        except (OSError, ValueError) as e:
+            raise CommandError(e)
+
+        exported = 0
+        def counted(rows):
+            nonlocal exported
+            for row in rows:
+                exported += 1
+                yield row
+
+        started = time.monotonic()
+        try:
+            write_rows(stream, fmt, counted(export_rows(options['chunk_size'])))
+        finally:
+            if stream is not sys.stdout:
+                stream.close()
+
+        elapsed = time.monotonic() - started
+        report = self.stderr if stream is sys.stdout else self.stdout # Keep stdout clean for the data
+        report.write(self.style.SUCCESS(
+            f'Exported {exported} product(s) in {elapsed:.1f}s ({exported / max(elapsed, 1e-6):,.0f} rows/s).'
+        ))
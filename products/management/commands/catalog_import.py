@@ -0,0 +1,69 @@
+# FreshCart/products/management/commands/catalog_import.py
+# Bulk-loads a supplier catalog, upserting categories and products by slug.
+# Usage: python manage.py catalog_import catalog.csv [--format jsonl] [--batch-size 1000] [--image-dir /path/to/images]
+
+import sys
+import time
+from django.core.management.base import BaseCommand, CommandError
+from products.catalog import bump_catalog_version, bump_category_version
+from products.catalog_io import RowError, chunked, clean_row, detect_format, import_chunk, read_rows
+from products.models import Product
+
+class Command(BaseCommand):
+    help = 'Streams a CSV or JSONL catalog file into the database in batched, per-chunk transactions.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Catalog file, or '-' for stdin (requires --format).")
+        parser.add_argument('--format', choices=('csv', 'jsonl'),
+                            help='Input format (default: taken from the file extension).')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Rows upserted per transaction.')
+        parser.add_argument('--image-dir',
+                            help='Directory that relative image paths are resolved against.')
+
+    def _valid_rows(self, stream, fmt):
+        for line, row in read_rows(stream, fmt):
+            try:
+                if isinstance(row, str):
+                    raise RowError(row)
+                yield clean_row(row)
+            except RowError as e:
+                self.errors += 1
+                self.stderr.write(f'Line {line}: {e}')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        try:
+            fmt = detect_format(path, options['format'])
+            stream = sys.stdin if path == '-' else open(path, newline='', encoding='utf-8')
+        except (OSError, ValueError) as e:
+            raise CommandError(e)
+
+        self.errors = 0
+        imported, categories_changed = 0, False
+        started = time.monotonic()
+        try:
+            for chunk in chunked(self._valid_rows(stream, fmt), options['batch_size']):
+                count, changed, problems = import_chunk(chunk, options['image_dir'])
+                imported += count
+                categories_changed |= changed
+                for slug, message in problems:
+                    self.stderr.write(f'{slug}: {message}')
+                elapsed = time.monotonic() - started
+                self.stdout.write(f'{imported} rows imported ({imported / max(elapsed, 1e-6):,.0f} rows/s)')
+        finally:
+            if stream is not sys.stdin: # Only close what was opened here
+                stream.close()
+
+        # Bulk writes skip the model signals, so invalidate cached catalog data here
+        if categories_changed:
+            bump_category_version()
+        bump_catalog_version()
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {imported} product(s) in {elapsed:.1f}s ({imported / max(elapsed, 1e-6):,.0f} rows/s), '
+            f'{self.errors} invalid row(s) skipped.'
+        ))
+        if Product.objects.exclude(image='').exclude(image__isnull=True).filter(image_renditions={}).exists():
+            self.stdout.write('Some product images have no renditions yet; run build_image_renditions.')
@@ -0,0 +1,45 @@
+# Generated by Django 4.2 on 2026-10-18 06:42
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.contrib.postgres.operations import TrigramExtension
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+from django.db.models import OuterRef, Subquery
+
+
+def populate_search_vectors(apps, schema_editor):
+    # Set-based backfill; mirrors products.search.product_search_vector()
+    Category = apps.get_model('products', 'Category')
+    Product = apps.get_model('products', 'Product')
+    category_name = Subquery(Category.objects.filter(pk=OuterRef('category_id')).values('name')[:1])
+    Product.objects.update(search_vector=(
+        SearchVector('name', weight='A', config='english')
+        + SearchVector(category_name, weight='B', config='english')
+        + SearchVector('description', weight='C', config='english')
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0002_product_image_renditions'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name='product',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='product_search_vector_gin'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['name'], name='product_name_trgm_gin', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.RunPython(populate_search_vectors, migrations.RunPython.noop),
+    ]
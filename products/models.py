@@ -1,15 +1,22 @@
 # FreshCart/products/models.py
 # Defines the Product and Category models.
 
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
+from django.utils import timezone
 
 class Category(models.Model):
     name = models.CharField(max_length=100, unique=True)
     slug = models.SlugField(max_length=100, unique=True) # For SEO-friendly URLs
     description = models.TextField(blank=True)
+    updated_at = models.DateTimeField(auto_now=True) # Drives the catalog change feed
 
     class Meta:
         verbose_name_plural = "Categories" # Fixes pluralization in admin
+        indexes = [
+            models.Index(fields=['updated_at', 'id'], name='category_updated_at_id_idx'), # Change feed
+        ]
 
     def __str__(self):
         return self.name
@@ -21,16 +28,43 @@ class Product(models.Model):
     description = models.TextField(blank=True)
     price = models.DecimalField(max_digits=10, decimal_places=2)
     image = models.ImageField(upload_to='products/', blank=True, null=True) # Requires Pillow
+    image_renditions = models.JSONField(default=dict, blank=True, editable=False) # Filled by products/images.py
     stock = models.IntegerField(default=0)
     available = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    search_vector = SearchVectorField(null=True, editable=False) # Maintained by products/search.py
 
     class Meta:
-        ordering = ('name',)
+        ordering = ('name', 'id') # Unique, so it doubles as the keyset pagination key
         index_together = (('id', 'slug'),) # For efficient lookups
+        indexes = [
+            # Keyset pagination of listings (products.catalog.product_page)
+            models.Index(fields=['name', 'id'], name='product_avail_name_id_idx', condition=models.Q(available=True)),
+            models.Index(fields=['category', 'name', 'id'], name='product_cat_name_id_idx', condition=models.Q(available=True)),
+            GinIndex(fields=['search_vector'], name='product_search_vector_gin'), # Full-text search
+            GinIndex(fields=['name'], name='product_name_trgm_gin', opclasses=['gin_trgm_ops']), # Typo fallback
+            models.Index(fields=['updated_at', 'id'], name='product_updated_at_id_idx'), # Change feed
+        ]
 
     def __str__(self):
         return self.name
 
+class CatalogTombstone(models.Model):
+    # Records deleted products and categories so the change feed can report them
+    PRODUCT = 'product'
+    CATEGORY = 'category'
+    KIND_CHOICES = [(PRODUCT, 'Product'), (CATEGORY, 'Category')]
 
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    object_id = models.BigIntegerField()
+    slug = models.SlugField(max_length=255)
+    deleted_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['deleted_at', 'id'], name='tombstone_deleted_at_id_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.kind} {self.object_id} deleted'
@@ -0,0 +1,71 @@
+# FreshCart/products/pagination.py
+# Keyset (cursor) pagination helpers.
+# Instead of OFFSET, each page seeks straight past the last row already shown,
+# so with an index on the ordering keys a deep page costs the same as page one.
+
+import base64
+import binascii
+import datetime
+import json
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+
+class InvalidCursor(ValueError):
+    pass
+
+class CursorEncoder(DjangoJSONEncoder):
+    # Datetimes in full: DjangoJSONEncoder cuts them to milliseconds, and a
+    # seek from a rounded timestamp would skip rows
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+def encode_cursor(values):
+    raw = json.dumps(list(values), cls=CursorEncoder, separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+def decode_cursor(cursor, size):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (binascii.Error, ValueError) as e:
+        raise InvalidCursor('Malformed cursor.') from e
+    if not isinstance(values, list) or len(values) != size:
+        raise InvalidCursor('Malformed cursor.')
+    return values
+
+def _key_value(item, field):
+    return item[field] if isinstance(item, dict) else getattr(item, field)
+
+def _after(keys, values):
+    # Expands (a, b) > (x, y) as a > x OR (a = x AND b > y), honouring each
+    # key's direction. The extra non-strict bound on the first key gives the
+    # planner a plain index range to scan.
+    first = keys[0].lstrip('-')
+    bound = Q(**{f"{first}__{'lte' if keys[0].startswith('-') else 'gte'}": values[0]})
+    condition = Q()
+    for i, key in enumerate(keys):
+        field = key.lstrip('-')
+        term = Q(**{f"{field}__{'lt' if key.startswith('-') else 'gt'}": values[i]})
+        for prev_key, prev_value in zip(keys[:i], values[:i]):
+            term &= Q(**{prev_key.lstrip('-'): prev_value})
+        condition |= term
+    return bound & condition
+
+def seek(queryset, keys, values):
+    # Rows strictly after `values` in `keys` order
+    return queryset.filter(_after(keys, values))
+
+def paginate_keyset(queryset, keys, cursor=None, limit=20):
+    """
+    Returns (items, next_cursor) for the page after `cursor`, ordered by `keys`
+    (order_by-style field names, unique together - end with 'id').
+    next_cursor is None on the last page. Works with model and .values() querysets.
+    """
+    if cursor:
+        queryset = seek(queryset, keys, decode_cursor(cursor, len(keys)))
+    items = list(queryset.order_by(*keys)[:limit + 1]) # One extra row tells us if there's a next page
+    if len(items) <= limit:
+        return items, None
+    items = items[:limit]
+    return items, encode_cursor(_key_value(items[-1], key.lstrip('-')) for key in keys)
@@ -0,0 +1,61 @@
+# FreshCart/products/search.py
+# Full-text product search over the stored, GIN-indexed Product.search_vector,
+# with a trigram fallback on product names for misspelled queries.
+
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector, TrigramWordSimilarity
+from django.db.models import F, FloatField, OuterRef, Subquery
+from django.db.models.functions import Cast
+from .models import Category, Product
+from .pagination import InvalidCursor, paginate_keyset
+
+SEARCH_CONFIG = 'english'
+SEARCH_PAGE_SIZE = 24
+MAX_QUERY_LENGTH = 100
+
+FULL_TEXT = 'fts'
+FUZZY = 'fuzzy'
+
+def product_search_vector():
+    # Name outranks category name, which outranks the description. The category
+    # name is read with a correlated subquery so a single UPDATE can refresh
+    # any number of products.
+    category_name = Subquery(Category.objects.filter(pk=OuterRef('category_id')).values('name')[:1])
+    return (
+        SearchVector('name', weight='A', config=SEARCH_CONFIG)
+        + SearchVector(category_name, weight='B', config=SEARCH_CONFIG)
+        + SearchVector('description', weight='C', config=SEARCH_CONFIG)
+    )
+
+def update_search_vectors(queryset):
+    return queryset.update(search_vector=product_search_vector())
+
+def search_products(query, cursor=None, limit=SEARCH_PAGE_SIZE):
+    """
+    Returns (products, next_cursor, fuzzy). Full-text matches are ranked first;
+    only when the query has no full-text match at all do we fall back to
+    trigram similarity on the name. The mode is carried in the cursor so every
+    page of one result set is paged the same way.
+    """
+    query = query[:MAX_QUERY_LENGTH]
+    mode, keyset = FULL_TEXT, None
+    if cursor:
+        mode, _, keyset = cursor.partition('.')
+        if mode not in (FULL_TEXT, FUZZY) or not keyset:
+            raise InvalidCursor('Malformed cursor.')
+
+    products = Product.objects.filter(available=True)
+    if mode == FULL_TEXT:
+        search_query = SearchQuery(query, search_type='websearch', config=SEARCH_CONFIG)
+        # Cast the real-valued rank to double so cursor values round-trip exactly
+        matches = products.filter(search_vector=search_query).annotate(
+            rank=Cast(SearchRank(F('search_vector'), search_query), FloatField())
+        )
+        items, next_keyset = paginate_keyset(matches, ('-rank', 'id'), keyset, limit)
+        if items or keyset:
+            return items, next_keyset and f'{FULL_TEXT}.{next_keyset}', False
+
+    matches = products.filter(name__trigram_word_similar=query).annotate(
+        similarity=Cast(TrigramWordSimilarity(query, 'name'), FloatField())
+    )
+    items, next_keyset = paginate_keyset(matches, ('-similarity', 'id'), keyset, limit)
+    return items, next_keyset and f'{FUZZY}.{next_keyset}', True
@@ -0,0 +1,46 @@
+# FreshCart/products/signals.py
+# Keeps cached catalog data in step with Product and Category changes, and
+# records deletions for the change feed (products/changes.py).
+
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .catalog import bump_catalog_version, bump_category_version
+from .models import CatalogTombstone, Category, Product
+from .search import update_search_vectors
+
+SEARCH_FIELDS = {'name', 'description', 'category', 'category_id'}
+
+def _invalidate(bump):
+    # Bump now so this process stops serving old data, and again after commit
+    # in case a concurrent request re-cached the old rows in between
+    bump()
+    transaction.on_commit(bump)
+
+@receiver([post_save, post_delete], sender=Product)
+@receiver([post_save, post_delete], sender=Category)
+def invalidate_catalog(sender, **kwargs):
+    _invalidate(bump_catalog_version)
+
+@receiver([post_save, post_delete], sender=Category)
+def invalidate_category_registry(sender, **kwargs):
+    _invalidate(bump_category_version)
+
+@receiver(post_save, sender=Product)
+def update_product_search_vector(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and not SEARCH_FIELDS.intersection(update_fields):
+        return # Nothing searchable changed
+    update_search_vectors(Product.objects.filter(pk=instance.pk))
+
+@receiver(post_save, sender=Category)
+def update_category_search_vectors(sender, instance, created, update_fields=None, **kwargs):
+    if created or (update_fields is not None and 'name' not in update_fields):
+        return # A new category has no products yet
+    update_search_vectors(Product.objects.filter(category=instance))
+
+@receiver(post_delete, sender=Product)
+@receiver(post_delete, sender=Category)
+def record_tombstone(sender, instance, **kwargs):
+    # Products removed by a category cascade each get their own tombstone
+    kind = CatalogTombstone.PRODUCT if sender is Product else CatalogTombstone.CATEGORY
+    CatalogTombstone.objects.create(kind=kind, object_id=instance.pk, slug=instance.slug)
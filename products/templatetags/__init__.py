@@ -0,0 +1 @@
+# FreshCart/products/templatetags/__init__.py
@@ -0,0 +1,100 @@
+# FreshCart/products/templatetags/product_tags.py
+# Template helpers for rendering products.
+# Usage: {% load product_tags %} ... {% product_image product 'card' css_class='w-full h-40 object-cover' %}
+#        {% product_cards products %} / {% product_card product card_class='p-2' %}
+#        {% get_categories as categories %} / {% get_category product.category_id as category %}
+
+from django import template
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.template.loader import render_to_string
+from django.templatetags.static import static
+from django.utils.html import format_html, format_html_join
+from django.utils.safestring import mark_safe
+from products.catalog import get_categories as _get_categories, get_category as _get_category
+from products.images import FORMATS, RENDITIONS
+
+register = template.Library()
+
+CARD_TEMPLATE = 'products/includes/product_card.html'
+CARD_CACHE_VERSION = 1 # Bump when the card template changes
+CARD_CACHE_TIMEOUT = 60 * 60 * 24
+CARD_CLASS = 'flex-none w-64 p-2' # Slider layout
+CSRF_PLACEHOLDER = '<!--csrf_token-->' # Swapped for the per-request token after caching
+
+def _srcset(entries):
+    return ', '.join(f'{default_storage.url(name)} {width}w' for name, width in entries)
+
+@register.simple_tag
+def product_image(product, rendition='card', css_class='', alt=None, sizes=None, loading='lazy'):
+    """
+    Emits a <picture> with WebP and JPEG srcsets for one of the renditions in
+    products/images.py, falling back to the original upload (or the static
+    placeholder) for products whose renditions have not been built yet.
+    """
+    spec = RENDITIONS[rendition]
+    alt = product.name if alt is None else alt
+    sizes = sizes or spec['sizes_attr']
+    formats = (product.image_renditions or {}).get(rendition)
+
+    if not formats or 'jpg' not in formats:
+        src = product.image.url if product.image else static('img/placeholder.jpg')
+        return format_html('<img src="{}" alt="{}" class="{}" loading="{}">', src, alt, css_class, loading)
+
+    jpeg = formats['jpg']
+    sources = format_html_join(
+        '', '<source type="{}" srcset="{}" sizes="{}">',
+        ((mime, _srcset(formats[ext]), sizes) for ext, _, mime in FORMATS if ext != 'jpg' and ext in formats),
+    )
+    # Cropped renditions have a fixed box, so reserve it to avoid layout shift
+    dimensions = format_html(' width="{}" height="{}"', *spec['sizes'][0]) if spec['crop'] else ''
+    return format_html(
+        '<picture class="contents">{}<img src="{}" srcset="{}" sizes="{}" alt="{}" class="{}"{} loading="{}" decoding="async"></picture>',
+        sources, default_storage.url(jpeg[0][0]), _srcset(jpeg), sizes, alt, css_class, dimensions, loading,
+    )
+
+@register.simple_tag
+def get_categories():
+    # Ordered category list from the in-process registry; no query once loaded
+    return _get_categories()
+
+@register.simple_tag
+def get_category(id):
+    return _get_category(id=id)
+
+def _card_key(product):
+    # updated_at changes on every save, so an edited product gets a fresh entry
+    return f'product-card:{CARD_CACHE_VERSION}:{product.id}:{product.updated_at.timestamp()}'
+
+def render_product_cards(products, csrf_token, card_class=CARD_CLASS):
+    """
+    Renders product cards from a shared fragment cache: one get_many for the
+    whole list, one set_many for whatever was missing. Fragments are cached
+    without the CSRF token and the same entry serves sliders, category pages
+    and search results.
+    """
+    products = list(products)
+    keys = [_card_key(product) for product in products]
+    fragments = cache.get_many(keys)
+    missing = {
+        key: render_to_string(CARD_TEMPLATE, {'product': product})
+        for key, product in zip(keys, products) if key not in fragments
+    }
+    if missing:
+        cache.set_many(missing, CARD_CACHE_TIMEOUT)
+        fragments.update(missing)
+
+    csrf_input = format_html('<input type="hidden" name="csrfmiddlewaretoken" value="{}">', csrf_token or '')
+    return mark_safe(''.join(
+        format_html('<div class="product-card {}">{}</div>', card_class,
+                    mark_safe(fragments[key].replace(CSRF_PLACEHOLDER, csrf_input)))
+        for key in keys
+    ))
+
+@register.simple_tag(takes_context=True)
+def product_cards(context, products, card_class=CARD_CLASS):
+    return render_product_cards(products, context.get('csrf_token'), card_class)
+
+@register.simple_tag(takes_context=True)
+def product_card(context, product, card_class=CARD_CLASS):
+    return render_product_cards([product], context.get('csrf_token'), card_class)
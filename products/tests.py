@@ -1,9 +1,31 @@
 # FreshCart/products/tests.py
 # Example tests for the products app.
 
-from django.test import TestCase
+import datetime
+import io
+import json
+import os
+import shutil
+import tempfile
+from decimal import Decimal
+from unittest.mock import patch
+from PIL import Image
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.template import Context, Template
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.core.cache import cache
 from .models import Category, Product
+from .changes import CHANGE_FEED_LIMIT, catalog_changes
+from .catalog import category_registry, get_catalog_version, get_category, get_categories, get_landing_snapshot, product_page
+from .facets import facet_counts, facet_rollup
+from .images import build_renditions
+from .pagination import InvalidCursor, paginate_keyset
+from .search import search_products
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
@@ -87,3 +109,595 @@ class ProductViewTest(TestCase):
         self.assertEqual(response.status_code, 404)
 
 
+class CatalogCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        category_registry.reset()
+        self.essentials = Category.objects.create(name='Daily Essentials', slug='daily-essentials')
+        self.produce = Category.objects.create(name='Fresh Produce', slug='fresh-produce')
+        self.milk = Product.objects.create(category=self.essentials, name='Milk', slug='milk', price=50.00, stock=10)
+        self.mango = Product.objects.create(category=self.produce, name='Mango', slug='mango', price=80.00, stock=5)
+        self.hidden = Product.objects.create(category=self.produce, name='Kiwi', slug='kiwi', price=90.00, available=False)
+
+    def test_snapshot_contents(self):
+        snapshot = get_landing_snapshot()
+        self.assertEqual(snapshot['daily_essentials_category'], self.essentials)
+        self.assertEqual(snapshot['daily_essentials'], [self.milk])
+        self.assertEqual(snapshot['fresh_produce'], [self.mango])
+
+    def test_warm_snapshot_costs_no_queries(self):
+        get_landing_snapshot()
+        with self.assertNumQueries(0):
+            get_landing_snapshot()
+
+    def test_product_save_bumps_version(self):
+        get_landing_snapshot()
+        version = get_catalog_version()
+        self.milk.price = 55.00
+        with self.captureOnCommitCallbacks(execute=True):
+            self.milk.save()
+        self.assertGreater(get_catalog_version(), version)
+        self.assertEqual(get_landing_snapshot()['daily_essentials'][0].price, 55)
+
+    def test_category_delete_bumps_version(self):
+        get_landing_snapshot()
+        version = get_catalog_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.produce.delete()
+        self.assertGreater(get_catalog_version(), version)
+        self.assertEqual(get_landing_snapshot()['fresh_produce'], [])
+
+    def test_landing_page_uses_snapshot(self):
+        User.objects.create_user(username='shopper', password='testpassword')
+        self.client.login(username='shopper', password='testpassword')
+        response = self.client.get(reverse('landing_page'))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Mango')
+        self.assertNotContains(response, 'Kiwi')
+
+
+def _jpeg_upload(name='photo.jpg', size=(1200, 900)):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, (200, 40, 40)).save(buffer, 'JPEG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/jpeg')
+
+class ProductImageRenditionTest(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.override = override_settings(MEDIA_ROOT=self.media_root)
+        self.override.enable()
+        self.category = Category.objects.create(name='Fruits', slug='fruits')
+        self.product = Product.objects.create(
+            category=self.category, name='Apple', slug='apple', price=100.00, image=_jpeg_upload()
+        )
+
+    def tearDown(self):
+        self.override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def test_build_renditions(self):
+        manifest = build_renditions(self.product.image)
+        self.assertEqual(set(manifest), {'thumb', 'card', 'detail'})
+        self.assertEqual([width for name, width in manifest['card']['webp']], [256, 512])
+        for name, width in manifest['card']['jpg'] + manifest['card']['webp']:
+            self.assertTrue(default_storage.exists(name))
+        # Same source bytes give the same content-hashed names
+        self.assertEqual(build_renditions(self.product.image), manifest)
+
+    def test_product_image_tag_emits_srcset(self):
+        self.product.image_renditions = build_renditions(self.product.image)
+        html = Template("{% load product_tags %}{% product_image product 'card' css_class='w-full' %}").render(
+            Context({'product': self.product})
+        )
+        self.assertIn('<source type="image/webp"', html)
+        self.assertIn('512w', html)
+        self.assertIn('sizes="256px"', html)
+        self.assertIn('width="256" height="160"', html)
+
+    def test_product_image_tag_falls_back_to_original(self):
+        html = Template("{% load product_tags %}{% product_image product %}").render(Context({'product': self.product}))
+        self.assertIn(self.product.image.url, html)
+        self.assertNotIn('srcset', html)
+
+    def test_backfill_command(self):
+        call_command('build_image_renditions', workers=1, stdout=io.StringIO())
+        self.product.refresh_from_db()
+        self.assertIn('card', self.product.image_renditions)
+
+
+class KeysetPaginationTest(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name='Fruits', slug='fruits')
+        for i, name in enumerate(['Apple', 'Banana', 'Banana', 'Cherry', 'Date']):
+            Product.objects.create(category=category, name=name, slug=f'fruit-{i}', price=10)
+
+    def test_pages_cover_every_row_once(self):
+        seen, cursor = [], None
+        while True:
+            page, cursor = paginate_keyset(Product.objects.all(), ('name', 'id'), cursor, limit=2)
+            seen.extend(page)
+            if cursor is None:
+                break
+        self.assertEqual(seen, list(Product.objects.order_by('name', 'id')))
+
+    def test_descending_keys(self):
+        page, cursor = paginate_keyset(Product.objects.values('id', 'name'), ('-name', '-id'), limit=3)
+        rest, _ = paginate_keyset(Product.objects.values('id', 'name'), ('-name', '-id'), cursor, limit=3)
+        self.assertEqual([p['name'] for p in page + rest], ['Date', 'Cherry', 'Banana', 'Banana', 'Apple'])
+
+    def test_invalid_cursor(self):
+        with self.assertRaises(InvalidCursor):
+            paginate_keyset(Product.objects.all(), ('name', 'id'), 'not-a-cursor', limit=2)
+
+class ProductSearchTest(TestCase):
+    def setUp(self):
+        self.dairy = Category.objects.create(name='Dairy', slug='dairy')
+        self.fruits = Category.objects.create(name='Fruits', slug='fruits')
+        self.milk = Product.objects.create(category=self.dairy, name='Toned Milk', slug='toned-milk', price=30, description='Fresh milk')
+        self.butter = Product.objects.create(category=self.dairy, name='Butter', slug='butter', price=55, description='Made from milk')
+        self.banana = Product.objects.create(category=self.fruits, name='Banana', slug='banana', price=40)
+        Product.objects.create(category=self.dairy, name='Old Milk', slug='old-milk', price=1, available=False)
+
+    def test_name_match_ranks_above_description_match(self):
+        products, next_cursor, fuzzy = search_products('milk')
+        self.assertEqual(products, [self.milk, self.butter])
+        self.assertIsNone(next_cursor)
+        self.assertFalse(fuzzy)
+
+    def test_category_name_is_searchable_and_follows_renames(self):
+        self.assertEqual(set(search_products('dairy')[0]), {self.milk, self.butter})
+        self.dairy.name = 'Creamery'
+        self.dairy.save()
+        self.assertEqual(set(search_products('creamery')[0]), {self.milk, self.butter})
+
+    def test_typo_falls_back_to_trigram_match(self):
+        products, _, fuzzy = search_products('banan')
+        self.assertTrue(fuzzy)
+        self.assertEqual(products, [self.banana])
+
+    def test_results_page_by_cursor(self):
+        first, cursor = search_products('milk', limit=1)[:2]
+        second, last_cursor = search_products('milk', cursor, limit=1)[:2]
+        self.assertEqual(first + second, [self.milk, self.butter])
+        self.assertIsNone(last_cursor)
+
+    def test_search_views(self):
+        User.objects.create_user(username='shopper', password='testpassword')
+        self.client.login(username='shopper', password='testpassword')
+        response = self.client.get(reverse('products:product_search'), {'q': 'milk'})
+        self.assertContains(response, 'Toned Milk')
+        self.assertNotContains(response, 'Old Milk')
+        data = self.client.get(reverse('products:product_search_api'), {'q': 'milk'}).json()
+        self.assertEqual([r['slug'] for r in data['results']], ['toned-milk', 'butter'])
+        response = self.client.get(reverse('products:product_search_api'), {'q': 'milk', 'cursor': 'bogus'})
+        self.assertEqual(response.status_code, 400)
+
+class ProductListPaginationTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        category_registry.reset()
+        User.objects.create_user(username='shopper', password='testpassword')
+        self.client.login(username='shopper', password='testpassword')
+        self.fruits = Category.objects.create(name='Fruits', slug='fruits')
+        self.snacks = Category.objects.create(name='Snacks', slug='snacks')
+        for i in range(15):
+            Product.objects.create(category=self.fruits, name=f'Fruit {i:02d}', slug=f'fruit-{i}', price=10)
+        Product.objects.create(category=self.snacks, name='Chips', slug='chips', price=20)
+
+    def test_product_page_follows_meta_ordering(self):
+        first, cursor = product_page(self.fruits, limit=10)
+        second, last_cursor = product_page(self.fruits, cursor, limit=10)
+        self.assertEqual(len(first), 10)
+        self.assertEqual(len(second), 5)
+        self.assertIsNone(last_cursor)
+        self.assertEqual(first + second, list(Product.objects.filter(category=self.fruits)))
+
+    def test_filtered_slider_is_limited_to_first_page(self):
+        response = self.client.get(reverse('landing_page'), {'stock': 'out'})
+        self.assertEqual(len(response.context['products']), 12)
+        self.assertIsNotNone(response.context['products_next_url'])
+
+    def test_category_view_pages_by_cursor(self):
+        response = self.client.get(reverse('products:product_list_by_category', args=['fruits']))
+        self.assertEqual(len(response.context['products']), 12)
+        response = self.client.get(reverse('products:product_list_by_category', args=['fruits']),
+                                   {'cursor': response.context['next_cursor']})
+        self.assertEqual([p.name for p in response.context['products']], ['Fruit 12', 'Fruit 13', 'Fruit 14'])
+        self.assertIsNone(response.context['next_cursor'])
+
+    def test_infinite_scroll_api(self):
+        first = self.client.get(reverse('products:product_list_api'), {'category': 'fruits'}).json()
+        self.assertEqual(len(first['results']), 12)
+        self.assertIn('Fruit 00', first['html'])
+        second = self.client.get(first['next_url']).json()
+        self.assertEqual([r['name'] for r in second['results']], ['Fruit 12', 'Fruit 13', 'Fruit 14'])
+        self.assertIsNone(second['next_url'])
+        response = self.client.get(reverse('products:product_list_api'), {'cursor': '!!'})
+        self.assertEqual(response.status_code, 400)
+
+class CategoryRegistryTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        category_registry.reset()
+        self.fruits = Category.objects.create(name='Fruits', slug='fruits')
+        self.dairy = Category.objects.create(name='Dairy', slug='dairy')
+
+    def test_lookups(self):
+        self.assertEqual(list(get_categories()), [self.dairy, self.fruits])
+        self.assertEqual(get_category(slug='fruits'), self.fruits)
+        self.assertEqual(get_category(name='Dairy'), self.dairy)
+        self.assertEqual(get_category(id=self.fruits.id), self.fruits)
+        self.assertIsNone(get_category(slug='missing'))
+
+    def test_loaded_once_until_category_changes(self):
+        get_categories()
+        with self.assertNumQueries(0):
+            get_category(slug='fruits')
+            get_categories()
+        self.fruits.name = 'Fresh Fruits'
+        self.fruits.save()
+        self.assertEqual(get_category(slug='fruits').name, 'Fresh Fruits')
+        self.dairy.delete()
+        self.assertIsNone(get_category(slug='dairy'))
+
+    def test_views_resolve_categories_without_querying_them(self):
+        User.objects.create_user(username='shopper', password='testpassword')
+        self.client.login(username='shopper', password='testpassword')
+        product = Product.objects.create(category=self.fruits, name='Apple', slug='apple', price=10)
+        get_categories()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('products:product_list_by_category', args=['fruits']))
+            self.client.get(reverse('products:product_detail', args=[product.id, product.slug]))
+        self.assertContains(response, 'Apple')
+        self.assertFalse([q for q in queries if 'FROM "products_category"' in q['sql']])
+        self.assertEqual(self.client.get(reverse('products:product_list_by_category', args=['nope'])).status_code, 404)
+
+class ProductCardCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        category = Category.objects.create(name='Fruits', slug='fruits')
+        self.apple = Product.objects.create(category=category, name='Apple', slug='apple', price=100.00)
+        self.pear = Product.objects.create(category=category, name='Pear', slug='pear', price=60.00)
+
+    def render(self, products, token='token123'):
+        return Template('{% load product_tags %}{% product_cards products %}').render(
+            Context({'products': products, 'csrf_token': token})
+        )
+
+    def test_cards_are_cached_until_product_saved(self):
+        self.render([self.apple, self.pear])
+        Product.objects.filter(pk=self.apple.pk).update(name='Renamed') # No updated_at change
+        self.apple.refresh_from_db()
+        self.assertIn('Apple', self.render([self.apple]))
+        self.apple.save()
+        self.assertIn('Renamed', self.render([self.apple]))
+
+    def test_warm_cards_need_one_cache_read_and_no_queries(self):
+        self.render([self.apple, self.pear])
+        with self.assertNumQueries(0), patch.object(cache, 'get_many', wraps=cache.get_many) as get_many:
+            html = self.render([self.apple, self.pear])
+        get_many.assert_called_once()
+        self.assertEqual(html.count('class="product-card'), 2)
+
+    def test_csrf_token_is_added_outside_the_cached_fragment(self):
+        self.render([self.apple], token='first')
+        html = self.render([self.apple], token='second')
+        self.assertIn('name="csrfmiddlewaretoken" value="second"', html)
+        self.assertNotIn('first', html)
+        self.assertNotIn('<!--csrf_token-->', html)
+
+class CatalogApiTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        category_registry.reset()
+        self.fruits = Category.objects.create(name='Fruits', slug='fruits')
+        self.apple = Product.objects.create(category=self.fruits, name='Apple', slug='apple', price=100.00, stock=5)
+        Product.objects.create(category=self.fruits, name='Hidden', slug='hidden', price=1, available=False)
+
+    def test_category_list(self):
+        response = self.client.get(reverse('catalog_api:category_list'))
+        self.assertEqual(response.json(), [{'id': self.fruits.id, 'name': 'Fruits', 'slug': 'fruits'}])
+        self.assertTrue(response.has_header('ETag'))
+
+    def test_product_list_projection(self):
+        data = self.client.get(reverse('catalog_api:product_list'), {'category': 'fruits'}).json()
+        self.assertEqual(data['results'], [{
+            'id': self.apple.id, 'name': 'Apple', 'slug': 'apple', 'price': '100.00',
+            'image': None, 'stock': 5, 'category_id': self.fruits.id,
+        }])
+        self.assertIsNone(data['next_cursor'])
+        self.assertEqual(self.client.get(reverse('catalog_api:product_list'), {'category': 'nope'}).status_code, 404)
+
+    def test_product_list_not_modified_until_catalog_changes(self):
+        url = reverse('catalog_api:product_list')
+        etag = self.client.get(url)['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.apple.save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_product_detail_conditional_get(self):
+        url = reverse('catalog_api:product_detail', args=[self.apple.id])
+        response = self.client.get(url)
+        self.assertEqual(response.json()['description'], '')
+        self.assertTrue(response.has_header('Last-Modified'))
+        with self.assertNumQueries(1): # Only the updated_at lookup
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_product_detail_missing(self):
+        hidden = Product.objects.get(slug='hidden')
+        self.assertEqual(self.client.get(reverse('catalog_api:product_detail', args=[hidden.id])).status_code, 404)
+
+class ProductFacetTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        category_registry.reset()
+        User.objects.create_user(username='shopper', password='testpassword')
+        self.client.login(username='shopper', password='testpassword')
+        self.fruits = Category.objects.create(name='Fruits', slug='fruits')
+        self.snacks = Category.objects.create(name='Snacks', slug='snacks')
+        self.apple = Product.objects.create(category=self.fruits, name='Apple', slug='apple', price=40, stock=5)
+        Product.objects.create(category=self.fruits, name='Mango', slug='mango', price=120, stock=0)
+        Product.objects.create(category=self.snacks, name='Chips', slug='chips', price=30, stock=10)
+        Product.objects.create(category=self.snacks, name='Old Chips', slug='old-chips', price=30, available=False)
+
+    def test_counts_apply_every_other_filter(self):
+        counts = facet_counts({'price': 'under-50'})
+        self.assertEqual(counts['price'], {'under-50': 2, '100-250': 1})
+        self.assertEqual(counts['category'], {self.fruits.id: 1, self.snacks.id: 1})
+        self.assertEqual(counts['availability'], {'available': 2, 'unavailable': 1})
+        counts = facet_counts({'category': 'fruits', 'stock': 'in'})
+        self.assertEqual(counts['stock'], {'in': 1, 'out': 1})
+        self.assertEqual(counts['category'], {self.fruits.id: 1, self.snacks.id: 1})
+
+    def test_rollup_is_cached_until_a_product_changes(self):
+        facet_rollup()
+        with self.assertNumQueries(0):
+            facet_counts({'stock': 'in'})
+        self.apple.stock = 0
+        self.apple.save()
+        self.assertEqual(facet_counts({})['stock'], {'in': 1, 'out': 2})
+
+    def test_product_list_filters(self):
+        response = self.client.get(reverse('landing_page'), {'price': 'under-50', 'stock': 'in'})
+        self.assertEqual([p.name for p in response.context['products']], ['Apple', 'Chips'])
+        response = self.client.get(reverse('products:product_list_by_category', args=['snacks']),
+                                   {'availability': 'unavailable'})
+        self.assertEqual([p.name for p in response.context['products']], ['Old Chips'])
+        price = next(f for f in response.context['facets'] if f['name'] == 'price')
+        self.assertEqual(price['options'][0]['count'], 1)
+        self.assertEqual(price['options'][0]['query'], 'availability=unavailable&category=snacks&price=under-50')
+        # Bogus values are ignored rather than breaking the page
+        response = self.client.get(reverse('landing_page'), {'price': 'free'})
+        self.assertEqual(response.context['filters'], {})
+
+    def test_infinite_scroll_keeps_filters(self):
+        for i in range(13):
+            Product.objects.create(category=self.snacks, name=f'Snack {i:02d}', slug=f'snack-{i}', price=300, stock=1)
+        response = self.client.get(reverse('landing_page'), {'price': '250-plus'})
+        self.assertIn('price=250-plus', response.context['products_next_url'])
+        data = self.client.get(response.context['products_next_url']).json()
+        self.assertEqual([r['name'] for r in data['results']], ['Snack 12'])
+
+class ProductDetailConditionalGetTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        category_registry.reset()
+        User.objects.create_user(username='shopper', password='testpassword')
+        User.objects.create_user(username='other', password='testpassword')
+        self.client.login(username='shopper', password='testpassword')
+        fruits = Category.objects.create(name='Fruits', slug='fruits')
+        self.apple = Product.objects.create(category=fruits, name='Apple', slug='apple', price=100, stock=5)
+        self.url = reverse('products:product_detail', args=[self.apple.id, self.apple.slug])
+
+    def test_not_modified_skips_rendering(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('private', response['Cache-Control'])
+        self.assertIn('no-cache', response['Cache-Control'])
+        self.assertFalse(response.has_header('Last-Modified')) # It would not cover the user, cart or catalog
+        with self.assertNumQueries(2): # The user, then the updated_at lookup
+            cached = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual(cached.content, b'')
+
+    def test_changes_invalidate_the_etag(self):
+        etag = self.client.get(self.url)['ETag']
+        self.apple.price = 90
+        self.apple.save()
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_etag_is_per_user(self):
+        etag = self.client.get(self.url)['ETag']
+        self.client.login(username='other', password='testpassword')
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_cart_changes_invalidate_the_etag(self):
+        etag = self.client.get(self.url)['ETag']
+        self.client.post(reverse('cart:add_to_cart', args=[self.apple.id]), {'quantity': 1}, follow=True)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag) # No messages left, but a new badge
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_pending_messages_are_shown(self):
+        etag = self.client.get(self.url)['ETag']
+        self.client.post(reverse('cart:add_to_cart', args=[self.apple.id]), {'quantity': 6}) # Refused
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Not enough stock for Apple. Available: 5')
+        self.assertFalse(response.has_header('ETag'))
+
+    def test_missing_product_is_404(self):
+        url = reverse('products:product_detail', args=[self.apple.id, 'pear'])
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+class CatalogImportExportTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        category_registry.reset()
+        self.tmp = tempfile.mkdtemp()
+        self.override = override_settings(MEDIA_ROOT=os.path.join(self.tmp, 'media'))
+        self.override.enable()
+        self.fruits = Category.objects.create(name='Fruits', slug='fruits')
+        self.apple = Product.objects.create(category=self.fruits, name='Apple', slug='apple', price=100, stock=5)
+
+    def tearDown(self):
+        self.override.disable()
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def _write(self, name, content):
+        path = os.path.join(self.tmp, name)
+        with open(path, 'w') as f:
+            f.write(content)
+        return path
+
+    def test_csv_import_upserts_by_slug(self):
+        os.makedirs(os.path.join(self.tmp, 'images'))
+        with open(os.path.join(self.tmp, 'images', 'kiwi.jpg'), 'wb') as f:
+            f.write(_jpeg_upload().read())
+        path = self._write('catalog.csv', (
+            'slug,name,category_slug,category_name,description,price,stock,available,image\n'
+            'apple,Red Apple,fruits,Fruits,Crisp,90.50,7,true,\n'
+            'kiwi,Kiwi,exotic,Exotic Fruit,,40,3,1,kiwi.jpg\n'
+            'bad,Bad,fruits,,,not-a-price,1,true,\n'
+            'orphan,Orphan,nowhere,,,10,1,true,\n'
+        ))
+        stdout, stderr = io.StringIO(), io.StringIO()
+        version = get_catalog_version()
+        call_command('catalog_import', path, batch_size=2, image_dir=os.path.join(self.tmp, 'images'),
+                     stdout=stdout, stderr=stderr)
+
+        self.assertIn('rows/s', stdout.getvalue())
+        self.assertIn('Line 4: invalid price', stderr.getvalue())
+        self.assertIn("orphan: skipped: unknown category 'nowhere'", stderr.getvalue())
+        self.apple.refresh_from_db()
+        self.assertEqual((self.apple.name, self.apple.price, self.apple.stock), ('Red Apple', Decimal('90.50'), 7))
+        self.assertEqual(Product.objects.filter(slug='apple').count(), 1)
+        kiwi = Product.objects.get(slug='kiwi')
+        self.assertEqual(kiwi.category.name, 'Exotic Fruit')
+        self.assertEqual(kiwi.image.name, 'products/kiwi.jpg')
+        self.assertFalse(Product.objects.filter(slug__in=['bad', 'orphan']).exists())
+        # Bulk writes skip signals, so the command refreshes search and cached catalog data itself
+        self.assertEqual([p.slug for p in search_products('kiwi')[0]], ['kiwi'])
+        self.assertNotEqual(get_catalog_version(), version)
+        self.assertIsNotNone(get_category(slug='exotic'))
+
+    def test_rows_outside_column_limits_are_skipped(self):
+        path = self._write('catalog.jsonl', '\n'.join(json.dumps(row) for row in [
+            {'slug': 'kiwi', 'name': 'Kiwi', 'category_slug': 'fruits', 'price': 40.1, 'stock': 3},
+            {'slug': 'gold', 'name': 'Gold', 'category_slug': 'fruits', 'price': '123456789.00'},
+            {'slug': 'debt', 'name': 'Debt', 'category_slug': 'fruits', 'price': '-1'},
+            {'slug': 'gone', 'name': 'Gone', 'category_slug': 'fruits', 'price': '1', 'stock': -2},
+            {'slug': 'big', 'name': 'Big', 'category_slug': 'fruits', 'price': '1', 'stock': 2 ** 31},
+            {'slug': 'two words', 'name': 'Bad slug', 'category_slug': 'fruits', 'price': '1'},
+            {'slug': 'long', 'name': 'x' * 256, 'category_slug': 'fruits', 'price': '1'},
+            {'slug': 'fig', 'name': 'Fig', 'category_slug': 'c' * 101, 'category_name': 'Figs', 'price': '1'},
+        ]))
+        stderr = io.StringIO()
+        call_command('catalog_import', path, batch_size=2, stdout=io.StringIO(), stderr=stderr)
+        errors = stderr.getvalue().splitlines()
+        self.assertEqual([error.split(' (')[0] for error in errors], [
+            'Line 2: invalid price', 'Line 3: invalid price', 'Line 4: invalid stock', 'Line 5: invalid stock',
+            'Line 6: invalid slug', 'Line 7: invalid name', 'Line 8: invalid category_slug',
+        ])
+        self.assertEqual(sorted(Product.objects.values_list('slug', 'price')), [('apple', 100), ('kiwi', Decimal('40.10'))])
+
+    def test_import_from_stdin_leaves_it_open(self):
+        stdin = io.StringIO('slug,name,category_slug,category_name,description,price,stock,available,image\n'
+                            'kiwi,Kiwi,fruits,,,40,3,1,\n')
+        with patch('sys.stdin', stdin):
+            call_command('catalog_import', '-', format='csv', stdout=io.StringIO(), stderr=io.StringIO())
+        self.assertFalse(stdin.closed)
+        self.assertTrue(Product.objects.filter(slug='kiwi').exists())
+
+    def test_category_name_clash_skips_rows(self):
+        path = self._write('catalog.csv', (
+            'slug,name,category_slug,category_name,description,price,stock,available,image\n'
+            'kiwi,Kiwi,more-fruits,Fruits,,40,3,1,\n'
+            'plum,Plum,stone,Stone Fruit,,30,3,1,\n'
+            'pear,Pear,pome,Stone Fruit,,20,3,1,\n'
+            'fig,Fig,fruits,Fruits,,10,3,1,\n'
+        ))
+        stderr = io.StringIO()
+        call_command('catalog_import', path, stdout=io.StringIO(), stderr=stderr)
+        self.assertIn("kiwi: skipped: category name 'Fruits' is already used by 'fruits'", stderr.getvalue())
+        self.assertIn("pear: skipped: category name 'Stone Fruit' is already used by 'stone'", stderr.getvalue())
+        self.assertEqual(sorted(Product.objects.values_list('slug', flat=True)), ['apple', 'fig', 'plum'])
+        self.assertEqual(sorted(Category.objects.values_list('slug', flat=True)), ['fruits', 'stone'])
+
+    def test_export_round_trips_through_import(self):
+        path = os.path.join(self.tmp, 'catalog.jsonl')
+        call_command('catalog_export', path, chunk_size=1, stdout=io.StringIO())
+        with open(path) as f:
+            rows = [json.loads(line) for line in f]
+        self.assertEqual(rows, [{
+            'slug': 'apple', 'name': 'Apple', 'category_slug': 'fruits', 'category_name': 'Fruits',
+            'description': '', 'price': '100.00', 'stock': 5, 'available': True, 'image': '',
+        }])
+        Product.objects.all().delete()
+        call_command('catalog_import', path, stdout=io.StringIO(), stderr=io.StringIO())
+        self.assertEqual(Product.objects.get(slug='apple').price, Decimal('100.00'))
+
+class CatalogChangeFeedTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        category_registry.reset()
+        self.fruits = Category.objects.create(name='Fruits', slug='fruits')
+        self.apple = Product.objects.create(category=self.fruits, name='Apple', slug='apple', price=100)
+        self.mango = Product.objects.create(category=self.fruits, name='Mango', slug='mango', price=80)
+
+    def _sync(self, cursor=None, limit=CHANGE_FEED_LIMIT):
+        # Drains the feed like a client would
+        seen = {'products': [], 'categories': [], 'deleted': []}
+        while True:
+            changes = catalog_changes(cursor, limit, settle=datetime.timedelta(0))
+            for name in seen:
+                seen[name] += changes[name]
+            cursor = changes['next_cursor']
+            if not changes['has_more']:
+                return seen, cursor
+
+    def test_full_sync_then_deltas(self):
+        seen, cursor = self._sync(limit=1)
+        self.assertEqual([row['slug'] for row in seen['products']], ['apple', 'mango'])
+        self.assertEqual([row['slug'] for row in seen['categories']], ['fruits'])
+
+        self.assertEqual(self._sync(cursor)[0], {'products': [], 'categories': [], 'deleted': []})
+        self.apple.price = 90
+        self.apple.save()
+        mango_id = self.mango.id
+        self.mango.delete()
+        seen, cursor = self._sync(cursor)
+        self.assertEqual([(row['slug'], row['price']) for row in seen['products']], [('apple', Decimal('90.00'))])
+        self.assertEqual(seen['deleted'], [{
+            'kind': 'product', 'id': mango_id, 'slug': 'mango', 'deleted_at': seen['deleted'][0]['deleted_at'],
+        }])
+
+    def test_category_cascade_leaves_tombstones(self):
+        _, cursor = self._sync()
+        self.fruits.delete()
+        deleted = self._sync(cursor)[0]['deleted']
+        self.assertEqual(sorted((row['kind'], row['slug']) for row in deleted),
+                         [('category', 'fruits'), ('product', 'apple'), ('product', 'mango')])
+
+    def test_recent_rows_wait_for_the_settle_window(self):
+        self.assertEqual(catalog_changes()['products'], [])
+        with self.assertRaises(InvalidCursor):
+            catalog_changes('bm90LWEtY3Vyc29y')
+
+    @patch('products.changes.CHANGE_FEED_SETTLE', datetime.timedelta(0))
+    def test_endpoint(self):
+        data = self.client.get(reverse('catalog_api:catalog_changes'), {'limit': 1}).json()
+        self.assertEqual([row['slug'] for row in data['products']], ['apple'])
+        self.assertEqual(data['products'][0]['price'], '100.00')
+        self.assertTrue(data['has_more'])
+        data = self.client.get(reverse('catalog_api:catalog_changes'), {'cursor': data['next_cursor']}).json()
+        self.assertEqual([row['slug'] for row in data['products']], ['mango'])
+        self.assertFalse(data['has_more'])
+        self.assertEqual(self.client.get(reverse('catalog_api:catalog_changes'), {'cursor': 'x'}).status_code, 400)
@@ -8,6 +8,9 @@ app_name = 'products' # Define the app namespace here
 
 urlpatterns = [
     path('', views.product_list, name='product_list'),
+    path('api/', views.product_list_api, name='product_list_api'), # Infinite scroll; before the category slug route
+    path('search/', views.product_search, name='product_search'), # Must come before the category slug route
+    path('search/api/', views.product_search_api, name='product_search_api'),
     path('<slug:category_slug>/', views.product_list, name='product_list_by_category'),
     path('<int:id>/<slug:slug>/', views.product_detail, name='product_detail'),
 ]
@@ -1,60 +1,164 @@
 # FreshCart/products/views.py
 # Handles product listing and detail views.
 
+import hashlib
+from django.http import Http404, HttpResponseBadRequest, JsonResponse
+from django.middleware.csrf import get_token
 from django.shortcuts import render, get_object_or_404
-from .models import Product, Category
-from django.core.cache import cache # For Redis caching
+from django.template.loader import render_to_string
+from django.urls import reverse
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
+from .models import Product
+from .catalog import get_catalog_version, get_categories, get_category, get_landing_snapshot, product_page
+from .facets import build_facets, filter_query, parse_filters
+from .pagination import InvalidCursor
+from .search import search_products
+from orders.sales import get_bestsellers
 from django.contrib.auth.decorators import login_required # Ensure user is logged in
+from django.contrib.messages import get_messages
+from cart.context_processors import cart_summary
 
-@login_required # Protect this view
-def product_list(request, category_slug=None):
-    category = None
-    categories = Category.objects.all()
-    products = Product.objects.filter(available=True)
-
-    # Fetch products for Bestsellers (already in use)
-    # You might want to add a specific field to Product model (e.g., is_bestseller)
-    # or filter by a specific category for "Bestsellers" in a real app.
-    # For now, 'products' variable serves as bestsellers.
-
-    # Fetch products for Daily Essentials category
-    try:
-        daily_essentials_category = Category.objects.get(name='Daily Essentials')
-        daily_essentials_products = Product.objects.filter(category=daily_essentials_category, available=True)
-    except Category.DoesNotExist:
-        daily_essentials_products = Product.objects.none() # Return empty queryset if category doesn't exist
+def _product_json(product):
+    return {
+        'id': product.id,
+        'name': product.name,
+        'slug': product.slug,
+        'price': str(product.price),
+        'image': product.image.url if product.image else None,
+        'url': reverse('products:product_detail', args=[product.id, product.slug]),
+    }
 
-    # Fetch products for Fresh Produce category
-    try:
-        fresh_produce_category = Category.objects.get(name='Fresh Produce')
-        fresh_produce_products = Product.objects.filter(category=fresh_produce_category, available=True)
-    except Category.DoesNotExist:
-        fresh_produce_products = Product.objects.none() # Return empty queryset if category doesn't exist
+def _next_page_url(cursor, category=None, filters=None):
+    if not cursor:
+        return None
+    params = dict(filters or {})
+    if category:
+        params['category'] = category.slug
+    query = filter_query(params)
+    url = f"{reverse('products:product_list_api')}?cursor={cursor}"
+    return f'{url}&{query}' if query else url
 
+def _category_or_404(slug):
+    # Served from the in-process category registry instead of a query per request
+    category = get_category(slug=slug)
+    if category is None:
+        raise Http404("No category matches the given query.")
+    return category
 
-    # Example of caching product list
-    # cached_products = cache.get('all_products_list')
-    # if cached_products:
-    #     products = cached_products
-    # else:
-    #     products = Product.objects.filter(available=True)
-    #     cache.set('all_products_list', products, 60*15) # Cache for 15 minutes
+@login_required # Protect this view
+def product_list(request, category_slug=None):
+    category = None
+    # Categories and the first page of each landing slider come from the versioned
+    # catalog cache (products/catalog.py), which is invalidated on Product/Category saves.
+    snapshot = get_landing_snapshot()
+    # Bestsellers are ranked from the sales rollup (newest products until there
+    # are sales) and cached separately
+    products, next_cursor = get_bestsellers(), None
 
-    if category_slug:
-        category = get_object_or_404(Category, slug=category_slug)
-        products = products.filter(category=category)
+    # Facet filters (?price=&stock=&availability=&category=); a category in the
+    # path wins over one in the query string
+    filters = parse_filters(request.GET, category_slug)
+    if 'category' in filters:
+        category = _category_or_404(filters['category'])
+    cursor = request.GET.get('cursor')
+    if filters or cursor:
+        try:
+            products, next_cursor = product_page(category, cursor, filters=filters)
+        except InvalidCursor:
+            return HttpResponseBadRequest("Invalid cursor.")
 
     return render(request, 'products/product_list.html', {
         'category': category,
-        'categories': categories,
+        'categories': get_categories(),
         'products': products, # This will be used for Bestsellers
-        'daily_essentials_products': daily_essentials_products,
-        'fresh_produce_products': fresh_produce_products,
+        'next_cursor': next_cursor,
+        'products_next_url': _next_page_url(next_cursor, filters=filters),
+        'filters': filters,
+        'filter_query': filter_query(filters),
+        'facets': build_facets(filters), # Counts come from the cached rollup, not per-facet queries
+        'daily_essentials_products': snapshot['daily_essentials'],
+        'daily_essentials_next_url': _next_page_url(snapshot['daily_essentials_cursor'], snapshot['daily_essentials_category']),
+        'fresh_produce_products': snapshot['fresh_produce'],
+        'fresh_produce_next_url': _next_page_url(snapshot['fresh_produce_cursor'], snapshot['fresh_produce_category']),
     })
 
+@login_required
+def product_list_api(request):
+    # Infinite-scroll endpoint for the listing sliders: ?cursor=...&category=<slug>
+    # plus any facet filters
+    category = None
+    filters = parse_filters(request.GET)
+    if 'category' in filters:
+        category = _category_or_404(filters['category'])
+    try:
+        products, next_cursor = product_page(category, request.GET.get('cursor'), filters=filters)
+    except InvalidCursor as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse({
+        'results': [_product_json(product) for product in products],
+        'html': render_to_string('products/includes/product_cards.html', {'products': products}, request=request),
+        'next_cursor': next_cursor,
+        'next_url': _next_page_url(next_cursor, filters=filters),
+    })
+
+def _product_detail_etag(request, id, slug):
+    # The page also shows related products, the user's navbar and cart badge and
+    # a CSRF token, so the tag covers the catalog version, the user, the cart
+    # summary and the CSRF secret too. A page with flash messages is never
+    # answered with a 304, or the messages would not be shown.
+    if get_messages(request):
+        return None
+    updated_at = Product.objects.filter(pk=id, slug=slug, available=True).values_list('updated_at', flat=True).first()
+    if updated_at is None:
+        return None # Let the view 404
+    get_token(request) # Makes sure the CSRF secret exists before it is hashed
+    cart = cart_summary(request)['cart_summary']
+    viewer = f"{request.user.pk}:{request.META['CSRF_COOKIE']}:{cart.item_count}:{cart.subtotal}"
+    digest = hashlib.md5(viewer.encode()).hexdigest()[:12]
+    return f'product-{id}-{updated_at.timestamp()}-{get_catalog_version()}-{digest}'
+
 @login_required # Protect this view
+@cache_control(private=True, no_cache=True) # Browser-only, and always revalidated
+@condition(etag_func=_product_detail_etag) # No Last-Modified: the product's timestamp doesn't cover the rest of the page
 def product_detail(request, id, slug):
     product = get_object_or_404(Product, id=id, slug=slug, available=True)
-    return render(request, 'products/product_detail.html', {'product': product})
+    related_products = Product.objects.filter(
+        category_id=product.category_id, available=True
+    ).exclude(id=product.id)[:4] # Show products from the same category
+    return render(request, 'products/product_detail.html', {
+        'product': product,
+        'related_products': related_products,
+    })
 
+@login_required # Protect this view
+def product_search(request):
+    query = request.GET.get('q', '').strip()
+    products, next_cursor, fuzzy = [], None, False
+    if query:
+        try:
+            products, next_cursor, fuzzy = search_products(query, request.GET.get('cursor'))
+        except InvalidCursor:
+            return HttpResponseBadRequest("Invalid cursor.")
+    return render(request, 'products/search_results.html', {
+        'query': query,
+        'products': products,
+        'next_cursor': next_cursor,
+        'fuzzy': fuzzy, # True when showing typo-tolerant matches instead of exact ones
+    })
 
+@login_required
+def product_search_api(request):
+    query = request.GET.get('q', '').strip()
+    if not query:
+        return JsonResponse({'error': "Missing search query 'q'."}, status=400)
+    try:
+        products, next_cursor, fuzzy = search_products(query, request.GET.get('cursor'))
+    except InvalidCursor as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse({
+        'query': query,
+        'fuzzy': fuzzy,
+        'next_cursor': next_cursor,
+        'results': [_product_json(product) for product in products],
+    })
\ No newline at end of file